@@ -9,11 +9,12 @@ except ImportError:
     warnings.warn("Importing 'grader_labextension' outside a proper installation.")
     __version__ = "dev"
 
-import asyncio
-
 from grader_labextension.handlers.base_handler import HandlerConfig
 from grader_labextension.registry import HandlerPathRegistry
-from grader_labextension.services.request import RequestService, RequestServiceError
+from grader_labextension.services.convert import ConvertService
+from grader_labextension.services.grader_config import GraderConfigLoader
+from grader_labextension.services.loop_monitor import LoopLagMonitor
+from grader_labextension.services.request import RequestService
 
 
 def _jupyter_labextension_paths():
@@ -48,29 +49,34 @@ def setup_handlers(server_app):
         settings["page_config_data"] = {}
 
     request_service = RequestService.instance(config=config)
+    # the instance is already created when the handlers are imported
+    request_service.update_config(config)
     handler_config = HandlerConfig.instance(config=config)
+    ConvertService.instance(config=config)
+    loop_monitor = LoopLagMonitor.instance(config=config)
+    if loop_monitor.enabled:
+        server_app.io_loop.add_callback(loop_monitor.start)
 
     # add lecture_base_path
     settings["page_config_data"]["lectures_base_path"] = handler_config.lectures_base_path
 
-    async def get_grader_config():
+    async def fetch_grader_config() -> dict:
         log.info("Loading config from grader service...")
-        try:
-            response: dict = await request_service.request(
-                "GET",
-                f"{handler_config.service_base_url}api/config",
-                header=dict(Authorization="Token " + HandlerConfig.instance().grader_api_token),
-            )
-        except RequestServiceError as e:
-            log.error("Error: could not get grader config")
-            log.error(e)
-            response = dict()
-        for key, value in response.items():
-            web_app.settings["page_config_data"][key] = value
-
-    # add grader config
-    asyncio.run(get_grader_config())
-    log.info(f"Grader page_config_data: {web_app.settings['page_config_data']}")
+        return await request_service.request(
+            "GET",
+            f"{handler_config.service_base_url}api/config",
+            header=dict(Authorization="Token " + HandlerConfig.instance().grader_api_token),
+        )
+
+    def update_page_config(values: dict):
+        settings["page_config_data"].update(values)
+        log.info(f"Grader page_config_data: {settings['page_config_data']}")
+
+    # add grader config, the last known config is used until it is loaded in the background
+    config_loader = GraderConfigLoader.instance(config=config)
+    config_loader.add_listener(update_page_config)
+    config_loader.load_cache()
+    server_app.io_loop.add_callback(config_loader.start, fetch_grader_config)
 
     base_url = settings["base_url"]
     log.info(f'{web_app.settings["server_root_dir"]=}')
@@ -10,6 +10,7 @@ from grader_labextension.handlers import (
     config,
     grading,
     lectures,
+    metrics,
     permission,
     submissions,
     version_control,
@@ -20,6 +21,7 @@ __all__ = [
     "grading",
     "config",
     "lectures",
+    "metrics",
     "submissions",
     "permission",
     "version_control",
@@ -139,18 +139,12 @@ class AssignmentObjectHandler(ExtensionBaseHandler):
         query_params = RequestService.get_query_string(
             {"recalc-scores": self.get_argument("recalc-scores", None)}
         )
-        try:
-            response = await self.request_service.request(
-                method="PUT",
-                endpoint=f"{self.service_base_url}api/lectures/{lecture_id}/assignments/"
-                f"{assignment_id}{query_params}",
-                body=data,
-                header=self.grader_authentication_header,
-            )
-        except RequestServiceError as e:
-            self.log.error(e)
-            raise HTTPError(e.code, reason=e.message)
-        self.write(json.dumps(response))
+        await self.proxy_request(
+            "PUT",
+            f"{self.service_base_url}api/lectures/{lecture_id}/assignments/"
+            f"{assignment_id}{query_params}",
+            body=data,
+        )
 
     @authenticated
     async def get(self, lecture_id: int, assignment_id: int):
@@ -227,15 +221,8 @@ class AssignmentPropertiesHandler(ExtensionBaseHandler):
         :type assignment_id: int
         """
 
-        try:
-            response = await self.request_service.request(
-                method="GET",
-                endpoint=f"{self.service_base_url}api/lectures/{lecture_id}/assignments/"
-                f"{assignment_id}/properties",
-                header=self.grader_authentication_header,
-                response_callback=self.set_service_headers,
-            )
-        except RequestServiceError as e:
-            self.log.error(e)
-            raise HTTPError(e.code, reason=e.message)
-        self.write(response)
+        await self.proxy_request(
+            "GET",
+            f"{self.service_base_url}api/lectures/{lecture_id}/assignments/"
+            f"{assignment_id}/properties",
+        )
@@ -3,16 +3,20 @@
 #
 # This source code is licensed under the BSD-style license found in the
 # LICENSE file in the root directory of this source tree.
+import asyncio
 import functools
 import os
-from typing import Awaitable, Optional
+from typing import Any, Awaitable, NamedTuple, Optional, Set, Union
 
 from grader_service.handlers.base_handler import GraderErrorMixin
 from jupyter_server.base.handlers import APIHandler
-from tornado.httpclient import HTTPError, HTTPResponse
+from tornado.httpclient import HTTPResponse
+from tornado.web import HTTPError
 from traitlets.config.configurable import SingletonConfigurable
 from traitlets.traitlets import Unicode
 
+from grader_labextension.registry import HandlerPathRegistry
+from grader_labextension.services import metrics, timing
 from grader_labextension.services.request import RequestService, RequestServiceError
 
 
@@ -55,6 +59,14 @@ class HandlerConfig(SingletonConfigurable):
     ).tag(config=True)
 
 
+class HandlerContext(NamedTuple):
+    """The grader service resources a request refers to."""
+
+    lecture: dict
+    assignment: Optional[dict] = None
+    submission: Optional[dict] = None
+
+
 class ExtensionBaseHandler(GraderErrorMixin, APIHandler):
     """
     BaseHandler for all server-extension handler
@@ -76,6 +88,48 @@ class ExtensionBaseHandler(GraderErrorMixin, APIHandler):
                 self.settings["server_root_dir"], HandlerConfig.instance().lectures_base_path
             )
         ).rstrip("/")
+        self._disconnect_tasks: Set[asyncio.Future] = set()
+        self._timings: Optional[timing.RequestTimings] = None
+
+    async def prepare(self):
+        self._timings = timing.start_request()
+        await super().prepare()
+
+    def finish(self, *args, **kwargs):
+        if self._timings is not None and self._timings.spans:
+            self.set_header("Server-Timing", self._timings.header())
+        return super().finish(*args, **kwargs)
+
+    def on_finish(self):
+        super().on_finish()
+        handler_class = type(self)
+        if HandlerPathRegistry.has_path(handler_class):
+            route = metrics.route_template(HandlerPathRegistry.get_path(handler_class))
+            metrics.HANDLER_DURATION.labels(route, self.request.method).observe(
+                self.request.request_time()
+            )
+            metrics.HANDLER_REQUESTS.labels(
+                route, self.request.method, str(self.get_status())
+            ).inc()
+
+    def on_connection_close(self):
+        super().on_connection_close()
+        for task in self._disconnect_tasks:
+            task.cancel()
+
+    async def run_until_disconnect(self, awaitable: Awaitable) -> Any:
+        """Await a long running operation and cancel it if the client closes the connection
+        before it is done.
+
+        :param awaitable: the operation to run
+        :return: the result of the operation
+        """
+        task = asyncio.ensure_future(awaitable)
+        self._disconnect_tasks.add(task)
+        try:
+            return await task
+        finally:
+            self._disconnect_tasks.discard(task)
 
     @property
     def service_base_url(self):
@@ -118,3 +172,76 @@ class ExtensionBaseHandler(GraderErrorMixin, APIHandler):
         except RequestServiceError as e:
             self.log.error(e)
             raise HTTPError(e.code, reason=e.message)
+
+    async def get_submission(self, lecture_id: int, assignment_id: int, submission_id: int) -> dict:
+        try:
+            submission = await self.request_service.request(
+                "GET",
+                f"{self.service_base_url}api/lectures/{lecture_id}/assignments/{assignment_id}"
+                f"/submissions/{submission_id}",
+                header=self.grader_authentication_header,
+            )
+            return submission
+        except RequestServiceError as e:
+            self.log.error(e)
+            raise HTTPError(e.code, reason=e.message)
+
+    async def get_context(
+        self,
+        lecture_id: int,
+        assignment_id: Optional[int] = None,
+        submission_id: Optional[int] = None,
+    ) -> HandlerContext:
+        """Fetches the lecture and, if their ids are given, the assignment and the submission
+        of a request concurrently. The requests go through the response cache of the
+        request service, so resources fetched shortly before are not requested again.
+
+        :param lecture_id: id of the lecture
+        :param assignment_id: id of the assignment
+        :param submission_id: id of the submission, requires `assignment_id`
+        :return: the fetched lecture, assignment and submission
+        """
+        fetches = [self.get_lecture(lecture_id)]
+        if assignment_id is not None:
+            fetches.append(self.get_assignment(lecture_id, assignment_id))
+            if submission_id is not None:
+                fetches.append(self.get_submission(lecture_id, assignment_id, submission_id))
+        return HandlerContext(*await asyncio.gather(*fetches))
+
+    async def proxy_request(
+        self, method: str, endpoint: str, body: Union[dict, str] = None, **kwargs
+    ) -> HTTPResponse:
+        """Forwards a request to the grader service and writes the upstream response body to
+        the client as is, without decoding and re-encoding it. Use it whenever the handler
+        does not need to inspect the payload. The caching headers of the upstream response
+        are only forwarded for GET requests.
+
+        :param method: HTTP method of the request
+        :param endpoint: endpoint of the grader service
+        :param body: request body
+        :param kwargs: further arguments of `RequestService.request`
+        :return: the upstream response
+        """
+        try:
+            response: HTTPResponse = await self.request_service.request(
+                method,
+                endpoint,
+                body=body,
+                header=self.grader_authentication_header,
+                decode_response=False,
+                response_callback=self.set_service_headers if method.upper() == "GET" else None,
+                **kwargs,
+            )
+        except RequestServiceError as e:
+            self.log.error(e)
+            raise HTTPError(e.code, reason=e.message)
+        self.write_upstream_response(response)
+        return response
+
+    def write_upstream_response(self, response: HTTPResponse):
+        """Writes the body of an upstream response together with its content type."""
+        content_type = response.headers.get("Content-Type")
+        if content_type:
+            self.set_header("Content-Type", content_type)
+        if response.body:
+            self.write(response.body)
@@ -3,19 +3,21 @@
 #
 # This source code is licensed under the BSD-style license found in the
 # LICENSE file in the root directory of this source tree.
+import asyncio
+import functools
+import json
 import os
-import shutil
-import urllib.parse
 
 from grader_service.errors import APIError
 from grader_service.handlers import GitRepoType
-from tornado.httpclient import HTTPResponse
+from tornado.iostream import StreamClosedError
 from tornado.web import HTTPError, authenticated
 
 from grader_labextension.handlers.base_handler import ExtensionBaseHandler
 from grader_labextension.registry import register_handler
 from grader_labextension.services.git import GitError, GitService
 from grader_labextension.services.request import RequestService, RequestServiceError
+from grader_labextension.services.workspaces import ManualGradingWorkspaces
 
 
 @register_handler(
@@ -32,40 +34,28 @@ class ExportGradesHandler(ExtensionBaseHandler):
 
         :param lecture_id: id of the lecture
         :param assignment_id: id of the assignment
-        :return: the csv content
+        :return: the number of bytes written to the csv file
         """
+        filter_value = self.get_argument("filter", "none")
         query_params = RequestService.get_query_string(
-            {
-                "instructor-version": "true",
-                "filter": self.get_argument("filter", "none"),
-                "format": "csv",
-            }
+            {"instructor-version": "true", "filter": filter_value, "format": "csv"}
         )
+        lecture, assignment, _ = await self.get_context(lecture_id, assignment_id)
+        dir_path = os.path.join(
+            self.root_dir, lecture["code"], "assignments", str(assignment["id"])
+        )
+        file_path = os.path.join(dir_path, f"{assignment['name']}_{filter_value}_submissions.csv")
         try:
-            response: HTTPResponse = await self.request_service.request(
-                method="GET",
-                endpoint=f"{self.service_base_url}api/lectures/{lecture_id}/assignments/{assignment_id}/submissions{query_params}",
+            bytes_written = await self.request_service.download(
+                f"{self.service_base_url}api/lectures/{lecture_id}/assignments/{assignment_id}/submissions{query_params}",
+                file_path,
                 header=self.grader_authentication_header,
-                decode_response=False,
             )
         except RequestServiceError as e:
             self.log.error(e)
             raise HTTPError(e.code, reason=e.message)
 
-        lecture = await self.get_lecture(lecture_id)
-        assignment = await self.get_assignment(lecture_id, assignment_id)
-        dir_path = os.path.join(
-            self.root_dir, lecture["code"], "assignments", str(assignment["id"])
-        )
-        os.makedirs(dir_path, exist_ok=True)
-        csv_content = response.body.decode("utf-8")
-        parsed_query_params = urllib.parse.parse_qs(query_params.lstrip("?"))
-        filter_value = parsed_query_params.get("filter", ["none"])[0]
-        file_path = os.path.join(dir_path, f"{assignment['name']}_{filter_value}_submissions.csv")
-        with open(file_path, "w") as f:
-            f.write(csv_content)
-
-        self.write({"status": "OK"})
+        self.write({"status": "OK", "bytes_written": bytes_written})
 
 
 @register_handler(
@@ -88,62 +78,36 @@ class GradingAutoHandler(ExtensionBaseHandler):
         :param sub_id: id of the submission
         :type sub_id: int
         """
-        try:
-            response = await self.request_service.request(
-                method="GET",
-                endpoint=f"{self.service_base_url}api/lectures/{lecture_id}/assignments/{assignment_id}/grading/{sub_id}/auto",
-                header=self.grader_authentication_header,
-            )
-        except RequestServiceError as e:
-            self.log.error(e)
-            raise HTTPError(e.code, reason=e.message)
-        self.write(response)
+        await self.proxy_request(
+            "GET",
+            f"{self.service_base_url}api/lectures/{lecture_id}/assignments/{assignment_id}/grading/{sub_id}/auto",
+        )
+        # grading changes the submission, which the grader service exposes as a GET action
+        self.request_service.invalidate_cache(
+            "PUT",
+            f"{self.service_base_url}api/lectures/{lecture_id}/assignments/{assignment_id}/submissions/{sub_id}",
+        )
 
 
-@register_handler(
-    path=r"api\/lectures\/(?P<lecture_id>\d*)\/assignments\/(?P<assignment_id>\d*)\/grading\/(?P<sub_id>\d*)\/manual\/?"
-)
-class GradingManualHandler(ExtensionBaseHandler):
+class ManualGradingWorkspaceHandler(ExtensionBaseHandler):
     """
-    Tornado Handler class for http requests to
-    /lectures/{lecture_id}/assignments/{assignment_id}/submissions/{submission_id}/manual.
+    Base class of the handlers preparing the manual grading workspaces of submissions.
     """
 
-    @authenticated
-    async def get(self, lecture_id: int, assignment_id: int, sub_id: int):
-        """Generates a local git repository and pulls autograded or original files of a submission in the user directory
-
-        :param lecture_id: id of the lecture
-        :type lecture_id: int
-        :param assignment_id: id of the assignment
-        :type assignment_id: int
-        :param sub_id: id of the submission
-        :type sub_id: int
+    async def prepare_workspace(
+        self, lecture: dict, assignment: dict, submission: dict, keep_existing: bool = False
+    ) -> str:
+        """Brings the manual grading workspace of a submission to the autograded or original
+        files of the submission. An existing workspace is reset in place and the files are
+        only fetched if they are missing.
+
+        :param lecture: the lecture of the submission
+        :param assignment: the assignment of the submission
+        :param submission: the submission
+        :param keep_existing: leave a workspace that has already been checked out unchanged
+        :return: "pulled", "reused" or, if it was kept, "existing"
+        :raises GitError: if the files of the submission could not be checked out
         """
-        query_params = RequestService.get_query_string({"lecture_id": lecture_id})
-        try:
-            lecture = await self.request_service.request(
-                "GET",
-                f"{self.service_base_url}api/lectures/{lecture_id}",
-                header=self.grader_authentication_header,
-            )
-
-            assignment = await self.request_service.request(
-                "GET",
-                f"{self.service_base_url}api/lectures/{lecture_id}/assignments/{assignment_id}",
-                header=self.grader_authentication_header,
-            )
-
-            submission = await self.request_service.request(
-                "GET",
-                f"{self.service_base_url}api/lectures/{lecture_id}/assignments/{assignment_id}/submissions/{sub_id}",
-                header=self.grader_authentication_header,
-            )
-
-        except RequestServiceError as e:
-            self.log.error(e)
-            raise HTTPError(e.code, reason=e.message)
-
         repo_type = None
         submission_user = None
         # only pull from user repo if the submission hasn't been autograded (happens when autograde_type is unassisted)
@@ -154,6 +118,7 @@ class GradingManualHandler(ExtensionBaseHandler):
         ):
             repo_type = GitRepoType.USER
             # retrieve user whose repo we want to pull from
+            query_params = RequestService.get_query_string({"lecture_id": lecture["id"]})
             submission_user = await self.request_service.request(
                 "GET",
                 f"{self.service_base_url}api/users/{submission['user_id']}{query_params}",
@@ -169,37 +134,147 @@ class GradingManualHandler(ExtensionBaseHandler):
             repo_type=repo_type,
             config=self.config,
         )
-        git_service.path = os.path.join(
+        workspaces = ManualGradingWorkspaces.instance()
+        git_service.path = workspaces.workspace_path(
             git_service.git_root_dir,
             git_service.lecture_code,
-            "manualgrade",
-            str(git_service.assignment_id),
-            str(sub_id),
+            git_service.assignment_id,
+            submission["id"],
         )
         self.log.info(f"Path: {git_service.path}")
-        if os.path.exists(git_service.path):
-            shutil.rmtree(git_service.path, ignore_errors=True)
-
         os.makedirs(git_service.path, exist_ok=True)
+        if not git_service.is_git():
+            await git_service.init()
+        elif keep_existing and await git_service.head_commit() is not None:
+            # the workspace may contain changes of the grader
+            await self._release_workspace(workspaces, git_service)
+            return "existing"
+
+        # an existing workspace is reset in place and only fetched if the commit is missing
+        if repo_type == GitRepoType.AUTOGRADE:
+            await git_service.set_remote(
+                GitRepoType.AUTOGRADE, additional_path=str(submission["id"])
+            )
+            fetched = await git_service.sync_workspace(
+                GitRepoType.AUTOGRADE, branch=f"submission_{submission['commit_hash']}"
+            )
+        else:
+            await git_service.set_remote(GitRepoType.USER, additional_path=submission_user["name"])
+            fetched = await git_service.sync_workspace(
+                GitRepoType.USER, commit_hash=submission["commit_hash"]
+            )
+        self.log.info(
+            f"{'Pulled' if fetched else 'Reused'} {repo_type} repo for submission {submission['id']}"
+        )
+        await self._release_workspace(workspaces, git_service)
+        return "pulled" if fetched else "reused"
+
+    async def _release_workspace(
+        self, workspaces: ManualGradingWorkspaces, git_service: GitService
+    ):
+        """Marks the workspace of `git_service` as used and releases the shared objects of the
+        workspaces deleted to stay within the disk budget."""
+        for evicted in await workspaces.release(self.root_dir, git_service.path):
+            await git_service.unshare_objects(evicted)
+
+
+@register_handler(
+    path=r"api\/lectures\/(?P<lecture_id>\d*)\/assignments\/(?P<assignment_id>\d*)\/grading\/(?P<sub_id>\d*)\/manual\/?"
+)
+class GradingManualHandler(ManualGradingWorkspaceHandler):
+    """
+    Tornado Handler class for http requests to
+    /lectures/{lecture_id}/assignments/{assignment_id}/submissions/{submission_id}/manual.
+    """
+
+    @authenticated
+    async def get(self, lecture_id: int, assignment_id: int, sub_id: int):
+        """Generates a local git repository and pulls autograded or original files of a submission in the user directory
+
+        :param lecture_id: id of the lecture
+        :type lecture_id: int
+        :param assignment_id: id of the assignment
+        :type assignment_id: int
+        :param sub_id: id of the submission
+        :type sub_id: int
+        """
+        lecture, assignment, submission = await self.get_context(lecture_id, assignment_id, sub_id)
         try:
-            if not git_service.is_git():
-                git_service.init()
-            if repo_type == GitRepoType.AUTOGRADE:
-                git_service.set_remote(GitRepoType.AUTOGRADE, additional_path=str(sub_id))
-                git_service.pull(
-                    GitRepoType.AUTOGRADE, branch=f"submission_{submission['commit_hash']}"
-                )
-                self.log.info(f"Pulled AUTOGRADE repo for submission {submission['id']}")
-            elif repo_type == GitRepoType.USER:
-                git_service.set_remote(GitRepoType.USER, additional_path=submission_user["name"])
-                git_service.pull(GitRepoType.USER)
-                git_service.go_to_commit(submission["commit_hash"])
-                self.log.info(f"Pulled USER repo for submission {submission['id']}")
+            await self.prepare_workspace(lecture, assignment, submission)
         except GitError as e:
             self.log.error(f"Git error: {e.error}")
             raise APIError(502, reason="git process failed", message=e.error)
 
 
+@register_handler(
+    path=r"api\/lectures\/(?P<lecture_id>\d*)\/assignments\/(?P<assignment_id>\d*)\/grading\/prefetch\/?"
+)
+class GradingPrefetchHandler(ManualGradingWorkspaceHandler):
+    """
+    Tornado Handler class for http requests to
+    /lectures/{lecture_id}/assignments/{assignment_id}/grading/prefetch.
+    """
+
+    @authenticated
+    async def post(self, lecture_id: int, assignment_id: int):
+        """Prepares the manual grading workspaces of several submissions in the background,
+        so they are already on disk when the submissions are opened. Workspaces that have
+        already been checked out are left unchanged.
+
+        The request body is a JSON object with the list of submission ids to prefetch, e.g.
+        `{"submission_ids": [1, 2, 3]}`. The response streams one JSON object per line for
+        every finished workspace with its submission id, its status ("pulled", "reused",
+        "existing" or "failed"), the error of a failed workspace and the progress. The
+        workspaces are still prepared if the client closes the connection.
+
+        :param lecture_id: id of the lecture
+        :type lecture_id: int
+        :param assignment_id: id of the assignment
+        :type assignment_id: int
+        """
+        try:
+            body = json.loads(self.request.body)
+            sub_ids = list(dict.fromkeys(int(sub_id) for sub_id in body["submission_ids"]))
+        except (ValueError, TypeError, KeyError):
+            raise HTTPError(400, reason="Expected a JSON object with a list of submission_ids")
+
+        lecture, assignment, _ = await self.get_context(lecture_id, assignment_id)
+        workspaces = ManualGradingWorkspaces.instance()
+        tasks = [
+            workspaces.prefetch(
+                workspaces.workspace_path(self.root_dir, lecture["code"], assignment["id"], sub_id),
+                functools.partial(self._prefetch, lecture, assignment, sub_id),
+            )
+            for sub_id in sub_ids
+        ]
+
+        self.set_header("Content-Type", "application/x-ndjson")
+        for completed, task in enumerate(asyncio.as_completed(tasks), start=1):
+            progress = dict(await task, completed=completed, total=len(tasks))
+            self.write(json.dumps(progress) + "\n")
+            try:
+                await self.flush()
+            except StreamClosedError:
+                # the prefetches continue in the background
+                return
+
+    async def _prefetch(self, lecture: dict, assignment: dict, sub_id: int) -> dict:
+        try:
+            submission = await self.get_submission(lecture["id"], assignment["id"], sub_id)
+            status = await self.prepare_workspace(
+                lecture, assignment, submission, keep_existing=True
+            )
+            return {"submission_id": sub_id, "status": status}
+        except GitError as e:
+            error = e.error
+        except RequestServiceError as e:
+            error = e.message
+        except HTTPError as e:
+            error = e.reason
+        self.log.warning(f"Could not prefetch submission {sub_id}: {error}")
+        return {"submission_id": sub_id, "status": "failed", "error": error}
+
+
 @register_handler(
     path=r"api\/lectures\/(?P<lecture_id>\d*)\/assignments\/(?P<assignment_id>\d*)\/grading\/(?P<sub_id>\d*)\/feedback\/?"
 )
@@ -221,16 +296,15 @@ class GenerateFeedbackHandler(ExtensionBaseHandler):
         :type sub_id: int
         """
 
-        try:
-            response = await self.request_service.request(
-                method="GET",
-                endpoint=f"{self.service_base_url}api/lectures/{lecture_id}/assignments/{assignment_id}/grading/{sub_id}/feedback",
-                header=self.grader_authentication_header,
-            )
-        except RequestServiceError as e:
-            self.log.error(e)
-            raise HTTPError(e.code, reason=e.message)
-        self.write(response)
+        await self.proxy_request(
+            "GET",
+            f"{self.service_base_url}api/lectures/{lecture_id}/assignments/{assignment_id}/grading/{sub_id}/feedback",
+        )
+        # generating feedback updates the feedback status of the submission
+        self.request_service.invalidate_cache(
+            "PUT",
+            f"{self.service_base_url}api/lectures/{lecture_id}/assignments/{assignment_id}/submissions/{sub_id}",
+        )
 
 
 @register_handler(
@@ -253,27 +327,7 @@ class PullFeedbackHandler(ExtensionBaseHandler):
         :param sub_id: id of the submission
         :type sub_id: int
         """
-        try:
-            lecture = await self.request_service.request(
-                "GET",
-                f"{self.service_base_url}api/lectures/{lecture_id}",
-                header=self.grader_authentication_header,
-            )
-
-            assignment = await self.request_service.request(
-                "GET",
-                f"{self.service_base_url}api/lectures/{lecture_id}/assignments/{assignment_id}",
-                header=self.grader_authentication_header,
-            )
-
-            submission = await self.request_service.request(
-                "GET",
-                f"{self.service_base_url}api/lectures/{lecture_id}/assignments/{assignment_id}/submissions/{sub_id}",
-                header=self.grader_authentication_header,
-            )
-        except RequestServiceError as e:
-            self.log.error(e)
-            raise HTTPError(e.code, reason=e.message)
+        lecture, assignment, submission = await self.get_context(lecture_id, assignment_id, sub_id)
 
         git_service = GitService(
             server_root_dir=self.root_dir,
@@ -294,9 +348,9 @@ class PullFeedbackHandler(ExtensionBaseHandler):
             os.makedirs(git_service.path, exist_ok=True)
 
         if not git_service.is_git():
-            git_service.init()
-        git_service.set_remote(GitRepoType.FEEDBACK, additional_path=str(sub_id))
-        git_service.pull(
+            await git_service.init()
+        await git_service.set_remote(GitRepoType.FEEDBACK, additional_path=str(sub_id))
+        await git_service.pull(
             GitRepoType.FEEDBACK, branch=f"feedback_{submission['commit_hash']}", force=True
         )
         self.write({"status": "Pulled Feedback"})
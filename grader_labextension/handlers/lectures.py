@@ -4,9 +4,12 @@
 # This source code is licensed under the BSD-style license found in the
 # LICENSE file in the root directory of this source tree.
 
+import asyncio
+import contextlib
+import csv
 import json
+import math
 import os
-import urllib.parse
 
 import tornado
 from tornado.web import HTTPError, authenticated
@@ -16,6 +19,37 @@ from grader_labextension.registry import register_handler
 from grader_labextension.services.request import RequestService, RequestServiceError
 
 
+def _csv_to_ndjson(csv_path: str, ndjson_path: str):
+    """Converts the csv grade export to one JSON object per line, reading and writing one row
+    at a time. Scores are written as numbers, other values (e.g. `-`) as strings."""
+    tmp_path = f"{ndjson_path}.part"
+    try:
+        with (
+            open(csv_path, newline="", encoding="utf-8") as src,
+            open(tmp_path, "w", encoding="utf-8") as dst,
+        ):
+            reader = csv.reader(src)
+            columns = next(reader, [])
+            for row in reader:
+                record = {}
+                for column, value in zip(columns, row):
+                    try:
+                        score = float(value)
+                        record[column] = score if math.isfinite(score) else value
+                    except ValueError:
+                        record[column] = value
+                # the first column holds the username, which is never a score
+                if columns and row:
+                    record[columns[0]] = row[0]
+                dst.write(json.dumps(record, ensure_ascii=False))
+                dst.write("\n")
+        os.replace(tmp_path, ndjson_path)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(tmp_path)
+        raise
+
+
 @register_handler(path=r"api\/lectures\/?")
 class LectureBaseHandler(ExtensionBaseHandler):
     """
@@ -31,33 +65,13 @@ class LectureBaseHandler(ExtensionBaseHandler):
                 "instructor": self.get_argument("instructor", None),
             }
         )
-        try:
-            response = await self.request_service.request(
-                "GET",
-                f"{self.service_base_url}api/lectures{query_params}",
-                header=self.grader_authentication_header,
-                response_callback=self.set_service_headers,
-            )
-        except RequestServiceError as e:
-            self.log.error(e)
-            raise HTTPError(e.code, reason=e.message)
-        self.write(json.dumps(response))
+        await self.proxy_request("GET", f"{self.service_base_url}api/lectures{query_params}")
 
     @authenticated
     async def post(self):
         """Sends a POST-request to the grader service to create a lecture"""
         data = tornado.escape.json_decode(self.request.body)
-        try:
-            response = await self.request_service.request(
-                "POST",
-                f"{self.service_base_url}api/lectures",
-                body=data,
-                header=self.grader_authentication_header,
-            )
-        except RequestServiceError as e:
-            self.log.error(e)
-            raise HTTPError(e.code, reason=e.message)
-        self.write(json.dumps(response))
+        await self.proxy_request("POST", f"{self.service_base_url}api/lectures", body=data)
 
 
 @register_handler(path=r"api\/lectures\/(?P<lecture_id>\d*)\/?")
@@ -75,17 +89,9 @@ class LectureObjectHandler(ExtensionBaseHandler):
         """
 
         data = tornado.escape.json_decode(self.request.body)
-        try:
-            response_data: dict = await self.request_service.request(
-                "PUT",
-                f"{self.service_base_url}api/lectures/{lecture_id}",
-                body=data,
-                header=self.grader_authentication_header,
-            )
-        except RequestServiceError as e:
-            self.log.error(e)
-            raise HTTPError(e.code, reason=e.message)
-        self.write(json.dumps(response_data))
+        await self.proxy_request(
+            "PUT", f"{self.service_base_url}api/lectures/{lecture_id}", body=data
+        )
 
     @authenticated
     async def get(self, lecture_id: int):
@@ -94,17 +100,7 @@ class LectureObjectHandler(ExtensionBaseHandler):
         :param lecture_id: id of the lecture
         :type lecture_id: int
         """
-        try:
-            response_data: dict = await self.request_service.request(
-                "GET",
-                f"{self.service_base_url}api/lectures/{lecture_id}",
-                header=self.grader_authentication_header,
-                response_callback=self.set_service_headers,
-            )
-        except RequestServiceError as e:
-            self.log.error(e)
-            raise HTTPError(e.code, reason=e.message)
-        self.write(json.dumps(response_data))
+        await self.proxy_request("GET", f"{self.service_base_url}api/lectures/{lecture_id}")
 
     @authenticated
     async def delete(self, lecture_id: int):
@@ -139,18 +135,7 @@ class LectureStudentsHandler(ExtensionBaseHandler):
         :param lecture_id: id of the lecture
         :return: attendants of lecture
         """
-        try:
-            response = await self.request_service.request(
-                method="GET",
-                endpoint=f"{self.service_base_url}api/lectures/{lecture_id}/users",
-                header=self.grader_authentication_header,
-                response_callback=self.set_service_headers,
-            )
-        except RequestServiceError as e:
-            self.log.error(e)
-            raise HTTPError(e.code, reason=e.message)
-
-        self.write(json.dumps(response))
+        await self.proxy_request("GET", f"{self.service_base_url}api/lectures/{lecture_id}/users")
 
 
 def get_content_type_from_response(response):
@@ -183,52 +168,47 @@ class SubmissionLectureHandler(ExtensionBaseHandler):
         2 - format:
         csv: return list as comma separated values
         json: return list as JSON
+        ndjson: return one JSON object per student and line
+
+        The export is streamed to a file in the lecture directory.
 
         :param lecture_id: id of the lecture
         :type lecture_id: int
         :raises HTTPError: throws err if user is not authorized or
         the assignment was not found
         """
+        filter_value = self.get_argument("filter", "best")
+        format_value = self.get_argument("format", "json")
+        if format_value not in ("csv", "json", "ndjson"):
+            raise HTTPError(400, reason="Invalid format specified")
+
+        lecture = await self.get_lecture(lecture_id)
+        file_path = os.path.join(
+            self.root_dir,
+            lecture["code"],
+            f"{lecture['name']}_{filter_value}_submissions.{format_value}",
+        )
+        # the grader service has no ndjson format, its rows are converted from the csv export
         query_params = RequestService.get_query_string(
-            {
-                "filter": self.get_argument("filter", "best"),
-                "format": self.get_argument("format", "json"),
-            }
+            {"filter": filter_value, "format": "csv" if format_value == "ndjson" else format_value}
         )
+        endpoint = f"{self.service_base_url}api/lectures/{lecture_id}/submissions{query_params}"
+        download_path = f"{file_path}.csv.part" if format_value == "ndjson" else file_path
         try:
-            response = await self.request_service.request(
-                "GET",
-                f"{self.service_base_url}api/lectures/{lecture_id}/submissions{query_params}",
-                header=self.grader_authentication_header,
-                response_callback=self.set_service_headers,
+            await self.request_service.download(
+                endpoint, download_path, header=self.grader_authentication_header
             )
-
         except RequestServiceError as e:
             self.log.error(e)
             raise HTTPError(e.code, reason=e.message)
 
-        lecture = await self.get_lecture(lecture_id)
-        dir_path = os.path.join(self.root_dir, lecture["code"])
-        os.makedirs(dir_path, exist_ok=True)
-
-        parsed_query_params = urllib.parse.parse_qs(query_params.lstrip("?"))
-        filter_value = parsed_query_params.get("filter", ["none"])[0]
-        format_value = parsed_query_params.get("format", ["json"])[0]
-
-        file_path = os.path.join(
-            dir_path, f"{lecture['name']}_{filter_value}_submissions.{format_value}"
-        )
-        if format_value == "csv":
-            with open(file_path, "w", encoding="utf-8") as f:
-                f.write(response)
-        elif format_value == "json":
-            json_content = (
-                json.dumps(response, indent=2) if isinstance(response, dict) else response
-            )
-            with open(file_path, "w", encoding="utf-8") as f:
-                f.write(json_content)
-        else:
-            raise HTTPError(400, reason="Invalid format specified")
+        if format_value == "ndjson":
+            try:
+                await asyncio.get_running_loop().run_in_executor(
+                    None, _csv_to_ndjson, download_path, file_path
+                )
+            finally:
+                os.unlink(download_path)
         self.write(
             {
                 "status": "OK",
@@ -0,0 +1,46 @@
+# Copyright (c) 2022, TU Wien
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from tornado.web import HTTPError, authenticated
+
+from grader_labextension.handlers.base_handler import ExtensionBaseHandler
+from grader_labextension.registry import register_handler
+from grader_labextension.services.loop_monitor import LoopLagMonitor
+from grader_labextension.services.metrics import REGISTRY
+
+
+@register_handler(path=r"metrics\/?")
+class MetricsHandler(ExtensionBaseHandler):
+    """
+    Tornado Handler class for http requests to /metrics.
+    """
+
+    @authenticated
+    async def get(self):
+        """Returns the metrics of the extension in the Prometheus text format."""
+        self.set_header("Content-Type", CONTENT_TYPE_LATEST)
+        self.write(generate_latest(REGISTRY))
+
+
+@register_handler(path=r"metrics\/blocking\/?")
+class BlockingCallsHandler(ExtensionBaseHandler):
+    """
+    Tornado Handler class for http requests to /metrics/blocking.
+    """
+
+    @authenticated
+    async def get(self):
+        """Returns the calls that blocked the event loop the longest, with the handler and
+        stack they were made from. Requires LoopLagMonitor.enabled.
+
+        :raises HTTPError: throws err if the monitor is not enabled
+        """
+        monitor = LoopLagMonitor.instance()
+        if not monitor.enabled:
+            raise HTTPError(404, reason="The event loop monitor is not enabled")
+        limit = int(self.get_argument("limit", "10"))
+        self.write({"blocking_calls": monitor.worst_offenders(limit)})
@@ -37,17 +37,10 @@ class SubmissionHandler(ExtensionBaseHandler):
                 "filter": self.get_argument("filter", "none"),
             }
         )
-        try:
-            response = await self.request_service.request(
-                method="GET",
-                endpoint=f"{self.service_base_url}api/lectures/{lecture_id}/assignments/{assignment_id}/submissions{query_params}",
-                header=self.grader_authentication_header,
-                response_callback=self.set_service_headers,
-            )
-        except RequestServiceError as e:
-            self.log.error(e)
-            raise HTTPError(e.code, reason=e.message)
-        self.write(json.dumps(response))
+        await self.proxy_request(
+            "GET",
+            f"{self.service_base_url}api/lectures/{lecture_id}/assignments/{assignment_id}/submissions{query_params}",
+        )
 
 
 @register_handler(
@@ -67,19 +60,11 @@ class SubmissionLogsHandler(ExtensionBaseHandler):
         :type submission_id: int
         """
 
-        try:
-            response = await self.request_service.request(
-                method="GET",
-                endpoint=f"{self.service_base_url}api/lectures/{lecture_id}/assignments/"
-                f"{assignment_id}/submissions/{submission_id}/logs",
-                header=self.grader_authentication_header,
-                response_callback=self.set_service_headers,
-            )
-            self.log.info(response)
-        except RequestServiceError as e:
-            self.log.error(e)
-            raise HTTPError(e.code, reason=e.message)
-        self.write(response)
+        await self.proxy_request(
+            "GET",
+            f"{self.service_base_url}api/lectures/{lecture_id}/assignments/"
+            f"{assignment_id}/submissions/{submission_id}/logs",
+        )
 
 
 @register_handler(
@@ -104,18 +89,11 @@ class SubmissionPropertiesHandler(ExtensionBaseHandler):
         :type submission_id: int
         """
 
-        try:
-            response = await self.request_service.request(
-                method="GET",
-                endpoint=f"{self.service_base_url}api/lectures/{lecture_id}/assignments/"
-                f"{assignment_id}/submissions/{submission_id}/properties",
-                header=self.grader_authentication_header,
-                response_callback=self.set_service_headers,
-            )
-        except RequestServiceError as e:
-            self.log.error(e)
-            raise HTTPError(e.code, reason=e.message)
-        self.write(response)
+        await self.proxy_request(
+            "GET",
+            f"{self.service_base_url}api/lectures/{lecture_id}/assignments/"
+            f"{assignment_id}/submissions/{submission_id}/properties",
+        )
 
     async def put(self, lecture_id: int, assignment_id: int, submission_id: int):
         """Sends a PUT-request to the grader service to update the properties of a submission
@@ -158,20 +136,14 @@ class SubmissionEditHandler(ExtensionBaseHandler):
         :param submission_id: id of the submission
         :type submission_id: int
         """
-        try:
-            response = await self.request_service.request(
-                method="PUT",
-                endpoint=f"{self.service_base_url}api/lectures/{lecture_id}/assignments/"
-                f"{assignment_id}/submissions/{submission_id}/edit",
-                header=self.grader_authentication_header,
-                body=self.request.body.decode("utf-8"),
-                request_timeout=300.0,
-                connect_timeout=300.0,
-            )
-        except RequestServiceError as e:
-            self.log.error(e)
-            raise HTTPError(e.code, reason=e.message)
-        self.write(json.dumps(response))
+        await self.proxy_request(
+            "PUT",
+            f"{self.service_base_url}api/lectures/{lecture_id}/assignments/"
+            f"{assignment_id}/submissions/{submission_id}/edit",
+            body=self.request.body.decode("utf-8"),
+            request_timeout=300.0,
+            connect_timeout=300.0,
+        )
 
 
 @register_handler(
@@ -196,18 +168,11 @@ class SubmissionObjectHandler(ExtensionBaseHandler):
         :type submission_id: int
         """
 
-        try:
-            response = await self.request_service.request(
-                method="GET",
-                endpoint=f"{self.service_base_url}api/lectures/{lecture_id}/assignments/"
-                f"{assignment_id}/submissions/{submission_id}",
-                header=self.grader_authentication_header,
-                response_callback=self.set_service_headers,
-            )
-        except RequestServiceError as e:
-            self.log.error(e)
-            raise HTTPError(e.code, reason=e.message)
-        self.write(json.dumps(response))
+        await self.proxy_request(
+            "GET",
+            f"{self.service_base_url}api/lectures/{lecture_id}/assignments/"
+            f"{assignment_id}/submissions/{submission_id}",
+        )
 
     async def put(self, lecture_id: int, assignment_id: int, submission_id: int):
         """Sends a PUT-request to the grader service to update a submission
@@ -311,16 +276,8 @@ class SubmissionCountHandler(ExtensionBaseHandler):
         :type assignment_id: int
         """
 
-        try:
-            response = await self.request_service.request(
-                method="GET",
-                endpoint=f"{self.service_base_url}api/lectures/{lecture_id}/assignments/"
-                f"{assignment_id}/submissions/count",
-                header=self.grader_authentication_header,
-                response_callback=self.set_service_headers,
-            )
-            self.log.info(f"{response}")
-        except RequestServiceError as e:
-            self.log.error(e)
-            raise HTTPError(e.code, reason=e.message)
-        self.write(json.dumps(response))
+        await self.proxy_request(
+            "GET",
+            f"{self.service_base_url}api/lectures/{lecture_id}/assignments/"
+            f"{assignment_id}/submissions/count",
+        )
@@ -4,28 +4,49 @@
 # This source code is licensed under the BSD-style license found in the
 # LICENSE file in the root directory of this source tree.
 
+import asyncio
+import functools
 import json
 import os
 import shutil
+import tempfile
 from http import HTTPStatus
 from typing import List, Optional
 from urllib.parse import quote, unquote
 
 from grader_service.convert.converters.base import GraderConvertException
-from grader_service.convert.converters.generate_assignment import GenerateAssignment
 from grader_service.errors import APIError
 from grader_service.handlers import GitRepoType
 from tornado.web import HTTPError, authenticated
 
-from grader_labextension.api.models.assignment_settings import AssignmentSettings
 from grader_labextension.services.request import RequestServiceError
 
 from ..api.models.submission import Submission
 from ..registry import register_handler
+from ..services.convert import ConvertService, ConvertWorkerError
 from ..services.git import GitError, GitService
 from .base_handler import ExtensionBaseHandler
 
 
+def _last_fetched(git_service: GitService) -> Optional[str]:
+    """Returns the time the remotes of the repository were last fetched in ISO format."""
+    last_fetched = git_service.last_fetched()
+    return last_fetched.isoformat() if last_fetched is not None else None
+
+
+def _release_cache_dir(root_dir: str, lecture_code: str, assignment_id) -> str:
+    """Directory of the converted release notebooks reused by incremental generation."""
+    return os.path.join(root_dir, lecture_code, ".release_cache", str(assignment_id))
+
+
+def _release_staging_dir(root_dir: str, lecture_code: str, assignment_id) -> str:
+    """Creates a new directory the release files are generated in before they are copied into
+    the release repository, so the repository keeps its history and unchanged files."""
+    staging_root = os.path.join(root_dir, lecture_code, ".release_staging")
+    os.makedirs(staging_root, exist_ok=True)
+    return tempfile.mkdtemp(prefix=f"{assignment_id}-", dir=staging_root)
+
+
 @register_handler(
     path=r"api\/lectures\/(?P<lecture_id>\d*)\/assignments\/(?P<assignment_id>\d*)\/generate\/?"
 )
@@ -48,38 +69,46 @@ class GenerateHandler(ExtensionBaseHandler):
 
         output_dir = f"{self.root_dir}/{code}/release/{assignment_id}"
         os.makedirs(os.path.expanduser(output_dir), exist_ok=True)
-
-        generator = GenerateAssignment(
-            input_dir=f"{self.root_dir}/{code}/source/{assignment_id}",
-            output_dir=output_dir,
-            file_pattern="*.ipynb",
-            assignment_settings=AssignmentSettings(allowed_files=["*"]),
-        )
-        generator.force = True
-        generator.log = self.log
-
-        try:
-            # delete contents of output directory since we might have chosen to disallow files
-            self.log.info("Deleting files in release directory")
-            shutil.rmtree(output_dir)
-            os.mkdir(output_dir)
-        except Exception as e:
-            self.log.error(e)
-            raise APIError(HTTPStatus.INTERNAL_SERVER_ERROR, message=str(e))
+        staging_dir = _release_staging_dir(self.root_dir, code, assignment_id)
 
         self.log.info("Starting GenerateAssignment converter")
         try:
-            generator.start()
-        except Exception as e:
-            self.log.error(e)
-            raise APIError(HTTPStatus.CONFLICT, message=str(e))
+            try:
+                await self.run_until_disconnect(
+                    ConvertService.instance().generate_assignment(
+                        input_dir=f"{self.root_dir}/{code}/source/{assignment_id}",
+                        output_dir=staging_dir,
+                        cache_dir=_release_cache_dir(self.root_dir, code, assignment_id),
+                    )
+                )
+            except Exception as e:
+                self.log.error(e)
+                raise APIError(HTTPStatus.CONFLICT, message=str(e))
 
-        gradebook_path = os.path.join(generator._output_directory, "gradebook.json")
-        try:
-            os.remove(gradebook_path)
-            self.log.info(f"Successfully deleted {gradebook_path}")
-        except OSError as e:
-            self.log.error(f"Could not delete {gradebook_path}! Error: {e.strerror}")
+            gradebook_path = os.path.join(staging_dir, "gradebook.json")
+            try:
+                os.remove(gradebook_path)
+                self.log.info(f"Successfully deleted {gradebook_path}")
+            except OSError as e:
+                self.log.error(f"Could not delete {gradebook_path}! Error: {e.strerror}")
+
+            # files that are no longer generated are deleted, since we might have chosen to
+            # disallow them
+            git_service = GitService(
+                self.root_dir,
+                code,
+                assignment_id,
+                repo_type=GitRepoType.RELEASE,
+                config=self.config,
+            )
+            await asyncio.get_running_loop().run_in_executor(
+                None,
+                functools.partial(
+                    git_service.copy_repo_contents, staging_dir, delete=True, link=True
+                ),
+            )
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
         self.log.info("GenerateAssignment conversion done")
         self.write({"status": "OK"})
 
@@ -100,8 +129,7 @@ class GitRemoteFileStatusHandler(ExtensionBaseHandler):
             self.log.error(HTTPStatus.NOT_FOUND)
             raise HTTPError(HTTPStatus.NOT_FOUND, reason=f"Repository {repo} does not exist")
 
-        lecture = await self.get_lecture(lecture_id)
-        assignment = await self.get_assignment(lecture_id, assignment_id)
+        lecture, assignment, _ = await self.get_context(lecture_id, assignment_id)
         file_path = self.get_query_argument("file")
         git_service = GitService(
             server_root_dir=self.root_dir,
@@ -113,16 +141,71 @@ class GitRemoteFileStatusHandler(ExtensionBaseHandler):
         )
         try:
             if not git_service.is_git():
-                git_service.init()
-                git_service.set_author(author=self.user_name)
-            git_service.set_remote(f"grader_{repo}")
-            git_service.fetch_all()
-            status = git_service.check_remote_file_status(file_path)
+                await git_service.init()
+                await git_service.set_author(author=self.user_name)
+            await git_service.set_remote(f"grader_{repo}")
+            await git_service.fetch_all(force=self.get_argument("force", "false") == "true")
+            status = await git_service.check_remote_file_status(file_path)
             self.log.info(f"File {file_path} status: {status}")
         except GitError as e:
             self.log.error(e)
             raise APIError(502, message=e.error)
-        response = json.dumps({"status": status.name})
+        response = json.dumps({"status": status.name, "last_fetched": _last_fetched(git_service)})
+        self.write(response)
+
+
+@register_handler(
+    path=r"api\/lectures\/(?P<lecture_id>\d*)\/assignments\/(?P<assignment_id>\d*)\/"
+    r"remote-files-status\/(?P<repo>\w*)\/?"
+)
+class GitRemoteFilesStatusHandler(ExtensionBaseHandler):
+    """
+    Tornado Handler class for http requests to
+    /lectures/{lecture_id}/assignments/{assignment_id}/remote-files-status/{repo}.
+    """
+
+    @authenticated
+    async def get(self, lecture_id: int, assignment_id: int, repo: str):
+        """Returns the remote status of all files in a repository with a single fetch.
+
+        Only files that are not up to date are listed in the response.
+
+        :param lecture_id: id of the lecture
+        :type lecture_id: int
+        :param assignment_id: id of the assignment
+        :type assignment_id: int
+        :param repo: type of the repository
+        :type repo: str
+        """
+        if repo not in {GitRepoType.USER, GitRepoType.SOURCE, GitRepoType.RELEASE}:
+            self.log.error(HTTPStatus.NOT_FOUND)
+            raise HTTPError(HTTPStatus.NOT_FOUND, reason=f"Repository {repo} does not exist")
+
+        lecture, assignment, _ = await self.get_context(lecture_id, assignment_id)
+        git_service = GitService(
+            server_root_dir=self.root_dir,
+            lecture_code=lecture["code"],
+            assignment_id=assignment["id"],
+            repo_type=GitRepoType(repo),
+            config=self.config,
+            force_user_repo=repo == GitRepoType.RELEASE,
+        )
+        try:
+            if not git_service.is_git():
+                await git_service.init()
+                await git_service.set_author(author=self.user_name)
+            await git_service.set_remote(f"grader_{repo}")
+            await git_service.fetch_all(force=self.get_argument("force", "false") == "true")
+            statuses = await git_service.check_remote_files_status()
+        except GitError as e:
+            self.log.error(e)
+            raise APIError(502, message=e.error)
+        response = json.dumps(
+            {
+                "files": {path: status.name for path, status in statuses.items()},
+                "last_fetched": _last_fetched(git_service),
+            }
+        )
         self.write(response)
 
 
@@ -142,8 +225,7 @@ class GitRemoteStatusHandler(ExtensionBaseHandler):
             self.log.error(HTTPStatus.NOT_FOUND)
             raise HTTPError(HTTPStatus.NOT_FOUND, reason=f"Repository {repo} does not exist")
 
-        lecture = await self.get_lecture(lecture_id)
-        assignment = await self.get_assignment(lecture_id, assignment_id)
+        lecture, assignment, _ = await self.get_context(lecture_id, assignment_id)
 
         git_service = GitService(
             server_root_dir=self.root_dir,
@@ -155,15 +237,22 @@ class GitRemoteStatusHandler(ExtensionBaseHandler):
         )
         try:
             if not git_service.is_git():
-                git_service.init()
-                git_service.set_author(author=self.user_name)
-            git_service.set_remote(f"grader_{repo}")
-            git_service.fetch_all()
-            status = git_service.check_remote_status(f"grader_{repo}", "main")
+                await git_service.init()
+                await git_service.set_author(author=self.user_name)
+            await git_service.set_remote(f"grader_{repo}")
+            await git_service.fetch_all(force=self.get_argument("force", "false") == "true")
+            remote_status = await git_service.check_remote_status(f"grader_{repo}", "main")
         except GitError as e:
             self.log.error(e)
             raise APIError(502, reason="error fetching remote files", message=e.error)
-        response = json.dumps({"status": status.name})
+        response = json.dumps(
+            {
+                "status": remote_status.status.name,
+                "ahead": remote_status.ahead,
+                "behind": remote_status.behind,
+                "last_fetched": _last_fetched(git_service),
+            }
+        )
         self.write(response)
 
 
@@ -192,8 +281,7 @@ class GitLogHandler(ExtensionBaseHandler):
             raise HTTPError(HTTPStatus.NOT_FOUND, reason=f"Repository {repo} does not exist")
         n_history = int(self.get_argument("n", "10"))
 
-        lecture = await self.get_lecture(lecture_id)
-        assignment = await self.get_assignment(lecture_id, assignment_id)
+        lecture, assignment, _ = await self.get_context(lecture_id, assignment_id)
 
         git_service = GitService(
             server_root_dir=self.root_dir,
@@ -205,12 +293,12 @@ class GitLogHandler(ExtensionBaseHandler):
         )
         try:
             if not git_service.is_git():
-                git_service.init()
-                git_service.set_author(author=self.user_name)
-            git_service.set_remote(f"grader_{repo}")
-            git_service.fetch_all()
-            if git_service.local_branch_exists("main"):  # at least main should exist
-                logs = git_service.get_log(n_history)
+                await git_service.init()
+                await git_service.set_author(author=self.user_name)
+            await git_service.set_remote(f"grader_{repo}")
+            await git_service.fetch_all(force=self.get_argument("force", "false") == "true")
+            if await git_service.local_branch_exists("main"):  # at least main should exist
+                logs = await git_service.get_log(n_history)
             else:
                 logs = []
         except GitError as e:
@@ -254,8 +342,7 @@ class PullHandler(ExtensionBaseHandler):
         # Submission id needed for edit repository
         sub_id = self.get_argument("subid", None)
 
-        lecture = await self.get_lecture(lecture_id)
-        assignment = await self.get_assignment(lecture_id, assignment_id)
+        lecture, assignment, _ = await self.get_context(lecture_id, assignment_id)
 
         git_service = GitService(
             server_root_dir=self.root_dir,
@@ -269,12 +356,12 @@ class PullHandler(ExtensionBaseHandler):
         )
         try:
             if not git_service.is_git():
-                git_service.init()
-                git_service.set_author(author=self.user_name)
-            git_service.set_remote(
+                await git_service.init()
+                await git_service.set_author(author=self.user_name)
+            await git_service.set_remote(
                 f"grader_{repo}", additional_path=sub_id if sub_id is not None else ""
             )
-            git_service.pull(f"grader_{repo}", force=True)
+            await git_service.pull(f"grader_{repo}", force=True)
             self.write({"status": "OK"})
         except GitError as e:
             self.log.error("Git error:\n" + e.error)
@@ -320,8 +407,7 @@ class PushHandler(ExtensionBaseHandler):
             self._validate_commit_message(commit_message)
 
         # Fetch lecture and assignment data
-        lecture = await self.get_lecture(lecture_id)
-        assignment = await self.get_assignment(lecture_id, assignment_id)
+        lecture, assignment, _ = await self.get_context(lecture_id, assignment_id)
 
         if repo == GitRepoType.EDIT and sub_id is None:
             # Create a new submission for the student `username`
@@ -408,7 +494,6 @@ class PushHandler(ExtensionBaseHandler):
     async def _handle_release_repo(
         self, git_service, lecture, assignment, lecture_id, assignment_id, selected_files
     ):
-        git_service.delete_repo_contents(include_git=True)
         src_path = GitService(
             self.root_dir,
             lecture["code"],
@@ -420,50 +505,64 @@ class PushHandler(ExtensionBaseHandler):
         if selected_files:
             self.log.info(f"Selected files to push to release repo: {selected_files}")
 
-        git_service.copy_repo_contents(src=src_path, selected_files=selected_files)
+        # the release files are generated in a staging directory and only the changed files
+        # are copied into the repository, whose history is kept so the push is a small delta
+        staging_path = _release_staging_dir(self.root_dir, lecture["code"], assignment["id"])
+        try:
+            await self._generate_release_files(
+                src_path,
+                staging_path,
+                cache_dir=_release_cache_dir(self.root_dir, lecture["code"], assignment["id"]),
+            )
 
-        generator = self._initialize_generator(src_path, git_service.path)
-        await self._generate_release_files(generator, git_service.path)
+            gradebook_path = os.path.join(staging_path, "gradebook.json")
+            await self._update_assignment_properties(gradebook_path, lecture_id, assignment_id)
 
-        gradebook_path = os.path.join(git_service.path, "gradebook.json")
-        await self._update_assignment_properties(gradebook_path, lecture_id, assignment_id)
+            try:
+                os.remove(gradebook_path)
+                self.log.info(f"Successfully deleted {gradebook_path}")
+            except OSError as e:
+                self.log.error(
+                    f"Cannot delete {gradebook_path}! Error: {e.strerror}\nAborting push!"
+                )
+                raise HTTPError(
+                    HTTPStatus.CONFLICT,
+                    reason=f"Cannot delete {gradebook_path}! Error: {e.strerror}\nAborting push!",
+                )
 
-        try:
-            os.remove(gradebook_path)
-            self.log.info(f"Successfully deleted {gradebook_path}")
-        except OSError as e:
-            self.log.error(f"Cannot delete {gradebook_path}! Error: {e.strerror}\nAborting push!")
-            raise HTTPError(
-                HTTPStatus.CONFLICT,
-                reason=f"Cannot delete {gradebook_path}! Error: {e.strerror}\nAborting push!",
+            await asyncio.get_running_loop().run_in_executor(
+                None,
+                functools.partial(
+                    git_service.copy_repo_contents, staging_path, delete=True, link=True
+                ),
             )
+        finally:
+            shutil.rmtree(staging_path, ignore_errors=True)
 
-    def _initialize_generator(self, src_path, output_path):
-        generator = GenerateAssignment(
-            input_dir=src_path,
-            output_dir=output_path,
-            file_pattern="*.ipynb",
-            assignment_settings=AssignmentSettings(allowed_files=["*"]),
-        )
-        generator.force = True
-        generator.log = self.log
-        return generator
-
-    async def _generate_release_files(self, generator, output_path):
-        try:
-            shutil.rmtree(output_path)
-            os.mkdir(output_path)
-        except Exception as e:
-            self.log.error(e)
-            raise APIError(HTTPStatus.INTERNAL_SERVER_ERROR, message=str(e))
+        if selected_files and git_service.is_git():
+            # like in a new repository, the release only contains the selected files
+            try:
+                await git_service.reset_index()
+            except GitError as e:
+                self.log.error("Git error:\n" + e.error)
+                raise APIError(502, message=e.error)
 
+    async def _generate_release_files(self, src_path, output_path, cache_dir=None):
+        # output_path is a new, empty staging directory, see _release_staging_dir
         self.log.info("Starting GenerateAssignment converter")
         try:
-            generator.start()
+            await self.run_until_disconnect(
+                ConvertService.instance().generate_assignment(
+                    input_dir=src_path, output_dir=output_path, cache_dir=cache_dir
+                )
+            )
             self.log.info("GenerateAssignment conversion done")
         except GraderConvertException as e:
             self.log.error("Converting failed: Error converting notebook!", exc_info=True)
             raise APIError(HTTPStatus.CONFLICT, message=str(e))
+        except ConvertWorkerError as e:
+            self.log.error(f"Converting failed: {e.message}")
+            raise APIError(HTTPStatus.INTERNAL_SERVER_ERROR, message=e.message)
 
     async def _update_assignment_properties(self, gradebook_path, lecture_id, assignment_id):
         try:
@@ -500,9 +599,9 @@ class PushHandler(ExtensionBaseHandler):
         remote = f"grader_{repo}"
         try:
             if not git_service.is_git():
-                git_service.init()
-                git_service.set_author(author=self.user_name)
-            git_service.set_remote(
+                await git_service.init()
+                await git_service.set_author(author=self.user_name)
+            await git_service.set_remote(
                 remote, additional_path=str(sub_id) if sub_id is not None else ""
             )
         except GitError as e:
@@ -510,21 +609,21 @@ class PushHandler(ExtensionBaseHandler):
             raise APIError(502, message=e.error)
 
         try:
-            git_service.commit(message=commit_message, selected_files=selected_files)
+            await git_service.commit(message=commit_message, selected_files=selected_files)
         except GitError as e:
             self.log.error("git error during commit process: %s", e.error)
             raise APIError(502, reason="git commit failed", message=e.error)
         try:
-            git_service.push(remote, force=True)
+            await git_service.push(remote, force=True)
         except GitError as e:
             self.log.error("git error during push process: %s", e.error)
-            git_service.undo_commit()
+            await git_service.undo_commit()
             raise APIError(502, reason="git push failed", message=e.error)
 
     async def _submit_assignment(self, git_service, lecture_id, assignment_id):
         self.log.info(f"Submitting assignment {assignment_id}!")
         try:
-            latest_commit_hash = git_service.get_log(history_count=1)[0]["commit"]
+            latest_commit_hash = (await git_service.get_log(history_count=1))[0]["commit"]
         except (KeyError, IndexError) as e:
             self.log.error(e)
             raise APIError(HTTPStatus.INTERNAL_SERVER_ERROR, message=str(e))
@@ -581,8 +680,7 @@ class ResetHandler(ExtensionBaseHandler):
 class RestoreHandler(ExtensionBaseHandler):
     @authenticated
     async def get(self, lecture_id: int, assignment_id: int, commit_hash: str):
-        lecture = await self.get_lecture(lecture_id)
-        assignment = await self.get_assignment(lecture_id, assignment_id)
+        lecture, assignment, _ = await self.get_context(lecture_id, assignment_id)
 
         git_service = GitService(
             server_root_dir=self.root_dir,
@@ -595,13 +693,13 @@ class RestoreHandler(ExtensionBaseHandler):
         )
         try:
             if not git_service.is_git():
-                git_service.init()
-                git_service.set_author(author=self.user_name)
-            git_service.set_remote(f"grader_{GitRepoType.USER}")
+                await git_service.init()
+                await git_service.set_author(author=self.user_name)
+            await git_service.set_remote(f"grader_{GitRepoType.USER}")
             # first reset by pull so there are no changes in the repository before reverting
-            git_service.pull(f"grader_{GitRepoType.USER}", force=True)
-            git_service.revert(commit_hash=commit_hash)
-            git_service.push(f"grader_{GitRepoType.USER}")
+            await git_service.pull(f"grader_{GitRepoType.USER}", force=True)
+            await git_service.revert(commit_hash=commit_hash)
+            await git_service.push(f"grader_{GitRepoType.USER}")
             self.write({"status": "OK"})
         except GitError as e:
             self.log.error("Git error:\n" + e.error)
@@ -626,21 +724,7 @@ class NotebookAccessHandler(ExtensionBaseHandler):
         """
         notebook_name = unquote(notebook_name)
 
-        try:
-            lecture = await self.request_service.request(
-                "GET",
-                f"{self.service_base_url}api/lectures/{lecture_id}",
-                header=self.grader_authentication_header,
-            )
-            assignment = await self.request_service.request(
-                "GET",
-                f"{self.service_base_url}api/lectures/{lecture_id}/assignments/{assignment_id}",
-                header=self.grader_authentication_header,
-            )
-        except RequestServiceError as e:
-            self.set_status(e.code)
-            self.write_error(e.code)
-            return
+        lecture, assignment, _ = await self.get_context(lecture_id, assignment_id)
 
         git_service = GitService(
             server_root_dir=self.root_dir,
@@ -653,10 +737,10 @@ class NotebookAccessHandler(ExtensionBaseHandler):
 
         if not git_service.is_git():
             try:
-                git_service.init()
-                git_service.set_author(author=self.user_name)
-                git_service.set_remote(f"grader_{GitRepoType.RELEASE}")
-                git_service.pull(f"grader_{GitRepoType.RELEASE}", force=True)
+                await git_service.init()
+                await git_service.set_author(author=self.user_name)
+                await git_service.set_remote(f"grader_{GitRepoType.RELEASE}")
+                await git_service.pull(f"grader_{GitRepoType.RELEASE}", force=True)
                 self.write({"status": "OK"})
             except GitError as e:
                 self.log.error("Git error:\n" + e.error)
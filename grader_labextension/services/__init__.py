@@ -1,3 +1,29 @@
-from grader_labextension.services import git, request
+from grader_labextension.services import (
+    cache,
+    circuit_breaker,
+    convert,
+    git,
+    grader_config,
+    locks,
+    loop_monitor,
+    metrics,
+    release_cache,
+    request,
+    timing,
+    workspaces,
+)
 
-__all__ = ["git", "request"]
+__all__ = [
+    "cache",
+    "circuit_breaker",
+    "convert",
+    "git",
+    "grader_config",
+    "locks",
+    "loop_monitor",
+    "metrics",
+    "release_cache",
+    "request",
+    "timing",
+    "workspaces",
+]
@@ -0,0 +1,333 @@
+# Copyright (c) 2022, TU Wien
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+import hashlib
+import time
+from collections import OrderedDict
+from io import BytesIO
+from typing import Dict, Hashable, Optional, Set, Tuple
+from urllib.parse import urlparse
+
+from tornado.httpclient import HTTPRequest, HTTPResponse
+from tornado.httputil import HTTPHeaders
+
+
+def parse_cache_control(headers: HTTPHeaders) -> Dict[str, Optional[str]]:
+    """Parse all Cache-Control headers of a response into a directive dict.
+
+    Directives without a value (e.g. `no-store`) are mapped to None.
+    """
+    directives = {}
+    for header in headers.get_list("Cache-Control"):
+        for directive in header.split(","):
+            name, _, value = directive.strip().partition("=")
+            if name:
+                directives[name.lower()] = value.strip('"') if value else None
+    return directives
+
+
+def auth_identity(headers: Dict[str, str]) -> str:
+    """Return a digest identifying the credentials a request is sent with.
+
+    The digest is used as part of cache keys, so responses are never shared between
+    different credentials and no tokens are kept in memory as plain text.
+    """
+    credentials = f"{headers.get('Authorization', '')}\n{headers.get('Cookie', '')}"
+    return hashlib.sha256(credentials.encode("utf-8")).hexdigest()
+
+
+def resource_path(url: str) -> Tuple[str, ...]:
+    """Split the path of a url into its segments, ignoring the query string."""
+    return tuple(segment for segment in urlparse(url).path.split("/") if segment)
+
+
+class _PathNode:
+    __slots__ = ("children", "keys")
+
+    def __init__(self):
+        self.children: Dict[str, _PathNode] = {}
+        self.keys: Set[Hashable] = set()
+
+
+class ResourceIndex:
+    """Index of cache keys by the path segments of the requested resource.
+
+    The grader service exposes its resources as a hierarchy, e.g.
+    `api/lectures/{l}/assignments/{a}/submissions/{s}`, which lets a mutation of one
+    resource be mapped to the cached documents it affects without scanning the cache.
+    """
+
+    def __init__(self):
+        self._root = _PathNode()
+
+    def _node(self, segments: Tuple[str, ...]) -> Optional[_PathNode]:
+        node = self._root
+        for segment in segments:
+            node = node.children.get(segment)
+            if node is None:
+                return None
+        return node
+
+    def add(self, segments: Tuple[str, ...], key: Hashable):
+        node = self._root
+        for segment in segments:
+            node = node.children.setdefault(segment, _PathNode())
+        node.keys.add(key)
+
+    def remove(self, segments: Tuple[str, ...], key: Hashable):
+        path = [self._root]
+        for segment in segments:
+            node = path[-1].children.get(segment)
+            if node is None:
+                return
+            path.append(node)
+        path[-1].keys.discard(key)
+        # prune nodes that no longer lead to any cached response
+        for depth in range(len(segments), 0, -1):
+            node = path[depth]
+            if node.keys or node.children:
+                break
+            del path[depth - 1].children[segments[depth - 1]]
+
+    def subtree(self, segments: Tuple[str, ...]) -> Tuple[Set[Hashable], Set[str]]:
+        """Keys of the resource and everything nested below it, together with the names of
+        the collections found in it."""
+        keys, names = set(), set()
+        stack = [self._node(segments)]
+        while stack:
+            node = stack.pop()
+            if node is not None:
+                keys |= node.keys
+                # attributes like `properties` are leaves, collections have members below them
+                names.update(
+                    s for s, child in node.children.items() if not s.isdigit() and child.children
+                )
+                stack.extend(node.children.values())
+        return keys, names
+
+    def collection(self, segments: Tuple[str, ...]) -> Set[Hashable]:
+        """Keys of a collection (in any query variant) and its non-member sub-resources like
+        `submissions/count`, but not of the members themselves."""
+        node = self._node(segments)
+        if node is None:
+            return set()
+        keys = set(node.keys)
+        for segment, child in node.children.items():
+            if not segment.isdigit():
+                keys |= child.keys
+        return keys
+
+    def affected(self, method: str, segments: Tuple[str, ...]) -> Set[Hashable]:
+        """Return the keys of all cached documents a `method` request to `segments` changes.
+
+        This is the mutated resource with everything below it and the collection containing
+        it. A POST to a collection only affects the collection. Collections with the same
+        name as an affected one further up the hierarchy (e.g. `lectures/{l}/submissions` for
+        a submission of an assignment) aggregate the same data and are evicted as well.
+        """
+        ids = [i for i, segment in enumerate(segments) if segment.isdigit()]
+        if not ids:
+            return self.collection(segments)
+
+        resource = segments[: ids[-1] + 1]
+        if method.upper() == "POST" and len(segments) == len(resource) + 1:
+            collection = segments
+            keys, names = set(), set()
+        else:
+            collection = resource[:-1]
+            keys, names = self.subtree(resource)
+        keys |= self.collection(collection)
+        names.add(collection[-1])
+        for i in ids:
+            if i < len(collection) - 1:
+                for name in names:
+                    keys |= self.collection(segments[: i + 1] + (name,))
+        return keys
+
+
+class CacheEntry:
+    def __init__(self, response: HTTPResponse, max_age: float):
+        self.code = response.code
+        self.reason = response.reason
+        self.headers = HTTPHeaders(response.headers)
+        self.body = response.body or b""
+        self.effective_url = response.effective_url
+        self.etag = response.headers.get("ETag")
+        self.expires_at = time.monotonic() + max_age
+
+    @property
+    def size(self) -> int:
+        return len(self.body)
+
+    def is_fresh(self) -> bool:
+        return time.monotonic() < self.expires_at
+
+    def refresh(self, response: HTTPResponse, max_age: float):
+        """Update the entry from a `304 Not Modified` revalidation response."""
+        self.etag = response.headers.get("ETag", self.etag)
+        for header in ("Cache-Control", "ETag", "Expires", "Date"):
+            if header in response.headers:
+                self.headers[header] = response.headers[header]
+        self.expires_at = time.monotonic() + max_age
+
+    def to_response(self, request: HTTPRequest) -> HTTPResponse:
+        return HTTPResponse(
+            request,
+            self.code,
+            reason=self.reason,
+            headers=HTTPHeaders(self.headers),
+            buffer=BytesIO(self.body),
+            effective_url=self.effective_url,
+        )
+
+
+class ResponseCache:
+    """Bounded in-memory LRU cache for upstream GET responses.
+
+    Freshness follows the `Cache-Control` header of the upstream response. Entries that
+    carry an `ETag` are kept after they become stale, so they can be revalidated with
+    `If-None-Match` instead of being downloaded again.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int, default_max_age: float = 0.0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.default_max_age = default_max_age
+        self._entries: OrderedDict[Hashable, CacheEntry] = OrderedDict()
+        self._index = ResourceIndex()
+        self._size = 0
+        # incremented on every invalidation, so responses fetched concurrently with a
+        # mutation are not stored afterwards
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def key(method: str, url: str, headers: Dict[str, str]) -> Tuple[str, str, str]:
+        return method.upper(), url, auth_identity(headers)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def get(self, key: Hashable) -> Optional[CacheEntry]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def max_age(self, response: HTTPResponse, etag: Optional[str] = None) -> Optional[float]:
+        """Return how long the response may be served from cache or None if it must not
+        be stored at all. `etag` is the validator of an already cached entry, if any."""
+        directives = parse_cache_control(response.headers)
+        if "no-store" in directives:
+            return None
+        if "no-cache" in directives:
+            max_age = 0.0
+        else:
+            try:
+                max_age = float(directives["max-age"])
+            except (KeyError, TypeError, ValueError):
+                max_age = self.default_max_age
+        if max_age <= 0 and not (etag or "ETag" in response.headers):
+            # nothing to revalidate with, so the entry would never be usable
+            return None
+        return max(max_age, 0.0)
+
+    def store(
+        self, key: Hashable, response: HTTPResponse, generation: Optional[int] = None
+    ) -> Optional[CacheEntry]:
+        if response.code != 200:
+            return None
+        if generation is not None and generation != self.generation:
+            # the cache was invalidated while the response was fetched
+            return None
+        max_age = self.max_age(response)
+        if max_age is None:
+            self.discard(key)
+            return None
+        entry = CacheEntry(response, max_age)
+        if entry.size > self.max_bytes:
+            self.discard(key)
+            return None
+        self.discard(key)
+        self._entries[key] = entry
+        self._index.add(resource_path(key[1]), key)
+        self._size += entry.size
+        self._evict()
+        return entry
+
+    def refresh(self, key: Hashable, response: HTTPResponse) -> Optional[CacheEntry]:
+        entry = self.get(key)
+        if entry is None:
+            return None
+        max_age = self.max_age(response, etag=entry.etag)
+        entry.refresh(response, max_age or 0.0)
+        if max_age is None:
+            self.discard(key)
+        self.revalidations += 1
+        return entry
+
+    def discard(self, key: Hashable) -> bool:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        self._index.remove(resource_path(key[1]), key)
+        self._size -= entry.size
+        return True
+
+    def invalidate(self, method: str, url: str) -> int:
+        """Evict all entries affected by a `method` request to `url`.
+
+        Returns:
+            int: the number of evicted entries
+        """
+        self.generation += 1
+        keys = self._index.affected(method, resource_path(url))
+        for key in keys:
+            self.discard(key)
+        self.invalidations += len(keys)
+        return len(keys)
+
+    def clear(self):
+        self._entries.clear()
+        self._index = ResourceIndex()
+        self._size = 0
+
+    def resize(self, max_entries: int, max_bytes: int):
+        """Change the limits of the cache, evicting the least recently used entries that no
+        longer fit."""
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._evict()
+
+    def _evict(self):
+        while self._entries and (
+            len(self._entries) > self.max_entries or self._size > self.max_bytes
+        ):
+            key, entry = self._entries.popitem(last=False)
+            self._index.remove(resource_path(key[1]), key)
+            self._size -= entry.size
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "bytes": self._size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "revalidations": self.revalidations,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
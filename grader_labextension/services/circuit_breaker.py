@@ -0,0 +1,103 @@
+# Copyright (c) 2022, TU Wien
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+import enum
+import time
+from collections import deque
+from typing import Deque
+
+
+class CircuitState(str, enum.Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, host: str, retry_after: float):
+        self.host = host
+        self.retry_after = retry_after
+        super().__init__(f"Circuit for {host} is open, retry in {retry_after:.1f}s")
+
+
+class CircuitBreaker:
+    """Circuit breaker for the requests to one upstream host.
+
+    The circuit opens after `failure_threshold` consecutive transient failures. While it is
+    open, requests fail immediately with `CircuitOpenError`. After `reset_timeout` seconds
+    it is half-open and lets `half_open_requests` probe requests through: if one of them
+    succeeds the circuit closes again, if one fails it opens for another `reset_timeout`.
+    """
+
+    def __init__(
+        self, host: str, failure_threshold: int, reset_timeout: float, half_open_requests: int = 1
+    ):
+        self.host = host
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_requests = half_open_requests
+        self._state = CircuitState.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        self._probe_started = 0.0
+
+    @property
+    def state(self) -> CircuitState:
+        if (
+            self._state == CircuitState.OPEN
+            and time.monotonic() - self._opened_at >= self.reset_timeout
+        ):
+            self._state = CircuitState.HALF_OPEN
+            self._probes = 0
+        return self._state
+
+    def before_request(self):
+        """Raises `CircuitOpenError` if a request to the host must not be sent now."""
+        state = self.state
+        if state == CircuitState.CLOSED:
+            return
+        if state == CircuitState.HALF_OPEN:
+            now = time.monotonic()
+            # probes whose outcome was never recorded (e.g. cancelled ones) expire
+            probes_expired = now - self._probe_started >= self.reset_timeout
+            if self._probes >= self.half_open_requests and probes_expired:
+                self._probes = 0
+            if self._probes < self.half_open_requests:
+                self._probes += 1
+                self._probe_started = now
+                return
+        retry_after = max(self._opened_at + self.reset_timeout - time.monotonic(), 0.0)
+        raise CircuitOpenError(self.host, retry_after)
+
+    def record_success(self):
+        self._state = CircuitState.CLOSED
+        self._failures = 0
+
+    def record_failure(self):
+        self._failures += 1
+        if self._state == CircuitState.HALF_OPEN or self._failures >= self.failure_threshold:
+            self._state = CircuitState.OPEN
+            self._opened_at = time.monotonic()
+
+
+class RetryBudget:
+    """Limits the number of retries within a sliding time window, so that retries cannot
+    multiply the load on an upstream that is already failing."""
+
+    def __init__(self, max_retries: int, window: float):
+        self.max_retries = max_retries
+        self.window = window
+        self._retries: Deque[float] = deque()
+
+    def try_acquire(self) -> bool:
+        """Returns whether a retry may be made now and counts it if so."""
+        now = time.monotonic()
+        while self._retries and now - self._retries[0] > self.window:
+            self._retries.popleft()
+        if len(self._retries) >= self.max_retries:
+            return False
+        self._retries.append(now)
+        return True
@@ -0,0 +1,201 @@
+# Copyright (c) 2022, TU Wien
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+import asyncio
+import logging
+import multiprocessing
+import os
+import pickle
+import weakref
+from typing import Any, Callable, List, Optional
+
+from grader_service.convert.converters.generate_assignment import GenerateAssignment
+from traitlets.config.configurable import SingletonConfigurable
+from traitlets.traitlets import Bool, Integer
+
+from grader_labextension.api.models.assignment_settings import AssignmentSettings
+from grader_labextension.services import timing
+from grader_labextension.services.release_cache import ReleaseCache
+
+
+class ConvertWorkerError(Exception):
+    def __init__(self, message: str):
+        self.message = message
+        super().__init__(message)
+
+
+def generate_assignment(
+    input_dir: str,
+    output_dir: str,
+    file_pattern: str = "*.ipynb",
+    allowed_files: List[str] = None,
+    cache_dir: Optional[str] = None,
+):
+    """Generate the release files of an assignment. Runs in a worker process.
+
+    If `cache_dir` is given, only notebooks that changed since the last generation are
+    converted, see `ReleaseCache`.
+    """
+    allowed_files = allowed_files or ["*"]
+    if cache_dir is not None:
+        ReleaseCache(cache_dir).generate(input_dir, output_dir, file_pattern, allowed_files)
+        return
+    generator = GenerateAssignment(
+        input_dir=input_dir,
+        output_dir=output_dir,
+        file_pattern=file_pattern,
+        assignment_settings=AssignmentSettings(allowed_files=allowed_files),
+    )
+    generator.force = True
+    generator.start()
+
+
+def _worker_main(connection):
+    logging.basicConfig(level=logging.INFO)
+    while True:
+        try:
+            job = connection.recv()
+        except EOFError:
+            break
+        if job is None:
+            break
+        function, args = job
+        try:
+            result = ("ok", function(*args))
+        except Exception as e:
+            # the traceback is lost when the exception is sent to the server process
+            logging.exception(f"{function.__name__} failed in conversion worker")
+            result = ("error", e)
+        try:
+            connection.send(result)
+        except (pickle.PicklingError, TypeError, AttributeError):
+            # the result or the exception cannot be pickled, nothing has been sent yet
+            connection.send(("error", ConvertWorkerError(repr(result[1]))))
+    connection.close()
+
+
+class _Worker:
+    """A worker process running one job at a time, which is kept alive between jobs."""
+
+    def __init__(self, context):
+        self.connection, child_connection = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_connection,), daemon=True)
+        self.process.start()
+        child_connection.close()
+
+    @property
+    def pid(self) -> int:
+        return self.process.pid
+
+    def is_alive(self) -> bool:
+        return self.process.is_alive()
+
+    async def call(self, function: Callable, args: tuple):
+        loop = asyncio.get_running_loop()
+        self.connection.send((function, args))
+        try:
+            status, value = await loop.run_in_executor(None, self.connection.recv)
+        except EOFError:
+            await loop.run_in_executor(None, self.process.join)
+            raise ConvertWorkerError(
+                f"Conversion worker exited unexpectedly with code {self.process.exitcode}"
+            )
+        if status == "error":
+            raise value
+        return value
+
+    async def terminate(self):
+        self.process.terminate()
+        # also ends a receive that is still waiting for the result
+        await asyncio.get_running_loop().run_in_executor(None, self.process.join)
+        self.connection.close()
+
+
+class ConvertService(SingletonConfigurable):
+    """Runs notebook conversions in worker processes, so they do not block the server.
+
+    At most `max_workers` conversions run at the same time, further ones wait for a free
+    worker. Workers are spawned on demand and reused afterwards, a worker whose conversion
+    is cancelled (e.g. because the client disconnected) is terminated.
+    """
+
+    max_workers = Integer(
+        max(1, (os.cpu_count() or 2) // 2),
+        help="Maximum number of conversions running in parallel worker processes.",
+    ).tag(config=True)
+    incremental_generation = Bool(
+        True,
+        help="Whether to cache generated release notebooks and only convert the notebooks "
+        "of an assignment that changed since the last generation.",
+    ).tag(config=True)
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._idle: List[_Worker] = []
+        self._cache_locks: weakref.WeakValueDictionary[str, asyncio.Lock] = (
+            weakref.WeakValueDictionary()
+        )
+        # spawn instead of fork, the server process runs threads
+        self._context = multiprocessing.get_context("spawn")
+
+    async def generate_assignment(
+        self,
+        input_dir: str,
+        output_dir: str,
+        file_pattern: str = "*.ipynb",
+        allowed_files: List[str] = None,
+        cache_dir: Optional[str] = None,
+    ):
+        """Generate the release files of an assignment in a worker process.
+
+        Exceptions raised by the converter (e.g. `GraderConvertException`) are re-raised.
+        If `incremental_generation` is enabled, the converted notebooks are cached in
+        `cache_dir`, which must be distinct for every assignment.
+        """
+        if not self.incremental_generation or cache_dir is None:
+            await self.run(generate_assignment, input_dir, output_dir, file_pattern, allowed_files)
+            return
+        lock = self._cache_locks.get(cache_dir)
+        if lock is None:
+            lock = self._cache_locks[cache_dir] = asyncio.Lock()
+        # generations of the same assignment must not update its cache concurrently
+        async with lock:
+            await self.run(
+                generate_assignment, input_dir, output_dir, file_pattern, allowed_files, cache_dir
+            )
+
+    async def run(self, function: Callable, *args) -> Any:
+        """Call the picklable `function` with `args` in a worker process and return its
+        result. Cancelling the returned coroutine terminates the worker."""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_workers)
+        with timing.span("convert-wait", function.__name__):
+            await self._slots.acquire()
+        try:
+            worker = self._acquire_worker()
+            try:
+                with timing.span("convert", function.__name__):
+                    return await worker.call(function, args)
+            except asyncio.CancelledError:
+                self.log.warning(f"Conversion cancelled, terminating worker {worker.pid}")
+                await worker.terminate()
+                worker = None
+                raise
+            finally:
+                if worker is not None:
+                    self._idle.append(worker)
+        finally:
+            self._slots.release()
+
+    def _acquire_worker(self) -> _Worker:
+        while self._idle:
+            worker = self._idle.pop()
+            if worker.is_alive():
+                return worker
+            worker.connection.close()
+        worker = _Worker(self._context)
+        self.log.info(f"Started conversion worker {worker.pid}")
+        return worker
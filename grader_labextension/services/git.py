@@ -1,21 +1,39 @@
 # Copyright (c) 2022, TU Wien
 # All rights reserved.
 #
+import asyncio
+import contextlib
 import enum
+import functools
+import glob
+import hashlib
+import json
 import logging
 import os
 import posixpath
 import shlex
 import shutil
-import subprocess
-from datetime import datetime
+import stat
+import sys
+import time
+from asyncio.subprocess import PIPE
+from datetime import datetime, timezone
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple, Union
+from typing import ClassVar, Dict, List, NamedTuple, Optional, Set, Tuple
 from urllib.parse import urlparse
 
 from grader_service.handlers import GitRepoType
+from traitlets import traitlets
 from traitlets.config.configurable import Configurable
-from traitlets.traitlets import Unicode
+from traitlets.traitlets import Bool, Float, TraitError, Unicode, validate
+
+from grader_labextension.services import metrics, timing
+from grader_labextension.services.locks import RepoLock
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
 
 
 class GitError(Exception):
@@ -33,10 +51,196 @@ class RemoteFileStatus(enum.Enum):
     NO_REMOTE_REPO = 5
 
 
+class CloneStrategy(str, enum.Enum):
+    # all branches with their complete history
+    FULL = "full"
+    # the pulled branch with its complete history
+    SINGLE_BRANCH = "single-branch"
+    # the history of the pulled branch without file contents, which are fetched on demand
+    BLOBLESS = "blobless"
+    # only the latest commit of the pulled branch
+    SHALLOW = "shallow"
+
+
+class RemoteStatus(NamedTuple):
+    status: RemoteFileStatus
+    # number of commits the local branch is ahead of/behind its remote counterpart
+    ahead: int = 0
+    behind: int = 0
+
+
+def _exclusive(method):
+    """Run a GitService operation while holding the lock of its repository exclusively,
+    so its commands are not interleaved with those of other operations."""
+
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        async with RepoLock.for_path(self.path).exclusive():
+            return await method(self, *args, **kwargs)
+
+    return wrapper
+
+
+# bare repository in the lecture directory holding the git objects shared by its repositories
+OBJECT_STORE_DIR = ".git-objects"
+# file in the object store whose modification time is the time of its last garbage collection
+OBJECT_STORE_GC_STAMP = "grader_gc_stamp"
+
+
+def _add_alternate(alternates: str, objects: str):
+    """Add the object directory `objects` to the alternates file `alternates`."""
+    try:
+        with open(alternates) as f:
+            entries = f.read().splitlines()
+    except FileNotFoundError:
+        entries = []
+    if objects not in entries:
+        os.makedirs(os.path.dirname(alternates), exist_ok=True)
+        with open(alternates, "a") as f:
+            f.write(objects + "\n")
+
+
+def _remove_alternates(path: str):
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(os.path.join(path, ".git", "objects", "info", "alternates"))
+
+
+def _object_store_users(lecture_dir: str, objects: str) -> List[str]:
+    """The repositories in `lecture_dir` that use the object directory `objects`. Repositories
+    are at most three levels below the lecture directory, e.g. `manualgrade/<a>/<s>`."""
+    users = []
+    for pattern in ("*/*/.git", "*/*/*/.git"):
+        for git_dir in glob.glob(os.path.join(glob.escape(lecture_dir), pattern)):
+            try:
+                with open(os.path.join(git_dir, "objects", "info", "alternates")) as f:
+                    if objects in f.read().splitlines():
+                        users.append(os.path.dirname(git_dir))
+            except OSError:
+                continue
+    return users
+
+
+# file in the .git directory with the size, modification time and hash of the files written
+# by `GitService.copy_repo_contents`
+COPY_MANIFEST_FILE = "grader_copy_manifest.json"
+# ioctl cloning a file on copy-on-write filesystems (btrfs, XFS, ...)
+_FICLONE = 0x40049409 if fcntl is not None and sys.platform.startswith("linux") else None
+
+
+def _file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _load_copy_manifest(path: str) -> Dict[str, List]:
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return manifest if isinstance(manifest, dict) else {}
+
+
+def _save_copy_manifest(path: str, manifest: Dict[str, List]):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, path)
+
+
+def _clone_file(src: str, dst: str):
+    """Copies the contents of src to dst as a reflink if the filesystem supports it, else
+    with copy_file_range, which copies within the kernel."""
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        if _FICLONE is not None:
+            try:
+                fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+                return
+            except OSError:
+                pass
+        if hasattr(os, "copy_file_range"):
+            try:
+                while os.copy_file_range(fsrc.fileno(), fdst.fileno(), 1 << 30) > 0:
+                    pass
+                return
+            except OSError:
+                fsrc.seek(0)
+                fdst.seek(0)
+                fdst.truncate()
+        shutil.copyfileobj(fsrc, fdst, 1 << 20)
+
+
+def _copy_if_changed(
+    src: str, dst: str, rel_path: str, manifest: Dict[str, List], link: bool
+) -> bool:
+    """Copies src to dst unless dst already has the same content. Returns whether it copied."""
+    src_stat = os.stat(src)
+    try:
+        dst_stat = os.lstat(dst)
+    except FileNotFoundError:
+        dst_stat = None
+    if dst_stat is not None and stat.S_ISDIR(dst_stat.st_mode):
+        shutil.rmtree(dst)
+        dst_stat = None
+
+    src_hash = None
+    if (
+        dst_stat is not None
+        and stat.S_ISREG(dst_stat.st_mode)
+        and dst_stat.st_size == src_stat.st_size
+    ):
+        if dst_stat.st_mtime_ns == src_stat.st_mtime_ns:
+            return False
+        entry = manifest.get(rel_path)
+        if entry and entry[0] == dst_stat.st_size and entry[1] == dst_stat.st_mtime_ns:
+            dst_hash = entry[2]
+        else:
+            dst_hash = _file_hash(dst)
+        src_hash = _file_hash(src)
+        if src_hash == dst_hash:
+            # leave the file untouched, so git does not need to hash it again either
+            manifest[rel_path] = [dst_stat.st_size, dst_stat.st_mtime_ns, dst_hash]
+            return False
+
+    # write next to dst and replace it, so a hardlinked old version is never modified
+    tmp_path = os.path.join(os.path.dirname(dst), f".{os.path.basename(dst)}.grader-tmp")
+    try:
+        if link:
+            try:
+                os.link(src, tmp_path)
+            except OSError:
+                link = False
+        if not link:
+            _clone_file(src, tmp_path)
+            shutil.copystat(src, tmp_path)
+        os.replace(tmp_path, dst)
+    except BaseException:
+        if os.path.lexists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    if src_hash is None:
+        manifest.pop(rel_path, None)
+    else:
+        dst_stat = os.stat(dst)
+        manifest[rel_path] = [dst_stat.st_size, dst_stat.st_mtime_ns, src_hash]
+    return True
+
+
 class GitService(Configurable):
     DEFAULT_HOST_URL = "http://127.0.0.1:4010"
     DEFAULT_GIT_URL_PREFIX = "/services/grader/git"
     _git_version = None
+    # time of the last successful fetch by (repository path, remote, remote urls), shared by
+    # all instances since a new GitService is created for every request
+    _last_fetch: ClassVar[Dict[Tuple[str, str, int], float]] = {}
+    # time and result of the last lookup of a remote branch head by fetch key and branch
+    _remote_heads: ClassVar[Dict[Tuple[Tuple[str, str, int], str], Tuple[float, str]]] = {}
+    # object stores with a running gc_object_store
+    _collecting_stores: ClassVar[Set[str]] = set()
+    ALL_REMOTES = "--all"
 
     git_access_token = Unicode(os.environ.get("GRADER_API_TOKEN"), allow_none=False).tag(
         config=True
@@ -46,6 +250,56 @@ class GitService(Configurable):
         + os.environ.get("GRADER_GIT_PREFIX", DEFAULT_GIT_URL_PREFIX),
         allow_none=False,
     ).tag(config=True)
+    git_command_timeout = Float(
+        60.0, help="Timeout in seconds for local git commands. Set to 0 to disable the timeout."
+    ).tag(config=True)
+    git_network_timeout = Float(
+        300.0,
+        help="Timeout in seconds for git commands that contact a remote (fetch, pull, push). "
+        "Set to 0 to disable the timeout.",
+    ).tag(config=True)
+    fetch_freshness = Float(
+        10.0,
+        help="Seconds during which a successful fetch of a repository, or lookup of the head of "
+        "a remote branch, is reused instead of contacting the remote again. Set to 0 to always "
+        "contact the remote.",
+    ).tag(config=True)
+    shared_object_store = Bool(
+        False,
+        help="Whether the repositories of a lecture share their git objects in a common object "
+        "store, so objects are downloaded and stored only once per lecture. Shallow and "
+        "blobless clones keep their own objects.",
+    ).tag(config=True)
+    object_store_gc_interval = Float(
+        86400.0,
+        help="Seconds between garbage collections of the shared object store of a lecture, "
+        "which remove the objects of deleted repositories. Set to 0 to disable them.",
+    ).tag(config=True)
+    object_store_prune_expire = Unicode(
+        "2.weeks.ago",
+        help="Age after which unreachable objects are pruned from the shared object store, "
+        "as accepted by `git gc --prune`.",
+    ).tag(config=True)
+    clone_strategies = traitlets.Dict(
+        default_value={
+            GitRepoType.RELEASE.value: CloneStrategy.SINGLE_BRANCH.value,
+            GitRepoType.AUTOGRADE.value: CloneStrategy.SHALLOW.value,
+            GitRepoType.FEEDBACK.value: CloneStrategy.SHALLOW.value,
+        },
+        help="How much of a remote is fetched when pulling, by repository type: 'full', "
+        "'single-branch', 'blobless' or 'shallow'. Repository types that are not listed are "
+        "fetched in full. The release repository is pulled into the repository students "
+        "push their work from, so it must not be shallow or blobless.",
+    ).tag(config=True)
+
+    @validate("clone_strategies")
+    def _validate_clone_strategies(self, proposal):
+        for repo_type, strategy in proposal["value"].items():
+            try:
+                CloneStrategy(strategy)
+            except ValueError:
+                raise TraitError(f"Unknown clone strategy {strategy!r} for {repo_type}")
+        return proposal["value"]
 
     def __init__(
         self,
@@ -68,6 +322,7 @@ class GitService(Configurable):
         self.repo_type = repo_type
 
         self.path = self._determine_repo_path(force_user_repo, sub_id, username)
+        self._remote_urls: Dict[str, str] = {}
         os.makedirs(self.path, exist_ok=True)
 
         self._initialize_git_logging()
@@ -113,7 +368,8 @@ class GitService(Configurable):
         url_parsed = urlparse(self.git_service_url)
         return url_parsed.scheme, f"{url_parsed.netloc}{url_parsed.path}"
 
-    def push(self, origin: str, force: bool = False):
+    @_exclusive
+    async def push(self, origin: str, force: bool = False):
         """Push commits to the remote repository.
 
         Args:
@@ -121,9 +377,12 @@ class GitService(Configurable):
             force (bool): Whether to force push. Defaults to False.
         """
         self.log.info(f"Pushing to remote {origin} at {self.path}")
-        self._run_command(f"git push {origin} main" + (" --force" if force else ""), cwd=self.path)
+        command = ["git", "push", origin, "main"] + (["--force"] if force else [])
+        await self._run_command(command, cwd=self.path, timeout=self.git_network_timeout)
+        GitService._remote_heads.pop((self._fetch_key(origin), "main"), None)
 
-    def set_remote(self, origin: str, additional_path: str = ""):
+    @_exclusive
+    async def set_remote(self, origin: str, additional_path: str = ""):
         """Set or update the remote repository.
 
         Args:
@@ -138,28 +397,75 @@ class GitService(Configurable):
             f"{posixpath.join(url_path, additional_path)}"
         )
         self.log.info(f"Setting remote {origin} for {self.path} to {url}")
+        self._remote_urls[origin] = url
         try:
-            self._run_command(f"git remote add {origin} {url}", cwd=self.path)
+            await self._run_command(["git", "remote", "add", origin, url], cwd=self.path)
         except GitError:
             self.log.warning(f"Remote {origin} already exists. Updating URL.")
-            self._run_command(f"git remote set-url {origin} {url}", cwd=self.path)
+            await self._run_command(["git", "remote", "set-url", origin, url], cwd=self.path)
 
-    def switch_branch(self, branch: str):
+    @_exclusive
+    async def switch_branch(self, branch: str):
         """Switch to the specified branch.
 
         Args:
             branch (str): The branch name.
         """
-        self.log.info(f"Fetching all branches at {self.path}")
-        self._run_command("git fetch --all", cwd=self.path)
+        await self.fetch_all(force=True)
         self.log.info(f"Switching to branch {branch} at {self.path}")
-        self._run_command(f"git checkout {branch}", cwd=self.path)
+        await self._run_command(["git", "checkout", branch], cwd=self.path)
+
+    async def fetch_all(self, force: bool = False) -> bool:
+        """Fetch all remotes unless they were fetched within the last `fetch_freshness` seconds.
+
+        Args:
+            force (bool): Whether to fetch even if the last fetch is still fresh.
+                Defaults to False.
 
-    def fetch_all(self):
+        Returns:
+            bool: True if the remotes were fetched, False if the last fetch was reused.
+        """
+        last_fetch = self._last_fetch.get(self._fetch_key(self.ALL_REMOTES))
+        if not force and last_fetch is not None and time.time() - last_fetch < self.fetch_freshness:
+            self.log.info(f"Skipping fetch at path {self.path}, last fetch is still fresh")
+            return False
         self.log.info(f"Fetching all at path {self.path}")
-        self._run_command("git fetch --all", cwd=self.path)
+        # fetching only updates remote-tracking refs, so it may run alongside other reads
+        await self._run_command(
+            ["git", "fetch", "--all"],
+            cwd=self.path,
+            timeout=self.git_network_timeout,
+            read_only=True,
+        )
+        self._record_fetch(self.ALL_REMOTES)
+        return True
+
+    def last_fetched(self, origin: Optional[str] = None) -> Optional[datetime]:
+        """Return when the remote `origin` (or all remotes) was last fetched successfully.
 
-    def pull(self, origin: str, branch: str = "main", force: bool = False):
+        Args:
+            origin (str, optional): The remote name. Defaults to None.
+
+        Returns:
+            Optional[datetime]: the time of the last fetch in UTC or None if never fetched.
+        """
+        keys = [self._fetch_key(self.ALL_REMOTES)]
+        if origin is not None:
+            keys.append(self._fetch_key(origin))
+        timestamps = [self._last_fetch[k] for k in keys if k in self._last_fetch]
+        if not timestamps:
+            return None
+        return datetime.fromtimestamp(max(timestamps), tz=timezone.utc)
+
+    def _fetch_key(self, origin: str) -> Tuple[str, str, int]:
+        # a fetch is only reused while the remotes point to the same urls
+        return self.path, origin, hash(frozenset(self._remote_urls.items()))
+
+    def _record_fetch(self, origin: str):
+        GitService._last_fetch[self._fetch_key(origin)] = time.time()
+
+    @_exclusive
+    async def pull(self, origin: str, branch: str = "main", force: bool = False):
         """Pull changes from the remote repository.
 
         Args:
@@ -168,7 +474,8 @@ class GitService(Configurable):
             force (bool): Whether to force the pull. Defaults to False.
         """
         self.log.info(f"Pulling from {origin}/{branch} at {self.path}")
-        if not self.remote_branch_exists(origin, branch):
+        await self._link_object_store()
+        if not await self.remote_branch_exists(origin, branch):
             raise GitError(
                 code=404,
                 error="Remote repository not found. Please ensure your assignment is pushed "
@@ -177,20 +484,63 @@ class GitService(Configurable):
 
         if force:
             # clean local changes
-            command = "git clean -fd"
-            self._run_command(command, cwd=self.path)
+            await self._run_command(["git", "clean", "-fd"], cwd=self.path)
             # fetch info
-            command = f"git fetch {origin}"
-            self._run_command(command, cwd=self.path)
+            await self._run_command(
+                self._fetch_command(origin, branch), cwd=self.path, timeout=self.git_network_timeout
+            )
+            self._record_fetch(origin)
             # reset to branch head
-            command = f"git reset --hard {origin}/{branch}"
-            self._run_command(command, cwd=self.path)
-        else:
+            await self._run_command(["git", "reset", "--hard", f"{origin}/{branch}"], cwd=self.path)
+        elif self.clone_strategy == CloneStrategy.FULL:
             # just pull the branch
-            command = f"git pull {origin} {branch}"
-            self._run_command(command, cwd=self.path)
+            await self._run_command(
+                ["git", "pull", origin, branch], cwd=self.path, timeout=self.git_network_timeout
+            )
+            self._record_fetch(origin)
+        else:
+            # git pull cannot filter, the history of a partial clone is never diverged
+            await self._run_command(
+                self._fetch_command(origin, branch, on_top=await self.head_commit() is not None),
+                cwd=self.path,
+                timeout=self.git_network_timeout,
+            )
+            self._record_fetch(origin)
+            await self._run_command(
+                ["git", "merge", "--ff-only", f"{origin}/{branch}"], cwd=self.path
+            )
+        await self._share_objects()
+
+    @property
+    def clone_strategy(self) -> CloneStrategy:
+        """The clone strategy of the repository type of this service."""
+        repo_type = GitRepoType(self.repo_type).value
+        return CloneStrategy(self.clone_strategies.get(repo_type, CloneStrategy.FULL))
 
-    def init(self, force: bool = False):
+    def _fetch_command(
+        self, origin: str, branch: str, single_branch: bool = False, on_top: bool = False
+    ) -> List[str]:
+        """The command fetching `branch` from the remote according to the clone strategy.
+        With `single_branch` only the branch is fetched even for a full clone. With `on_top`
+        the new commits are fetched down to the local history, so they can be merged into it,
+        instead of cutting a shallow clone off at the new head."""
+        strategy = self.clone_strategy
+        if strategy == CloneStrategy.FULL and not single_branch:
+            return ["git", "fetch", origin]
+        command = ["git", "fetch"]
+        if strategy == CloneStrategy.SHALLOW and not on_top:
+            command.append("--depth=1")
+        elif strategy == CloneStrategy.BLOBLESS:
+            # makes the remote a promisor remote, missing blobs are fetched when checked out
+            command.append("--filter=blob:none")
+        return command + [origin, f"+refs/heads/{branch}:refs/remotes/{origin}/{branch}"]
+
+    def is_shallow(self) -> bool:
+        """Check if the repository contains only part of the history of its commits."""
+        return Path(self.path).joinpath(".git", "shallow").exists()
+
+    @_exclusive
+    async def init(self, force: bool = False):
         """Initialize a local repository.
 
         Args:
@@ -198,19 +548,292 @@ class GitService(Configurable):
         """
         if not self.is_git() or force:
             self.log.info(f"Initializing git repository at {self.path}")
-            command = "git init -b main" if self.git_version >= (2, 28) else "git init"
-            self._run_command(command, cwd=self.path)
+            git_version = await self.get_git_version()
+            command = ["git", "init", "-b", "main"] if git_version >= (2, 28) else ["git", "init"]
+            await self._run_command(command, cwd=self.path)
+
+    @property
+    def object_store_path(self) -> str:
+        """The bare repository holding the git objects shared by the repositories of the
+        lecture."""
+        return os.path.join(self.git_root_dir, self.lecture_code, OBJECT_STORE_DIR)
+
+    def _object_store_key(self, path: str) -> str:
+        """The name under `refs/repos` of the refs the repository at `path` keeps in the
+        object store."""
+        return hashlib.sha1(os.path.relpath(path, self.git_root_dir).encode()).hexdigest()
+
+    def _can_share_objects(self) -> bool:
+        # other repositories assume that the history of every commit in the store is complete
+        # and the objects a partial clone got from the store would not be protected by its refs
+        return (
+            self.clone_strategy not in (CloneStrategy.SHALLOW, CloneStrategy.BLOBLESS)
+            and not self.is_shallow()
+        )
+
+    async def _link_object_store(self):
+        """Create the shared object store of the lecture if necessary and add it to the
+        alternates of the repository. Fetches then only download objects that are missing
+        in the store, since the refs of the store are offered to the remote as known."""
+        if not self.shared_object_store or not self.is_git() or not self._can_share_objects():
+            return
+        store = self.object_store_path
+        if not os.path.isdir(os.path.join(store, "objects")):
+            self.log.info(f"Creating shared object store at {store}")
+            await self._run_command(
+                ["git", "init", "--bare", "--quiet", store], cwd=os.path.dirname(store)
+            )
+            # objects are only pruned by gc_object_store, which first updates the refs of all
+            # repositories using the store
+            for key, value in (
+                ("gc.auto", "0"),
+                ("gc.pruneExpire", "never"),
+                ("maintenance.auto", "false"),
+            ):
+                await self._run_command(["git", "config", key, value], cwd=store)
+
+        alternates = os.path.join(self.path, ".git", "objects", "info", "alternates")
+        await asyncio.get_running_loop().run_in_executor(
+            None, _add_alternate, alternates, os.path.join(store, "objects")
+        )
+
+    async def _share_objects(self):
+        """Move the objects of the repository into the shared object store, where the other
+        repositories of the lecture find them, and remove the local copies."""
+        if not self.shared_object_store or not self.is_git() or not self._can_share_objects():
+            return
+        store = self.object_store_path
+        if not os.path.isdir(os.path.join(store, "objects")):
+            return
+        await self._fetch_into_object_store(self.path, store)
+        # --local leaves out the objects found in the store, -d then deletes the old copies
+        await self._run_command(
+            ["git", "repack", "-a", "-d", "-l", "-q"],
+            cwd=self.path,
+            timeout=self.git_network_timeout,
+        )
+        self._schedule_object_store_gc(store)
+
+    async def _fetch_into_object_store(self, path: str, store: str):
+        # the refs keep the objects reachable in the store and are used to negotiate fetches
+        key = self._object_store_key(path)
+        await self._run_command(
+            [
+                "git",
+                "-c",
+                "fetch.unpackLimit=1",
+                "fetch",
+                "--quiet",
+                "--no-tags",
+                "--prune",
+                path,
+                f"+refs/heads/*:refs/repos/{key}/heads/*",
+                f"+refs/remotes/*:refs/repos/{key}/remotes/*",
+            ],
+            cwd=store,
+            timeout=self.git_network_timeout,
+        )
+
+    async def _delete_object_store_refs(self, store: str, refs: List[str]):
+        if refs:
+            await self._run_command(
+                ["git", "update-ref", "--stdin"],
+                cwd=store,
+                stdin="".join(f"delete {ref}\n" for ref in refs),
+            )
+
+    async def _object_store_refs(self, store: str, prefix: str = "refs/repos/") -> List[str]:
+        output = await self._run_command(
+            ["git", "for-each-ref", "--format=%(refname)", prefix], cwd=store, read_only=True
+        )
+        return output.split()
+
+    async def unshare_objects(self, path: Optional[str] = None):
+        """Delete the refs the repository at `path` (by default the repository of this
+        service) keeps in the object store of its lecture, so the objects only it used can be
+        pruned. Call it after the repository was deleted."""
+        path = path or self.path
+        lecture_code = os.path.relpath(path, self.git_root_dir).split(os.sep)[0]
+        store = os.path.join(self.git_root_dir, lecture_code, OBJECT_STORE_DIR)
+        if not os.path.isdir(os.path.join(store, "objects")):
+            return
+        prefix = f"refs/repos/{self._object_store_key(path)}/"
+        await self._delete_object_store_refs(store, await self._object_store_refs(store, prefix))
+
+    def _schedule_object_store_gc(self, store: str):
+        """Start `gc_object_store` in the background if the last collection of the store is
+        more than `object_store_gc_interval` seconds ago."""
+        if self.object_store_gc_interval <= 0 or store in GitService._collecting_stores:
+            return
+        stamp = os.path.join(store, OBJECT_STORE_GC_STAMP)
+        try:
+            if time.time() - os.path.getmtime(stamp) < self.object_store_gc_interval:
+                return
+        except FileNotFoundError:
+            # the interval of a new store starts now
+            Path(stamp).touch()
+            return
+        GitService._collecting_stores.add(store)
+        task = asyncio.ensure_future(self.gc_object_store())
+        task.add_done_callback(lambda _: GitService._collecting_stores.discard(store))
+
+    async def gc_object_store(self):
+        """Remove the objects of deleted repositories from the object store of the lecture.
 
-    def go_to_commit(self, commit_hash):
+        The refs of every repository using the store are updated first and the refs of
+        repositories that no longer exist are deleted. Repositories that cannot keep refs in
+        the store (shallow and partial clones) get their own copies of the objects and stop
+        using it. Then `git gc` prunes the objects that are unreachable since longer than
+        `object_store_prune_expire`.
+        """
+        store = self.object_store_path
+        if not os.path.isdir(os.path.join(store, "objects")):
+            return
+        Path(store, OBJECT_STORE_GC_STAMP).touch()
+        # refs added while the repositories are scanned belong to new repositories and are kept
+        refs = await self._object_store_refs(store)
+        loop = asyncio.get_running_loop()
+        repos = await loop.run_in_executor(
+            None, _object_store_users, os.path.dirname(store), os.path.join(store, "objects")
+        )
+        live = set()
+        for path in repos:
+            async with RepoLock.for_path(path).exclusive():
+                try:
+                    if os.path.exists(
+                        os.path.join(path, ".git", "shallow")
+                    ) or await self._is_promisor(path):
+                        self.log.info(f"Copying the shared objects used by {path} into it")
+                        await self._run_command(
+                            ["git", "repack", "-a", "-d", "-q"],
+                            cwd=path,
+                            timeout=self.git_network_timeout,
+                        )
+                        await loop.run_in_executor(None, _remove_alternates, path)
+                        continue
+                    await self._fetch_into_object_store(path, store)
+                except GitError as e:
+                    # keep the refs of a repository that could not be read
+                    self.log.warning(f"Could not update the shared objects of {path}: {e.error}")
+                live.add(self._object_store_key(path))
+        stale = [ref for ref in refs if ref.split("/")[2] not in live]
+        self.log.info(
+            f"Collecting garbage in {store}, deleting {len(stale)} ref(s) of deleted repositories"
+        )
+        await self._delete_object_store_refs(store, stale)
+        await self._run_command(
+            ["git", "gc", "--quiet", f"--prune={self.object_store_prune_expire}"],
+            cwd=store,
+            timeout=self.git_network_timeout,
+        )
+
+    async def _is_promisor(self, path: str) -> bool:
+        try:
+            await self._run_command(
+                ["git", "config", "--get-regexp", r"^remote\..*\.promisor$"],
+                cwd=path,
+                read_only=True,
+                expect_failure=True,
+            )
+        except GitError:
+            return False
+        return True
+
+    @_exclusive
+    async def sync_workspace(
+        self, origin: str, branch: str = "main", commit_hash: Optional[str] = None
+    ) -> bool:
+        """Reset the work tree in place to `commit_hash`, or to the head of `branch` on the
+        remote if no commit is given, discarding all local changes. The remote is only
+        fetched if the commit is missing locally, so an existing work tree is reused.
+
+        Args:
+            origin (str): The remote repository.
+            branch (str): The branch containing the commit. Defaults to "main".
+            commit_hash (str, optional): The commit to check out. Defaults to None.
+
+        Returns:
+            bool: True if the remote was fetched, False if the commit was already present.
+        """
+        await self._link_object_store()
+        if commit_hash is None:
+            commit_hash = await self.remote_branch_commit(origin, branch)
+            if commit_hash is None:
+                raise GitError(
+                    code=404,
+                    error="Remote repository not found. Please ensure your assignment is pushed "
+                    "to the repository before proceeding.",
+                )
+
+        fetched = False
+        if not await self.has_commit(commit_hash):
+            self.log.info(f"Fetching {origin}/{branch} at {self.path}")
+            await self._run_command(
+                self._fetch_command(origin, branch, single_branch=True),
+                cwd=self.path,
+                timeout=self.git_network_timeout,
+            )
+            self._record_fetch(origin)
+            fetched = True
+            if not await self.has_commit(commit_hash) and self.is_shallow():
+                # the commit is older than the latest one, fetch the history of the branch
+                await self._run_command(
+                    ["git", "fetch", "--unshallow", origin, branch],
+                    cwd=self.path,
+                    timeout=self.git_network_timeout,
+                )
+            if not await self.has_commit(commit_hash):
+                raise GitError(code=404, error=f"Commit {commit_hash} not found in {origin}")
+
+        self.log.info(f"Resetting {self.path} to {commit_hash}")
+        await self._run_command(["git", "reset", "--hard", "--quiet", commit_hash], cwd=self.path)
+        await self._run_command(["git", "clean", "-fdx", "--quiet"], cwd=self.path)
+        if fetched:
+            await self._share_objects()
+        return fetched
+
+    async def head_commit(self) -> Optional[str]:
+        """Return the hash of the commit checked out, or None if there is none."""
+        try:
+            head = await self._run_command(
+                ["git", "rev-parse", "--quiet", "--verify", "HEAD"], cwd=self.path, read_only=True
+            )
+        except GitError:
+            return None
+        return head.strip()
+
+    async def has_commit(self, commit_hash: str) -> bool:
+        """Check whether the commit is present in the local repository."""
+        try:
+            await self._run_command(
+                ["git", "cat-file", "-e", f"{commit_hash}^{{commit}}"],
+                cwd=self.path,
+                read_only=True,
+                expect_failure=True,
+            )
+        except GitError:
+            return False
+        return True
+
+    @_exclusive
+    async def reset_index(self):
+        """Unstage all files, so the next commit only contains the files added for it."""
+        await self._run_command(["git", "read-tree", "--empty"], cwd=self.path)
+
+    @_exclusive
+    async def go_to_commit(self, commit_hash):
         self.log.info(f"Show commit with hash {commit_hash}")
-        self._run_command(f"git checkout {commit_hash}", cwd=self.path)
+        await self._run_command(["git", "checkout", commit_hash], cwd=self.path)
 
-    def undo_commit(self, n: int = 1) -> None:
+    @_exclusive
+    async def undo_commit(self, n: int = 1) -> None:
         self.log.info(f"Undoing {n} commit(s)")
-        self._run_command(f"git reset --mixed HEAD~{n}", cwd=self.path)
-        self._run_command("git gc", cwd=self.path)
+        await self._run_command(["git", "reset", "--mixed", f"HEAD~{n}"], cwd=self.path)
+        # gc rewrites all packs, which can take longer than a local command may
+        await self._run_command(["git", "gc"], cwd=self.path, timeout=self.git_network_timeout)
 
-    def revert(self, commit_hash: str):
+    @_exclusive
+    async def revert(self, commit_hash: str):
         """Revert the repository to a previous commit.
         If the commit hash equal the HEAD commit, all local changes will be undone.
         Otherwise, the files will be reset to the specified commit.
@@ -219,14 +842,18 @@ class GitService(Configurable):
             commit_hash (str): The hash of the commit to revert to.
         """
         self.log.info(f"Reverting to {commit_hash}")
-        if commit_hash == self._run_command("git rev-parse HEAD", cwd=self.path).strip():
+        head = await self._run_command(["git", "rev-parse", "HEAD"], cwd=self.path, read_only=True)
+        if commit_hash == head.strip():
             # If the commit hash is the HEAD commit, all local changes will be undone.
-            self._run_command("git reset --hard", cwd=self.path)
+            await self._run_command(["git", "reset", "--hard"], cwd=self.path)
         else:
             # If the commit hash is not the HEAD commit, revert to the specified commit and create a new revert commit.
-            self._run_command(f"git revert --no-commit {commit_hash}..HEAD", cwd=self.path)
-            self._run_command(
-                f'git commit -m "reverting to {commit_hash}" --allow-empty', cwd=self.path
+            await self._run_command(
+                ["git", "revert", "--no-commit", f"{commit_hash}..HEAD"], cwd=self.path
+            )
+            await self._run_command(
+                ["git", "commit", "-m", f"reverting to {commit_hash}", "--allow-empty"],
+                cwd=self.path,
             )
 
     def is_git(self) -> bool:
@@ -237,21 +864,23 @@ class GitService(Configurable):
         """
         return Path(self.path).joinpath(".git").exists()
 
-    def set_author(self, author):
+    @_exclusive
+    async def set_author(self, author):
         # TODO: maybe ask user to specify their own choices
-        self._run_command(f'git config user.name "{author}"', cwd=self.path)
-        self._run_command('git config user.email "sample@mail.com"', cwd=self.path)
+        await self._run_command(["git", "config", "user.name", author], cwd=self.path)
+        await self._run_command(["git", "config", "user.email", "sample@mail.com"], cwd=self.path)
 
-    def clone(self, origin: str, force=False):
+    @_exclusive
+    async def clone(self, origin: str, force=False):
         """Clones the repository
 
         Args:
             origin (str): the remote
             force (bool, optional): states if the operation should be forced. Defaults to False.
         """
-        self.init(force=force)
-        self.set_remote(origin=origin)
-        self.pull(origin=origin, force=force)
+        await self.init(force=force)
+        await self.set_remote(origin=origin)
+        await self.pull(origin=origin, force=force)
 
     def delete_repo_contents(self, include_git=False):
         """Deletes the contents of the git service
@@ -268,67 +897,169 @@ class GitService(Configurable):
                     shutil.rmtree(os.path.join(root, d))
                     self.log.info(f"Deleted {os.path.join(root, d)} from {self.git_root_dir}")
 
-    # Note: dirs_exist_ok was only added in Python 3.8
-    def copy_repo_contents(self, src: str, selected_files: List[str] = None):
-        """copies repo contents from src to the git path
+    def copy_repo_contents(
+        self, src: str, selected_files: List[str] = None, delete: bool = False, link: bool = False
+    ) -> List[str]:
+        """Synchronises the git path with the files in src, like rsync. Files whose size and
+        modification time match the source are skipped, files of the same size are compared
+        by their content hash and only the others are copied, so unchanged files are never
+        rewritten. The content hashes are remembered in a manifest in the .git directory, so
+        an unchanged file is not read again on the next call.
 
         Args:
             src (str): path where the to be copied files reside
             selected_files (List[str], optional): list of files to copy. Defaults to None.
+            delete (bool, optional): states if files that are not in src should be deleted.
+                The .git directory is always kept. Defaults to False.
+            link (bool, optional): states if files may be hardlinked instead of copied, only
+                safe if src is discarded afterwards. Defaults to False.
+
+        Returns:
+            List[str]: the paths of the files that were copied or deleted, relative to the
+            git path
         """
-        ignore = shutil.ignore_patterns(".git", "__pycache__")
         if selected_files:
             self.log.info(f"Copying only selected files from {src} to {self.path}")
-            for item in os.listdir(src):
-                if item in selected_files:
-                    s = os.path.join(src, item)
-                    d = os.path.join(self.path, item)
-                    if os.path.isdir(s):
-                        shutil.copytree(s, d, ignore=ignore)
-                    else:
-                        shutil.copy2(s, d)
         else:
             self.log.info(f"Copying repository contents from {src} to {self.path}")
-            shutil.copytree(src, self.path, ignore=ignore, dirs_exist_ok=True)
+        manifest_path = os.path.join(self.path, ".git", COPY_MANIFEST_FILE)
+        manifest = _load_copy_manifest(manifest_path)
+        ignore = {".git", "__pycache__"}
+        changed = []
+        synced = set()
 
-    def check_remote_status(self, origin: str, branch: str) -> RemoteFileStatus:
-        untracked, added, modified, deleted = self.git_status(hidden_files=False)
-        local_changes = any([untracked, added, modified, deleted])
+        for root, dirs, files in os.walk(src):
+            rel_root = os.path.relpath(root, src)
+            if rel_root == ".":
+                rel_root = ""
+                if selected_files:
+                    dirs[:] = [d for d in dirs if d in selected_files]
+                    files = [f for f in files if f in selected_files]
+            dirs[:] = [d for d in dirs if d not in ignore]
+            dst_root = os.path.join(self.path, rel_root)
+            if rel_root and (os.path.islink(dst_root) or os.path.isfile(dst_root)):
+                # a file is replaced by a directory
+                os.unlink(dst_root)
+                manifest.pop(rel_root, None)
+                changed.append(rel_root)
+            os.makedirs(dst_root, exist_ok=True)
 
-        if self.local_branch_exists(branch):
-            local = self._run_command(f"git rev-parse {branch}", cwd=self.path).strip()
-        else:
-            local = None
-        if self.remote_branch_exists(origin, branch):
-            remote = self._run_command(f"git rev-parse {origin}/{branch}", cwd=self.path).strip()
-        else:
-            return RemoteFileStatus.NO_REMOTE_REPO
+            for name in files:
+                rel_path = os.path.join(rel_root, name)
+                synced.add(rel_path)
+                if _copy_if_changed(
+                    os.path.join(root, name),
+                    os.path.join(self.path, rel_path),
+                    rel_path,
+                    manifest,
+                    link,
+                ):
+                    changed.append(rel_path)
 
-        if local is None and remote:
-            if local_changes:
-                return RemoteFileStatus.DIVERGENT
-            return RemoteFileStatus.PULL_NEEDED
+        if delete:
+            dst_dirs = []
+            for root, dirs, files in os.walk(self.path):
+                rel_root = os.path.relpath(root, self.path)
+                if rel_root == ".":
+                    rel_root = ""
+                    dirs[:] = [d for d in dirs if d != ".git"]
+                for name in files:
+                    rel_path = os.path.join(rel_root, name)
+                    if rel_path not in synced:
+                        os.unlink(os.path.join(root, name))
+                        manifest.pop(rel_path, None)
+                        changed.append(rel_path)
+                dst_dirs.extend(os.path.join(rel_root, d) for d in dirs)
+            # the deepest directories first, so emptied parents are removed too
+            for rel_path in reversed(dst_dirs):
+                path = os.path.join(self.path, rel_path)
+                if os.path.isdir(os.path.join(src, rel_path)):
+                    continue
+                if os.path.islink(path):
+                    os.unlink(path)
+                elif not os.listdir(path):
+                    os.rmdir(path)
 
-        if local == remote:
-            if local_changes:
-                return RemoteFileStatus.PUSH_NEEDED
-            return RemoteFileStatus.UP_TO_DATE
+        for rel_path in list(manifest):
+            if rel_path not in synced and not os.path.exists(os.path.join(self.path, rel_path)):
+                del manifest[rel_path]
+        if os.path.isdir(os.path.join(self.path, ".git")):
+            _save_copy_manifest(manifest_path, manifest)
+        self.log.info(f"Copied or deleted {len(changed)} file(s) in {self.path}")
+        return changed
 
-        base = self._run_command(
-            f"git merge-base {branch} {origin}/{branch}", cwd=self.path
-        ).strip()
+    async def check_remote_status(self, origin: str, branch: str) -> RemoteStatus:
+        """Classify the repository against the already fetched remote branch `origin/branch`.
 
-        if local == base:
-            return RemoteFileStatus.PULL_NEEDED
-        elif remote == base:
-            return RemoteFileStatus.PUSH_NEEDED
+        Local changes and the ahead/behind counts are taken from a single
+        `git status --porcelain=v2 --branch` call, with `origin/branch` passed as the
+        upstream of `branch` on the command line.
+
+        Args:
+            origin (str): The remote name.
+            branch (str): The branch name.
+
+        Returns:
+            RemoteStatus: the status together with the ahead/behind counts
+        """
+        headers, entries = await self.git_status_v2(
+            branch=True,
+            config={
+                f"branch.{branch}.remote": origin,
+                f"branch.{branch}.merge": f"refs/heads/{branch}",
+            },
+        )
+        # hidden files are not considered local changes
+        local_changes = any(path[0] != "." for kind, _, path in entries if kind != "!")
+
+        if headers.get("branch.head") == branch and headers.get("branch.oid") != "(initial)":
+            if "branch.ab" not in headers:
+                # the upstream is only compared if the remote branch exists
+                return RemoteStatus(RemoteFileStatus.NO_REMOTE_REPO)
+            ahead, behind = (abs(int(n)) for n in headers["branch.ab"].split())
         else:
-            return RemoteFileStatus.DIVERGENT
+            # the branch has no commits yet or is not checked out, so git status cannot compare it
+            remote_ref = f"refs/remotes/{origin}/{branch}"
+            try:
+                counts = await self._run_command(
+                    ["git", "rev-list", "--left-right", "--count", f"{branch}...{remote_ref}"],
+                    cwd=self.path,
+                    read_only=True,
+                    expect_failure=True,
+                )
+                ahead, behind = (int(n) for n in counts.split())
+            except GitError:
+                try:
+                    behind = int(
+                        await self._run_command(
+                            ["git", "rev-list", "--count", remote_ref],
+                            cwd=self.path,
+                            read_only=True,
+                            expect_failure=True,
+                        )
+                    )
+                except GitError:
+                    return RemoteStatus(RemoteFileStatus.NO_REMOTE_REPO)
+                if local_changes:
+                    return RemoteStatus(RemoteFileStatus.DIVERGENT, behind=behind)
+                return RemoteStatus(RemoteFileStatus.PULL_NEEDED, behind=behind)
+
+        if ahead and behind:
+            status = RemoteFileStatus.DIVERGENT
+        elif behind:
+            status = RemoteFileStatus.PULL_NEEDED
+        elif ahead or local_changes:
+            status = RemoteFileStatus.PUSH_NEEDED
+        else:
+            status = RemoteFileStatus.UP_TO_DATE
+        return RemoteStatus(status, ahead=ahead, behind=behind)
 
-    def git_status(
+    async def git_status(
         self, hidden_files: bool = False
     ) -> Tuple[List[str], List[str], List[str], List[str]]:
-        files = self._run_command("git status --porcelain", cwd=self.path)
+        files = await self._run_command(
+            ["git", "status", "--porcelain"], cwd=self.path, read_only=True
+        )
         untracked, added, modified, deleted = [], [], [], []
         for line in files.splitlines():
             k, v = line.split(maxsplit=1)
@@ -344,9 +1075,11 @@ class GitService(Configurable):
                 deleted.append(v)
         return untracked, added, modified, deleted
 
-    def check_remote_file_status(self, file_path: str) -> RemoteFileStatus:
-        file_status_list = self._run_command(
-            f"git status --porcelain {file_path}", cwd=self.path
+    async def check_remote_file_status(self, file_path: str) -> RemoteFileStatus:
+        file_status_list = (
+            await self._run_command(
+                ["git", "status", "--porcelain", "--", file_path], cwd=self.path, read_only=True
+            )
         ).split(maxsplit=1)
         # Extract the status character from the list
         if file_status_list:
@@ -360,26 +1093,123 @@ class GitService(Configurable):
         else:
             return RemoteFileStatus.DIVERGENT
 
-    def local_branch_exists(self, branch: str) -> bool:
+    async def check_remote_files_status(self) -> Dict[str, RemoteFileStatus]:
+        """Return the status of every changed file in the repository from a single
+        `git status` call. Files that are not listed are up to date.
+
+        Returns:
+            Dict[str, RemoteFileStatus]: the status of each changed file by its path
+        """
+        _, entries = await self.git_status_v2(untracked_files="all")
+        statuses = {}
+        for kind, xy, path in entries:
+            # renamed files are listed as added in the single file status
+            if kind in {"?", "2"} or xy.replace(".", "") in {"M", "A", "D"}:
+                statuses[path] = RemoteFileStatus.PUSH_NEEDED
+            elif kind != "!":
+                statuses[path] = RemoteFileStatus.DIVERGENT
+        return statuses
+
+    async def git_status_v2(
+        self,
+        branch: bool = False,
+        config: Optional[Dict[str, str]] = None,
+        untracked_files: str = "normal",
+    ) -> Tuple[Dict[str, str], List[Tuple[str, str, str]]]:
+        """Run `git status --porcelain=v2` and parse its output.
+
+        Args:
+            branch (bool): Whether to include the `# branch.*` headers. Defaults to False.
+            config (Dict[str, str], optional): git config values to set for this call only.
+            untracked_files (str): The `--untracked-files` mode. With `normal` an untracked
+                directory is listed as a single entry ending in `/` without walking it,
+                `all` lists every untracked file. Defaults to "normal".
+
+        Returns:
+            Tuple[Dict[str, str], List[Tuple[str, str, str]]]: the branch headers by name
+            (e.g. `branch.ab`) and one `(kind, XY, path)` entry per changed file, where kind is
+            `1` (changed), `2` (renamed/copied), `u` (unmerged), `?` (untracked) or `!` (ignored).
+        """
+        command = ["git"]
+        for key, value in (config or {}).items():
+            command += ["-c", f"{key}={value}"]
+        command += ["status", "--porcelain=v2", "-z", f"--untracked-files={untracked_files}"]
+        if branch:
+            command.append("--branch")
+        output = await self._run_command(command, cwd=self.path, read_only=True)
+
+        headers, entries = {}, []
+        records = iter(output.split("\0"))
+        for record in records:
+            if not record:
+                continue
+            kind = record[0]
+            if kind == "#":
+                name, _, value = record[2:].partition(" ")
+                headers[name] = value
+            elif kind in "?!":
+                entries.append((kind, "", record[2:]))
+            elif kind == "1":
+                fields = record.split(" ", 8)
+                entries.append((kind, fields[1], fields[8]))
+            elif kind == "2":
+                fields = record.split(" ", 9)
+                entries.append((kind, fields[1], fields[9]))
+                next(records, None)  # the original path of the rename
+            elif kind == "u":
+                fields = record.split(" ", 10)
+                entries.append((kind, fields[1], fields[10]))
+        return headers, entries
+
+    async def local_branch_exists(self, branch: str) -> bool:
         try:
-            self._run_command(f"git rev-parse --quiet --verify {branch}", cwd=self.path)
+            await self._run_command(
+                ["git", "rev-parse", "--quiet", "--verify", branch], cwd=self.path, read_only=True
+            )
         except GitError:
             return False
         return True
 
-    def remote_branch_exists(self, origin: str, branch: str) -> bool:
+    async def remote_branch_exists(self, origin: str, branch: str) -> bool:
         try:
-            self._run_command(f"git ls-remote --exit-code {origin} {branch}", cwd=self.path)
+            await self._run_command(
+                ["git", "ls-remote", "--exit-code", origin, branch],
+                cwd=self.path,
+                timeout=self.git_network_timeout,
+                read_only=True,
+            )
         except GitError:
             return False
         return True
 
-    def get_log(self, history_count: int = 10) -> List[Dict[str, str]]:
+    async def remote_branch_commit(self, origin: str, branch: str) -> Optional[str]:
+        """Return the hash of the head of `branch` on the remote, or None if it does not exist.
+        A head looked up within the last `fetch_freshness` seconds is reused."""
+        key = (self._fetch_key(origin), branch)
+        cached = self._remote_heads.get(key)
+        if cached is not None and time.time() - cached[0] < self.fetch_freshness:
+            return cached[1]
+        try:
+            output = await self._run_command(
+                ["git", "ls-remote", "--exit-code", origin, f"refs/heads/{branch}"],
+                cwd=self.path,
+                timeout=self.git_network_timeout,
+                read_only=True,
+            )
+        except GitError:
+            return None
+        if not output.strip():
+            return None
+        head = output.split()[0]
+        GitService._remote_heads[key] = (time.time(), head)
+        return head
+
+    async def get_log(self, history_count: int = 10) -> List[Dict[str, str]]:
         """
         Execute git log command & return the result.
         """
-        cmd = f"git log --pretty=format:%H%n%an%n%at%n%D%n%s -{history_count}"
-        my_output = self._run_command(cmd, cwd=self.path)
+        cmd = ["git", "log", "--pretty=format:%H%n%an%n%at%n%D%n%s", f"-{history_count}"]
+        my_output = await self._run_command(cmd, cwd=self.path, read_only=True)
 
         result = []
         line_array = my_output.splitlines()
@@ -407,8 +1237,7 @@ class GitService(Configurable):
 
         return result
 
-    @property
-    def git_version(self):
+    async def get_git_version(self) -> tuple:
         """Return the git version
 
         Returns:
@@ -416,43 +1245,148 @@ class GitService(Configurable):
         """
         if self._git_version is None:
             try:
-                version = self._run_command("git --version", cwd=self.path)
+                version = await self._run_command(
+                    ["git", "--version"], cwd=self.path, read_only=True
+                )
             except GitError:
                 return tuple()
             version = version.split(" ")[2]
             self._git_version = tuple([int(v) for v in version.split(".")])
         return self._git_version
 
-    def commit(self, message: str = str(datetime.now()), selected_files: List[str] = None):
+    @_exclusive
+    async def commit(self, message: Optional[str] = None, selected_files: List[str] = None):
         """Commit staged changes.
 
         Args:
             message (str): The commit message. Defaults to the current datetime.
             selected_files (List[str]): Specific files to commit. Defaults to None.
         """
+        if message is None:
+            message = str(datetime.now())
         if selected_files:
             for file in selected_files:
-                self._run_command(f"git add {shlex.quote(file)}", cwd=self.path)
+                await self._run_command(["git", "add", "--", file], cwd=self.path)
         else:
-            self._run_command("git add .", cwd=self.path)
+            await self._run_command(["git", "add", "."], cwd=self.path)
 
         self.log.info(f"Committing changes with message: {message}")
-        self._run_command(f'git commit --allow-empty -m "{message}"', cwd=self.path)
+        await self._run_command(["git", "commit", "--allow-empty", "-m", message], cwd=self.path)
+
+    async def _run_command(
+        self,
+        command: List[str],
+        cwd: str,
+        timeout: Optional[float] = None,
+        read_only: bool = False,
+        expect_failure: bool = False,
+        stdin: Optional[str] = None,
+    ) -> str:
+        """Run a git command without blocking the event loop and return its output.
+
+        The command is executed directly (no shell), so arguments never need quoting.
+        If the command exceeds its timeout or the awaiting task is cancelled,
+        the subprocess is killed.
 
-    def _run_command(self, command: str, cwd: str) -> Union[str, None]:
-        """Run a shell command and return the output.
+        Commands run under the lock of the repository in `cwd`: read-only commands share it
+        and identical ones running concurrently are executed only once, all others hold it
+        exclusively.
 
         Args:
-            command (str): The command to run.
+            command (List[str]): The command to run as an argument list.
             cwd (str): The working directory for the command.
+            timeout (float, optional): Timeout in seconds. Defaults to `git_command_timeout`.
+            read_only (bool): Whether the command leaves the repository unchanged.
+                Defaults to False.
+            expect_failure (bool): Whether failing is a normal outcome of the command, which is
+                then only logged at debug level. Defaults to False.
+            stdin (str, optional): Input written to the standard input of the command.
         """
+        if timeout is None:
+            timeout = self.git_command_timeout
+
+        lock = RepoLock.for_path(cwd)
+        if read_only:
+            return await lock.coalesce(
+                (tuple(command), timeout),
+                lambda: self._execute(command, cwd, timeout, expect_failure, stdin),
+            )
+        async with lock.exclusive():
+            return await self._execute(command, cwd, timeout, expect_failure, stdin)
+
+    async def _execute(
+        self,
+        command: List[str],
+        cwd: str,
+        timeout: float,
+        expect_failure: bool = False,
+        stdin: Optional[str] = None,
+    ) -> str:
+        start = time.monotonic()
+        result = "error"
+        try:
+            output = await self._execute_process(command, cwd, timeout, expect_failure, stdin)
+            result = "ok"
+            return output
+        except GitError as e:
+            if e.code == 504:
+                result = "timeout"
+            raise
+        except asyncio.CancelledError:
+            result = "cancelled"
+            raise
+        finally:
+            duration = time.monotonic() - start
+            metrics.GIT_DURATION.labels(metrics.git_command(command), result).observe(duration)
+            timing.record_span("git", duration, metrics.git_command(command))
+
+    async def _execute_process(
+        self,
+        command: List[str],
+        cwd: str,
+        timeout: float,
+        expect_failure: bool = False,
+        stdin: Optional[str] = None,
+    ) -> str:
+        self.log.debug(f"Executing command: {shlex.join(command)} in {cwd}")
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *command,
+                cwd=cwd,
+                stdin=PIPE if stdin is not None else None,
+                stdout=PIPE,
+                stderr=PIPE,
+            )
+        except OSError as e:
+            self.log.error(f"Command could not be started: {e}")
+            raise GitError(code=500, error=str(e))
 
-        self.log.debug(f"Executing command: {command} in {cwd}")
         try:
-            result = subprocess.run(
-                command, shell=True, check=True, cwd=cwd, text=True, capture_output=True
+            stdout, stderr = await asyncio.wait_for(
+                process.communicate(stdin.encode() if stdin is not None else None),
+                timeout=timeout or None,
             )
-            return result.stdout
-        except subprocess.CalledProcessError as e:
-            self.log.error(f"Command failed with error: {e.stderr}")
-            raise GitError(code=e.returncode, error=e.stderr)
+        except asyncio.TimeoutError:
+            self._kill_process(process)
+            await process.wait()
+            self.log.error(f"Command timed out after {timeout}s: {shlex.join(command)}")
+            raise GitError(code=504, error=f"Git command timed out after {timeout} seconds")
+        except asyncio.CancelledError:
+            self._kill_process(process)
+            raise
+
+        if process.returncode != 0:
+            error = stderr.decode("utf-8", errors="replace")
+            if expect_failure:
+                self.log.debug(f"Command {shlex.join(command)} failed with error: {error}")
+            else:
+                self.log.error(f"Command failed with error: {error}")
+            raise GitError(code=process.returncode, error=error)
+        return stdout.decode("utf-8", errors="replace")
+
+    @staticmethod
+    def _kill_process(process: asyncio.subprocess.Process):
+        try:
+            process.kill()
+        except ProcessLookupError:
+            pass
@@ -0,0 +1,125 @@
+# Copyright (c) 2022, TU Wien
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+import asyncio
+import json
+import os
+from typing import Awaitable, Callable, List, Optional
+
+from jupyter_core.paths import jupyter_data_dir
+from traitlets.config.configurable import SingletonConfigurable
+from traitlets.traitlets import Float, Unicode, default
+
+
+class GraderConfigLoader(SingletonConfigurable):
+    """Loads the config of the grader service in the background.
+
+    On startup the last config that was successfully loaded is read from `cache_file`, so
+    the server does not wait for the grader service. The config is then fetched in a
+    background task and refreshed every `refresh_interval` seconds.
+    """
+
+    startup_timeout = Float(
+        5.0,
+        help="Seconds a request for the config waits for the first load from the grader "
+        "service if no cached config is available.",
+    ).tag(config=True)
+    refresh_interval = Float(
+        300.0, help="Seconds between two loads of the config from the grader service."
+    ).tag(config=True)
+    refresh_retry_interval = Float(
+        30.0, help="Seconds after which a failed load of the config is retried."
+    ).tag(config=True)
+    cache_file = Unicode(
+        help="File in which the last successfully loaded config is stored."
+    ).tag(config=True)
+
+    @default("cache_file")
+    def _default_cache_file(self):
+        return os.path.join(jupyter_data_dir(), "grader_labextension", "grader_config.json")
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.values: dict = {}
+        self._listeners: List[Callable[[dict], None]] = []
+        self._attempted: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def add_listener(self, listener: Callable[[dict], None]):
+        """Registers a function that is called with the config whenever it is loaded."""
+        self._listeners.append(listener)
+
+    def load_cache(self) -> bool:
+        """Loads the config stored in `cache_file`. Returns whether one was found."""
+        try:
+            with open(self.cache_file) as f:
+                values = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if not isinstance(values, dict):
+            return False
+        self.log.info(f"Loaded cached grader config from {self.cache_file}")
+        self._update(values)
+        return True
+
+    def start(self, fetch: Callable[[], Awaitable[dict]]) -> asyncio.Task:
+        """Starts loading the config with `fetch` in the background. Must be called from
+        the event loop of the server."""
+        if self._task is None or self._task.done():
+            self._attempted = asyncio.Event()
+            self._task = asyncio.ensure_future(self._refresh_periodically(fetch))
+        return self._task
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    async def get(self) -> dict:
+        """Returns the config, waiting up to `startup_timeout` seconds for the first load if
+        neither a cached nor a loaded config is available yet."""
+        if not self.values and self._attempted is not None:
+            try:
+                await asyncio.wait_for(self._attempted.wait(), self.startup_timeout)
+            except asyncio.TimeoutError:
+                self.log.warning("Grader config is not loaded yet")
+        return self.values
+
+    async def refresh(self, fetch: Callable[[], Awaitable[dict]]) -> bool:
+        """Loads the config once and stores it in `cache_file`. Returns whether it
+        succeeded, on failure the previous config is kept."""
+        try:
+            values = await fetch()
+            if not isinstance(values, dict):
+                raise ValueError(f"expected a JSON object, got {values!r}")
+        except Exception as e:
+            self.log.error(f"Could not load grader config: {e}")
+            return False
+        self._update(values)
+        try:
+            self._write_cache(values)
+        except OSError as e:
+            self.log.warning(f"Could not store grader config in {self.cache_file}: {e}")
+        return True
+
+    async def _refresh_periodically(self, fetch: Callable[[], Awaitable[dict]]):
+        while True:
+            loaded = await self.refresh(fetch)
+            self._attempted.set()
+            if loaded:
+                await asyncio.sleep(self.refresh_interval)
+            else:
+                await asyncio.sleep(self.refresh_retry_interval)
+
+    def _update(self, values: dict):
+        self.values = values
+        for listener in self._listeners:
+            listener(values)
+
+    def _write_cache(self, values: dict):
+        os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+        tmp_path = f"{self.cache_file}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(values, f)
+        os.replace(tmp_path, self.cache_file)
@@ -0,0 +1,116 @@
+# Copyright (c) 2022, TU Wien
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+import asyncio
+import os
+import weakref
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+
+class RepoLock:
+    """Readers-writer lock serializing the git operations on one repository.
+
+    Read-only operations (status, log, fetch, ...) share the lock, while operations that
+    change the repository (commit, push, pull, reset, ...) hold it exclusively. The lock is
+    reentrant for the task holding it, so an exclusive operation may run read-only commands.
+    Waiting writers take precedence over new readers, so a push is not starved by status
+    polls. Identical read commands that are queued or in flight at the same time are
+    executed only once, see `coalesce`.
+    """
+
+    _locks: "weakref.WeakValueDictionary[str, RepoLock]" = weakref.WeakValueDictionary()
+
+    @classmethod
+    def for_path(cls, path: str) -> "RepoLock":
+        """Return the lock of the repository at `path`, creating it if necessary."""
+        path = os.path.realpath(path)
+        lock = cls._locks.get(path)
+        if lock is None:
+            lock = cls()
+            cls._locks[path] = lock
+        return lock
+
+    def __init__(self):
+        self._condition = asyncio.Condition()
+        self._readers: Dict[asyncio.Task, int] = {}
+        self._writer: Optional[asyncio.Task] = None
+        self._waiting_writers = 0
+        self._pending_reads: Dict[Hashable, asyncio.Future] = {}
+
+    @property
+    def locked(self) -> bool:
+        return self._writer is not None or bool(self._readers)
+
+    @asynccontextmanager
+    async def shared(self):
+        task = asyncio.current_task()
+        if self._writer is task or task in self._readers:
+            yield
+            return
+        async with self._condition:
+            await self._condition.wait_for(
+                lambda: self._writer is None and not self._waiting_writers
+            )
+            self._readers[task] = 1
+        try:
+            yield
+        finally:
+            async with self._condition:
+                del self._readers[task]
+                self._condition.notify_all()
+
+    @asynccontextmanager
+    async def exclusive(self):
+        task = asyncio.current_task()
+        if self._writer is task:
+            yield
+            return
+        if task in self._readers:
+            raise RuntimeError("A shared repository lock cannot be upgraded to an exclusive one")
+        async with self._condition:
+            self._waiting_writers += 1
+            try:
+                await self._condition.wait_for(lambda: self._writer is None and not self._readers)
+            finally:
+                self._waiting_writers -= 1
+                # readers blocked by this writer may continue if it was cancelled
+                self._condition.notify_all()
+            self._writer = task
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self._writer = None
+                self._condition.notify_all()
+
+    async def coalesce(self, key: Hashable, operation: Callable[[], Awaitable[Any]]) -> Any:
+        """Run the read-only `operation` while holding the lock shared.
+
+        Calls with the same `key` that arrive while an operation is queued or running wait
+        for and share its result instead of running it again.
+        """
+        if self._writer is asyncio.current_task():
+            return await operation()
+
+        future = self._pending_reads.get(key)
+        if future is None:
+
+            async def _run():
+                async with self.shared():
+                    return await operation()
+
+            future = asyncio.ensure_future(_run())
+            self._pending_reads[key] = future
+
+            def _done(f: asyncio.Future):
+                if self._pending_reads.get(key) is f:
+                    del self._pending_reads[key]
+                if not f.cancelled():
+                    f.exception()
+
+            future.add_done_callback(_done)
+        # shield the shared operation, so a cancelled waiter does not cancel it for the others
+        return await asyncio.shield(future)
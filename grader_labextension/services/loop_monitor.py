@@ -0,0 +1,166 @@
+# Copyright (c) 2022, TU Wien
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from typing import Dict, List, Optional, Tuple
+
+from tornado.web import RequestHandler
+from traitlets.config.configurable import SingletonConfigurable
+from traitlets.traitlets import Bool, Float, Integer
+
+from grader_labextension.registry import HandlerPathRegistry
+from grader_labextension.services import metrics
+
+_PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class BlockingCall:
+    """A code location that blocked the event loop, aggregated over all occurrences."""
+
+    def __init__(self, handler: str, location: str, stack: List[str]):
+        self.handler = handler
+        self.location = location
+        self.stack = stack
+        self.count = 0
+        self.total_lag = 0.0
+        self.max_lag = 0.0
+
+    def add(self, lag: float, stack: List[str]):
+        self.count += 1
+        self.total_lag += lag
+        if lag >= self.max_lag:
+            self.max_lag = lag
+            self.stack = stack
+
+    def to_dict(self) -> dict:
+        return {
+            "handler": self.handler,
+            "location": self.location,
+            "count": self.count,
+            "total_lag": self.total_lag,
+            "max_lag": self.max_lag,
+            "stack": self.stack,
+        }
+
+
+class LoopLagMonitor(SingletonConfigurable):
+    """Watchdog measuring how late the event loop runs scheduled callbacks.
+
+    A coroutine on the loop wakes up every `interval` seconds and records how much later
+    than scheduled it ran. A thread samples the stack of the loop thread while the loop is
+    stalled for more than `threshold` seconds, which shows the blocking call together with
+    the handler it was made from.
+    """
+
+    enabled = Bool(False, help="Whether to monitor the event loop for blocking calls.").tag(
+        config=True
+    )
+    interval = Float(0.1, help="Seconds between two measurements of the event loop lag.").tag(
+        config=True
+    )
+    threshold = Float(0.1, help="Lag in seconds above which the blocking call is recorded.").tag(
+        config=True
+    )
+    max_blocking_calls = Integer(
+        50, help="Maximum number of distinct blocking code locations that are kept."
+    ).tag(config=True)
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.blocking_calls: Dict[Tuple[str, str], BlockingCall] = {}
+        self._loop_thread_id: Optional[int] = None
+        self._last_tick = 0.0
+        self._sample: Optional[Tuple[str, str, List[str]]] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        """Starts the monitor. Must be called from the event loop that is monitored."""
+        if self._task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._last_tick = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.ensure_future(self._measure())
+        threading.Thread(target=self._watch, name="loop-lag-monitor", daemon=True).start()
+        self.log.info(f"Monitoring the event loop for blocking calls over {self.threshold}s")
+
+    def stop(self):
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def worst_offenders(self, limit: int = 10) -> List[dict]:
+        """The blocking calls with the highest total lag."""
+        calls = sorted(self.blocking_calls.values(), key=lambda c: c.total_lag, reverse=True)
+        return [call.to_dict() for call in calls[:limit]]
+
+    async def _measure(self):
+        while True:
+            self._last_tick = time.monotonic()
+            await asyncio.sleep(self.interval)
+            lag = max(time.monotonic() - self._last_tick - self.interval, 0.0)
+            metrics.LOOP_LAG.observe(lag)
+            sample, self._sample = self._sample, None
+            if lag > self.threshold and sample is not None:
+                self._record(lag, *sample)
+
+    def _watch(self):
+        # runs in its own thread, the loop thread is blocked while a sample is taken
+        sampled_tick = None
+        while not self._stopped.wait(self.interval / 2):
+            tick = self._last_tick
+            stalled = time.monotonic() - tick - self.interval
+            if stalled > self.threshold and sampled_tick != tick:
+                frame = sys._current_frames().get(self._loop_thread_id)
+                if frame is not None:
+                    self._sample = self._describe(frame)
+                    sampled_tick = tick
+                del frame
+
+    @staticmethod
+    def _describe(frame) -> Tuple[str, str, List[str]]:
+        """Returns the handler, the innermost code location of the extension and the stack
+        of a blocked frame."""
+        summary = traceback.extract_stack(frame, limit=40)
+        stack = [f"{s.filename}:{s.lineno} in {s.name}" for s in summary]
+        location = stack[-1]
+        for s in reversed(summary):
+            if s.filename.startswith(_PACKAGE_DIR):
+                location = f"{os.path.relpath(s.filename, _PACKAGE_DIR)}:{s.lineno} in {s.name}"
+                break
+        handler = ""
+        while frame is not None:
+            instance = frame.f_locals.get("self")
+            if isinstance(instance, RequestHandler):
+                handler_class = type(instance)
+                handler = (
+                    metrics.route_template(HandlerPathRegistry.get_path(handler_class))
+                    if HandlerPathRegistry.has_path(handler_class)
+                    else handler_class.__name__
+                )
+                break
+            frame = frame.f_back
+        return handler, location, stack
+
+    def _record(self, lag: float, handler: str, location: str, stack: List[str]):
+        self.log.warning(f"Event loop blocked for {lag:.3f}s by {location} ({handler})")
+        key = (handler, location)
+        call = self.blocking_calls.get(key)
+        if call is None:
+            if len(self.blocking_calls) >= self.max_blocking_calls:
+                # make room by forgetting the least significant location
+                least = min(self.blocking_calls, key=lambda k: self.blocking_calls[k].total_lag)
+                del self.blocking_calls[least]
+            call = self.blocking_calls[key] = BlockingCall(handler, location, stack)
+        call.add(lag, stack)
+        metrics.BLOCKING_CALLS.labels(handler, location).inc()
+        metrics.BLOCKING_LAG.labels(handler, location).inc(lag)
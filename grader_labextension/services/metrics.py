@@ -0,0 +1,168 @@
+# Copyright (c) 2022, TU Wien
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+"""Prometheus metrics of the extension, served by the `metrics` handler.
+
+The metrics are kept in their own registry, so they are not mixed with the metrics of the
+Jupyter server.
+"""
+
+import re
+from typing import Callable, Dict, List, Optional
+from urllib.parse import urlparse
+
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+REGISTRY = CollectorRegistry(auto_describe=True)
+
+_LONG_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+UPSTREAM_DURATION = Histogram(
+    "grader_labextension_upstream_request_duration_seconds",
+    "Time the grader service took to answer a request, without the time spent in the queue.",
+    ["method", "endpoint"],
+    registry=REGISTRY,
+)
+UPSTREAM_QUEUE_WAIT = Histogram(
+    "grader_labextension_upstream_queue_wait_seconds",
+    "Time a request to the grader service waited for a free connection.",
+    ["method", "endpoint"],
+    registry=REGISTRY,
+)
+UPSTREAM_REQUESTS = Counter(
+    "grader_labextension_upstream_requests",
+    "Requests to the grader service by status code, 599 for requests without a response.",
+    ["method", "endpoint", "code"],
+    registry=REGISTRY,
+)
+UPSTREAM_BYTES = Counter(
+    "grader_labextension_upstream_bytes",
+    "Bytes sent to and received from the grader service.",
+    ["method", "endpoint", "direction"],
+    registry=REGISTRY,
+)
+UPSTREAM_IN_FLIGHT = Gauge(
+    "grader_labextension_upstream_requests_in_flight",
+    "Requests to the grader service that wait for a connection or for their response.",
+    registry=REGISTRY,
+)
+UPSTREAM_RETRIES = Counter(
+    "grader_labextension_upstream_retries",
+    "Retries of failed requests to the grader service.",
+    ["method", "endpoint"],
+    registry=REGISTRY,
+)
+HANDLER_DURATION = Histogram(
+    "grader_labextension_handler_duration_seconds",
+    "Time the extension took to handle a request.",
+    ["route", "method"],
+    buckets=_LONG_BUCKETS,
+    registry=REGISTRY,
+)
+HANDLER_REQUESTS = Counter(
+    "grader_labextension_handler_requests",
+    "Requests handled by the extension by status code.",
+    ["route", "method", "code"],
+    registry=REGISTRY,
+)
+GIT_DURATION = Histogram(
+    "grader_labextension_git_command_duration_seconds",
+    "Duration of git subprocesses by git command and result.",
+    ["command", "result"],
+    buckets=_LONG_BUCKETS,
+    registry=REGISTRY,
+)
+LOOP_LAG = Histogram(
+    "grader_labextension_event_loop_lag_seconds",
+    "How much later than scheduled the event loop ran a periodic callback.",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+    registry=REGISTRY,
+)
+BLOCKING_CALLS = Counter(
+    "grader_labextension_blocking_calls",
+    "Times the event loop was blocked above the threshold, by handler and code location.",
+    ["handler", "location"],
+    registry=REGISTRY,
+)
+BLOCKING_LAG = Counter(
+    "grader_labextension_blocking_lag_seconds",
+    "Event loop lag caused by blocking calls, by handler and code location.",
+    ["handler", "location"],
+    registry=REGISTRY,
+)
+
+_RESPONSE_CACHE_METRICS = {
+    "entries": (GaugeMetricFamily, "Responses in the upstream response cache."),
+    "bytes": (GaugeMetricFamily, "Total size of the response bodies in the cache."),
+    "hits": (CounterMetricFamily, "Requests answered from the cache or by a revalidation."),
+    "misses": (CounterMetricFamily, "Requests whose response was downloaded and cached."),
+    "revalidations": (CounterMetricFamily, "Stale responses revalidated with the ETag."),
+    "evictions": (CounterMetricFamily, "Responses evicted to stay within the cache limits."),
+    "invalidations": (CounterMetricFamily, "Responses evicted because their data changed."),
+    "coalesced": (CounterMetricFamily, "GET requests that joined an identical request."),
+}
+
+
+class ResponseCacheCollector:
+    """Exports the statistics of the upstream response cache when the registry is scraped.
+    `stats` returns the current statistics or None if there is no cache yet."""
+
+    def __init__(self, stats: Callable[[], Optional[Dict[str, int]]]):
+        self._stats = stats
+
+    def describe(self):
+        return self._families({})
+
+    def collect(self):
+        return self._families(self._stats() or {})
+
+    @staticmethod
+    def _families(stats: Dict[str, int]):
+        families = []
+        for name, (family, documentation) in _RESPONSE_CACHE_METRICS.items():
+            metric = family(f"grader_labextension_response_cache_{name}", documentation)
+            if name in stats:
+                metric.add_metric([], stats[name])
+            families.append(metric)
+        return families
+
+
+_ID_SEGMENT = re.compile(r"^\d+$")
+_HASH_SEGMENT = re.compile(r"^[0-9a-f]{40}$")
+_ROUTE_GROUP = re.compile(r"\(\?P<(\w+)>[^)]*\)")
+
+
+def endpoint_template(url: str) -> str:
+    """Normalises the path of `url` by replacing ids and commit hashes with placeholders,
+    e.g. `/api/lectures/3/assignments/7` becomes `/api/lectures/{id}/assignments/{id}`."""
+    segments = []
+    for segment in urlparse(url).path.split("/"):
+        if _ID_SEGMENT.match(segment):
+            segment = "{id}"
+        elif _HASH_SEGMENT.match(segment):
+            segment = "{hash}"
+        segments.append(segment)
+    return "/".join(segments)
+
+
+def route_template(path: str) -> str:
+    """Turns the path regex of a registered handler into a readable template, e.g.
+    `api\\/lectures\\/(?P<lecture_id>\\d*)\\/?` becomes `api/lectures/{lecture_id}`."""
+    route = _ROUTE_GROUP.sub(r"{\1}", path).replace("\\/", "/")
+    if route.endswith("/?"):
+        route = route[:-2]
+    return route
+
+
+def git_command(command: List[str]) -> str:
+    """The git sub-command of a git command line, e.g. `status` for `git -C repo status`."""
+    arguments = iter(command[1:])
+    for argument in arguments:
+        if argument in ("-c", "-C"):
+            next(arguments, None)
+        elif not argument.startswith("-"):
+            return argument
+    return ""
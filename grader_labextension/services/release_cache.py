@@ -0,0 +1,170 @@
+# Copyright (c) 2022, TU Wien
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+import glob
+import hashlib
+import json
+import logging
+import os
+import shutil
+from importlib.metadata import PackageNotFoundError, version
+from typing import Dict, List, Set
+
+from grader_service.convert.converters.generate_assignment import GenerateAssignment
+
+from grader_labextension.api.models.assignment_settings import AssignmentSettings
+
+MANIFEST_VERSION = 1
+GRADEBOOK_FILE = "gradebook.json"
+
+
+def _file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _notebook_name(path: str) -> str:
+    # the name the converter uses for the output notebook and its gradebook entry
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+class _PartialGenerateAssignment(GenerateAssignment):
+    """GenerateAssignment that only converts the notebooks in `notebook_names`. All other
+    files matching the allowed file patterns are still copied to the output directory."""
+
+    def __init__(self, *args, notebook_names: Set[str], **kwargs):
+        super().__init__(*args, **kwargs)
+        self._notebook_names = notebook_names
+
+    def init_notebooks(self) -> None:
+        super().init_notebooks()
+        self.notebooks = [nb for nb in self.notebooks if _notebook_name(nb) in self._notebook_names]
+
+
+class ReleaseCache:
+    """Persistent cache of the generated release notebooks of one assignment.
+
+    The manifest maps every source notebook to the hash of its content and to its entry in
+    the gradebook. Only notebooks whose content changed since the last generation are
+    converted again, the others are copied from the cache and the gradebook is merged from
+    the cached entries. A change of the converter settings (file pattern, allowed files,
+    `grader_config.py` or the grader service version) invalidates the whole cache.
+    """
+
+    def __init__(self, cache_dir: str, log: logging.Logger = None):
+        self.cache_dir = cache_dir
+        self.manifest_path = os.path.join(cache_dir, "manifest.json")
+        self.notebook_dir = os.path.join(cache_dir, "notebooks")
+        self.log = log or logging.getLogger("releasecache")
+
+    def generate(
+        self, input_dir: str, output_dir: str, file_pattern: str, allowed_files: List[str]
+    ) -> Set[str]:
+        """Generate the release files from `input_dir` into the empty `output_dir`.
+
+        Returns:
+            Set[str]: the names of the notebooks that were converted
+        """
+        settings_key = self._settings_key(input_dir, file_pattern, allowed_files)
+        cached = self._load_manifest(settings_key)
+        sources = {
+            _notebook_name(path): path
+            for path in sorted(glob.glob(os.path.join(input_dir, file_pattern)))
+        }
+        hashes = {name: _file_hash(path) for name, path in sources.items()}
+        changed = {
+            name
+            for name in sources
+            if cached.get(name, {}).get("hash") != hashes[name]
+            or not os.path.exists(self._cached_notebook(name))
+        }
+        self.log.info(
+            f"Converting {len(changed)} notebook(s), reusing {len(sources) - len(changed)} "
+            f"from {self.cache_dir}"
+        )
+
+        generator = _PartialGenerateAssignment(
+            input_dir=input_dir,
+            output_dir=output_dir,
+            file_pattern=file_pattern,
+            assignment_settings=AssignmentSettings(allowed_files=allowed_files),
+            notebook_names=changed,
+        )
+        generator.force = True
+        generator.start()
+
+        gradebook_path = os.path.join(output_dir, GRADEBOOK_FILE)
+        with open(gradebook_path) as f:
+            gradebook = json.load(f)
+        fragments = gradebook.get("notebooks", {})
+        permissions = int(str(generator.permissions), 8)
+
+        os.makedirs(self.notebook_dir, exist_ok=True)
+        # forget the changed notebooks first, so an interrupted update is not reused later
+        self._save_manifest(
+            settings_key, {name: entry for name, entry in cached.items() if name not in changed}
+        )
+        manifest = {}
+        for name in sources:
+            output = os.path.join(output_dir, f"{name}.ipynb")
+            if name in changed:
+                shutil.copyfile(output, self._cached_notebook(name))
+            else:
+                # replaces the unconverted copy of the source notebook
+                shutil.copyfile(self._cached_notebook(name), output)
+                os.chmod(output, permissions)
+                if cached[name]["fragment"] is not None:
+                    fragments[name] = cached[name]["fragment"]
+            manifest[name] = {"hash": hashes[name], "fragment": fragments.get(name)}
+
+        gradebook["notebooks"] = {name: fragments[name] for name in sources if name in fragments}
+        with open(gradebook_path, "w") as f:
+            json.dump(gradebook, f)
+
+        self._prune(set(sources))
+        self._save_manifest(settings_key, manifest)
+        return changed
+
+    def _cached_notebook(self, name: str) -> str:
+        return os.path.join(self.notebook_dir, f"{name}.ipynb")
+
+    @staticmethod
+    def _settings_key(input_dir: str, file_pattern: str, allowed_files: List[str]) -> str:
+        try:
+            converter_version = version("grader-service")
+        except PackageNotFoundError:
+            converter_version = ""
+        digest = hashlib.sha256(
+            json.dumps([MANIFEST_VERSION, converter_version, file_pattern, allowed_files]).encode()
+        )
+        config_path = os.path.join(input_dir, "grader_config.py")
+        if os.path.exists(config_path):
+            digest.update(_file_hash(config_path).encode())
+        return digest.hexdigest()
+
+    def _load_manifest(self, settings_key: str) -> Dict[str, dict]:
+        try:
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if manifest.get("settings") != settings_key:
+            self.log.info("Converter settings changed, regenerating all notebooks")
+            return {}
+        return manifest.get("notebooks", {})
+
+    def _save_manifest(self, settings_key: str, notebooks: Dict[str, dict]):
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"settings": settings_key, "notebooks": notebooks}, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _prune(self, names: Set[str]):
+        for file_name in os.listdir(self.notebook_dir):
+            if _notebook_name(file_name) not in names:
+                os.remove(os.path.join(self.notebook_dir, file_name))
@@ -1,14 +1,39 @@
 import asyncio
 import json
 import os
-from typing import Callable, Dict, Optional, Union
+import random
+import tempfile
+import time
+from typing import Callable, Dict, Hashable, Optional, Union
 from urllib.parse import ParseResultBytes, quote_plus, urlencode, urlparse
 
 from grader_service.errors import APIError
 from tornado.httpclient import AsyncHTTPClient, HTTPError, HTTPRequest, HTTPResponse
-from traitlets import TraitError, Unicode, validate
+from tornado.simple_httpclient import SimpleAsyncHTTPClient
+from traitlets import Bool, Float, Integer, TraitError, Unicode, observe, validate
 from traitlets.config import SingletonConfigurable
 
+from grader_labextension.services import metrics, timing
+from grader_labextension.services.cache import ResourceIndex, ResponseCache, resource_path
+from grader_labextension.services.circuit_breaker import (
+    CircuitBreaker,
+    CircuitOpenError,
+    CircuitState,
+    RetryBudget,
+)
+
+try:
+    import pycurl
+    from tornado.curl_httpclient import CurlAsyncHTTPClient
+except ImportError:
+    pycurl = None
+
+# status codes of failures that are likely to go away, 599 is used by tornado for timeouts
+TRANSIENT_STATUS_CODES = {502, 503, 504, 599}
+# the umask can only be read by replacing it, which is done once instead of for every download
+_UMASK = os.umask(0o022)
+os.umask(_UMASK)
+
 
 class RequestServiceError(Exception):
     def __init__(self, code: int, status_text: str, message: str):
@@ -23,6 +48,59 @@ class RequestServiceError(Exception):
 
 class RequestService(SingletonConfigurable):
     url = Unicode(os.environ.get("GRADER_HOST_URL", "http://127.0.0.1:4010"))
+    cache_enabled = Bool(
+        True, help="Whether GET responses of the grader service are cached in memory."
+    ).tag(config=True)
+    cache_max_entries = Integer(
+        512, help="Maximum number of cached responses before the least recently used is evicted."
+    ).tag(config=True)
+    cache_max_bytes = Integer(
+        32 * 1024 * 1024, help="Maximum total size in bytes of all cached response bodies."
+    ).tag(config=True)
+    cache_default_max_age = Float(
+        0.0,
+        help="Seconds a cached response stays fresh if the grader service does not send a "
+        "Cache-Control max-age. Responses with an ETag are revalidated once they are stale.",
+    ).tag(config=True)
+    coalesce_requests = Bool(
+        True, help="Whether concurrent identical GET requests share a single upstream request."
+    ).tag(config=True)
+    max_clients = Integer(
+        10,
+        help="Maximum number of concurrent requests to the grader service. Further requests "
+        "wait in a queue until a connection is free.",
+    ).tag(config=True)
+    use_curl_client = Bool(
+        True,
+        help="Whether to use the libcurl based HTTP client if pycurl is installed. Unlike the "
+        "simple client it reuses connections to the grader service.",
+    ).tag(config=True)
+    keep_alive = Bool(
+        True,
+        help="Whether connections of the curl client are kept alive and reused between "
+        "requests. Only applies to the curl client, which requires use_curl_client and "
+        "pycurl. The simple client opens a new connection for every request regardless.",
+    ).tag(config=True)
+    circuit_breaker_enabled = Bool(
+        True,
+        help="Whether requests to the grader service fail immediately while it is unavailable, "
+        "instead of waiting for their timeouts or retries.",
+    ).tag(config=True)
+    circuit_failure_threshold = Integer(
+        5, help="Number of consecutive transient failures after which the circuit opens."
+    ).tag(config=True)
+    circuit_reset_timeout = Float(
+        30.0, help="Seconds the circuit stays open before a probe request is let through."
+    ).tag(config=True)
+    retry_budget = Integer(
+        20, help="Maximum number of retries of failed requests within retry_budget_window."
+    ).tag(config=True)
+    retry_budget_window = Float(
+        60.0, help="Length in seconds of the sliding window of the retry budget."
+    ).tag(config=True)
+    retry_max_delay = Float(
+        30.0, help="Upper bound in seconds of the randomized delay before a retry."
+    ).tag(config=True)
 
     def __init__(
         self,
@@ -32,11 +110,138 @@ class RequestService(SingletonConfigurable):
         **kwargs,
     ):
         super().__init__(**kwargs)
-        self.http_client = AsyncHTTPClient(max_clients=10)  # Limit concurrency
+        self._http_client: Optional[AsyncHTTPClient] = None
+        self._http_client_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._circuit_breakers: Dict[str, CircuitBreaker] = {}
+        self._retry_budget: Optional[RetryBudget] = None
         self._service_cookie = None
         self.default_request_timeout = default_request_timeout
         self.default_connect_timeout = default_connect_timeout
         self.max_retries = max_retries
+        self.response_cache = ResponseCache(
+            max_entries=self.cache_max_entries,
+            max_bytes=self.cache_max_bytes,
+            default_max_age=self.cache_default_max_age,
+        )
+        self._in_flight: Dict[Hashable, asyncio.Future] = {}
+        # the in-flight requests by resource, so a write only detaches the affected ones
+        self._in_flight_index = ResourceIndex()
+        self.coalesced_requests = 0
+
+    @observe("cache_max_entries", "cache_max_bytes", "cache_default_max_age")
+    def _update_response_cache(self, change):
+        # the instance is created when the handlers are imported, before the config is loaded
+        response_cache = getattr(self, "response_cache", None)
+        if response_cache is None:
+            return
+        response_cache.resize(self.cache_max_entries, self.cache_max_bytes)
+        response_cache.default_max_age = self.cache_default_max_age
+
+    @property
+    def cache_stats(self) -> Dict[str, int]:
+        """Hit/miss counters and current size of the response cache."""
+        return dict(self.response_cache.stats(), coalesced=self.coalesced_requests)
+
+    @property
+    def http_client(self) -> AsyncHTTPClient:
+        """The HTTP client of the running event loop, created on first use so that it picks up
+        the configured pool settings."""
+        loop = asyncio.get_running_loop()
+        if self._http_client is None or self._http_client_loop is not loop:
+            if self._http_client is not None:
+                self._http_client.close()
+            self._http_client = self._create_http_client()
+            self._http_client_loop = loop
+        return self._http_client
+
+    def _create_http_client(self) -> AsyncHTTPClient:
+        if self.use_curl_client and pycurl is not None:
+            self.log.info(f"Using curl HTTP client with {self.max_clients} connections")
+            return CurlAsyncHTTPClient(
+                force_instance=True,
+                max_clients=self.max_clients,
+                defaults=dict(prepare_curl_callback=self._prepare_curl),
+            )
+        if self.use_curl_client:
+            self.log.info("pycurl is not installed, connections are not kept alive")
+        return SimpleAsyncHTTPClient(force_instance=True, max_clients=self.max_clients)
+
+    def _prepare_curl(self, curl):
+        if self.keep_alive:
+            curl.setopt(pycurl.TCP_KEEPALIVE, 1)
+        else:
+            curl.setopt(pycurl.FORBID_REUSE, 1)
+
+    def circuit_breaker(self, url: str) -> CircuitBreaker:
+        """The circuit breaker of the host of `url`."""
+        host = urlparse(url).netloc
+        breaker = self._circuit_breakers.get(host)
+        if breaker is None:
+            breaker = CircuitBreaker(
+                host,
+                failure_threshold=self.circuit_failure_threshold,
+                reset_timeout=self.circuit_reset_timeout,
+            )
+            self._circuit_breakers[host] = breaker
+        return breaker
+
+    @property
+    def retry_budget_tracker(self) -> RetryBudget:
+        if self._retry_budget is None:
+            self._retry_budget = RetryBudget(self.retry_budget, self.retry_budget_window)
+        return self._retry_budget
+
+    async def _send(self, request: HTTPRequest) -> HTTPResponse:
+        """
+        Sends the request through the connection pool and records its queue wait and
+        upstream time in the metrics. Raises `CircuitOpenError` without sending the request
+        if the circuit of the host is open.
+        """
+        breaker = self.circuit_breaker(request.url) if self.circuit_breaker_enabled else None
+        if breaker is not None:
+            breaker.before_request()
+        start = time.monotonic()
+        response = None
+        metrics.UPSTREAM_IN_FLIGHT.inc()
+        try:
+            response = await self.http_client.fetch(request=request)
+        except HTTPError as e:
+            response = e.response
+            if breaker is not None:
+                if e.code in TRANSIENT_STATUS_CODES:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+            raise
+        except OSError:
+            if breaker is not None:
+                breaker.record_failure()
+            raise
+        else:
+            if breaker is not None:
+                breaker.record_success()
+            return response
+        finally:
+            elapsed = time.monotonic() - start
+            metrics.UPSTREAM_IN_FLIGHT.dec()
+            self._record_metrics(request, response, elapsed)
+
+    @staticmethod
+    def _record_metrics(request: HTTPRequest, response: Optional[HTTPResponse], elapsed: float):
+        labels = (request.method, metrics.endpoint_template(request.url))
+        timing.record_span("upstream", elapsed, " ".join(labels))
+        code = response.code if response is not None else 599
+        metrics.UPSTREAM_REQUESTS.labels(*labels, str(code)).inc()
+        if request.body:
+            metrics.UPSTREAM_BYTES.labels(*labels, "sent").inc(len(request.body))
+        if response is None:
+            return
+        if response.body:
+            metrics.UPSTREAM_BYTES.labels(*labels, "received").inc(len(response.body))
+        if response.request_time is not None:
+            upstream = min(response.request_time, elapsed)
+            metrics.UPSTREAM_DURATION.labels(*labels).observe(upstream)
+            metrics.UPSTREAM_QUEUE_WAIT.labels(*labels).observe(elapsed - upstream)
 
     def get_authorization_header(self):
         auth_token = os.environ.get("GRADER_API_TOKEN")
@@ -60,11 +265,15 @@ class RequestService(SingletonConfigurable):
     ) -> Union[dict, list, HTTPResponse]:
         """
         Make an HTTP request with retry logic for transient errors.
+
+        Retries wait a random delay of up to `retry_delay * backoff_factor ** (attempt - 1)`
+        seconds (full jitter), so that clients do not retry in lockstep. No retries are made
+        while the circuit of the grader service is open or the retry budget is used up.
         """
         attempt = 0
         retries = max_retries or self.max_retries
 
-        while attempt < retries:
+        while True:
             try:
                 return await self.request(
                     method=method,
@@ -76,22 +285,33 @@ class RequestService(SingletonConfigurable):
                     connect_timeout=connect_timeout,
                     response_callback=response_callback,
                 )
-            except (HTTPError, ConnectionRefusedError) as e:
-                if isinstance(e, HTTPError) and e.code not in {502, 503, 504}:
-                    raise  # Re-raise if it's not a retryable HTTP error
+            except RequestServiceError as e:
+                if e.code not in TRANSIENT_STATUS_CODES:
+                    raise  # Re-raise if it's not a retryable error
                 attempt += 1
-                if attempt < retries:
-                    retry_delay_seconds = retry_delay * (backoff_factor ** (attempt - 1))
-                    self.log.warning(
-                        f"Retry {attempt}/{retries} after {retry_delay_seconds}s due to error: {e}"
-                    )
-                    await asyncio.sleep(retry_delay_seconds)
-                else:
+                if attempt >= retries:
                     raise RequestServiceError(
                         503,
                         "Service Unavailable",
                         "Max retries reached. Upstream service unavailable.",
                     )
+                if (
+                    self.circuit_breaker_enabled
+                    and self.circuit_breaker(self.url + endpoint).state == CircuitState.OPEN
+                ):
+                    raise
+                if not self.retry_budget_tracker.try_acquire():
+                    self.log.warning(f"Retry budget exhausted, not retrying: {e}")
+                    raise
+                max_delay = min(self.retry_max_delay, retry_delay * backoff_factor ** (attempt - 1))
+                retry_delay_seconds = random.uniform(0, max_delay)
+                metrics.UPSTREAM_RETRIES.labels(
+                    method, metrics.endpoint_template(self.url + endpoint)
+                ).inc()
+                self.log.warning(
+                    f"Retry {attempt}/{retries} after {retry_delay_seconds:.2f}s due to error: {e}"
+                )
+                await asyncio.sleep(retry_delay_seconds)
 
     async def request(
         self,
@@ -115,6 +335,11 @@ class RequestService(SingletonConfigurable):
         connect_timeout = connect_timeout or self.default_connect_timeout
 
         header = self.prepare_headers(header)
+        request_key = (
+            ResponseCache.key(method, self.url + endpoint, header)
+            if method.upper() == "GET"
+            else None
+        )
 
         if isinstance(body, dict):
             body = json.dumps(body)
@@ -129,7 +354,7 @@ class RequestService(SingletonConfigurable):
         )
 
         try:
-            response: HTTPResponse = await self.http_client.fetch(request=request)
+            response: HTTPResponse = await self._fetch(request, request_key)
             self.log.info(
                 f"Received response with status {response.code} from {response.effective_url}"
             )
@@ -152,13 +377,19 @@ class RequestService(SingletonConfigurable):
 
             return response_data
         except HTTPError as http_error:
-            self.log.error(f"HTTP error occurred: {http_error.response.reason}")
+            # timeouts, e.g. while waiting in the request queue, have no response
+            reason = http_error.response.reason if http_error.response else http_error.message
+            self.log.error(f"HTTP error occurred: {reason}")
             raise RequestServiceError(
                 http_error.code,
                 "Service Error",
-                http_error.response.reason or "An error occurred in the upstream service.",
+                reason or "An error occurred in the upstream service.",
             )
 
+        except CircuitOpenError as e:
+            self.log.warning(str(e))
+            raise RequestServiceError(503, "Service Unavailable", str(e))
+
         except ConnectionRefusedError:
             self.log.error(f"Connection refused for {self.url + endpoint}")
             raise RequestServiceError(
@@ -179,6 +410,190 @@ class RequestService(SingletonConfigurable):
                 500, "Internal Server Error", f"An unexpected error occurred: {str(e)}"
             )
 
+    async def download(
+        self,
+        endpoint: str,
+        file_path: str,
+        header: Dict[str, str] = None,
+        request_timeout: float = None,
+        connect_timeout: float = None,
+        response_callback: Optional[Callable[[HTTPResponse], None]] = None,
+    ) -> int:
+        """
+        Streams the body of a GET request to `file_path` without keeping it in memory.
+        The body is written to a temporary file next to `file_path`, which replaces
+        `file_path` once the download completed, so the file is never partially written.
+        The file gets the permissions of a newly created file, following the umask.
+        Returns the number of bytes written.
+        """
+        if header is None:
+            header = self.get_authorization_header()
+        header = self.prepare_headers(header)
+        url = self.url + endpoint
+        self.log.info(f"Downloading GET {url} to {file_path}")
+
+        directory = os.path.dirname(os.path.abspath(file_path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(
+            dir=directory, prefix=f".{os.path.basename(file_path)}.", suffix=".part"
+        )
+        bytes_written = 0
+
+        def _write_chunk(chunk: bytes):
+            nonlocal bytes_written
+            f.write(chunk)
+            bytes_written += len(chunk)
+
+        request = HTTPRequest(
+            url=url,
+            method="GET",
+            headers=header,
+            request_timeout=request_timeout or self.default_request_timeout,
+            connect_timeout=connect_timeout or self.default_connect_timeout,
+            streaming_callback=_write_chunk,
+        )
+        try:
+            with os.fdopen(fd, "wb") as f:
+                response = await self._send(request)
+            # mkstemp creates the file readable by the owner only
+            os.chmod(tmp_path, 0o666 & ~_UMASK)
+            os.replace(tmp_path, file_path)
+            # the streamed body is not part of the response
+            metrics.UPSTREAM_BYTES.labels("GET", metrics.endpoint_template(url), "received").inc(
+                bytes_written
+            )
+        except HTTPError as http_error:
+            os.unlink(tmp_path)
+            reason = http_error.response.reason if http_error.response else http_error.message
+            self.log.error(f"HTTP error occurred: {reason}")
+            raise RequestServiceError(
+                http_error.code,
+                "Service Error",
+                reason or "An error occurred in the upstream service.",
+            )
+        except CircuitOpenError as e:
+            os.unlink(tmp_path)
+            self.log.warning(str(e))
+            raise RequestServiceError(503, "Service Unavailable", str(e))
+        except ConnectionRefusedError:
+            os.unlink(tmp_path)
+            self.log.error(f"Connection refused for {url}")
+            raise RequestServiceError(
+                502, "Bad Gateway", "Unable to connect to the upstream service."
+            )
+        except APIError as e:
+            os.unlink(tmp_path)
+            self.log.error(f"API error occurred: {e.message}")
+            raise RequestServiceError(
+                e.status_code,
+                "API Error",
+                e.message or "An API error occurred in the upstream service.",
+            )
+        except Exception as e:
+            os.unlink(tmp_path)
+            self.log.error(f"Unexpected error: {e}")
+            raise RequestServiceError(
+                500, "Internal Server Error", f"An unexpected error occurred: {str(e)}"
+            )
+        except BaseException:
+            # cancelled
+            os.unlink(tmp_path)
+            raise
+        self.log.info(
+            f"Received response with status {response.code} from {response.effective_url}, "
+            f"wrote {bytes_written} bytes to {file_path}"
+        )
+        if response_callback:
+            response_callback(response)
+        return bytes_written
+
+    async def _fetch(self, request: HTTPRequest, request_key: Optional[Hashable]) -> HTTPResponse:
+        """
+        Fetches the request. Identical GET requests that are issued while another one is still
+        in flight wait for and share the response of the first one.
+        """
+        if request_key is None:
+            # mutating request: evict affected responses before and after the upstream change,
+            # so no response that was fetched in between stays cached
+            self._invalidate(request.method, request.url)
+            try:
+                return await self._send(request)
+            finally:
+                self._invalidate(request.method, request.url)
+        if not self.coalesce_requests:
+            return await self._fetch_cached(request, request_key)
+
+        in_flight = self._in_flight.get(request_key)
+        if in_flight is not None:
+            self.coalesced_requests += 1
+            self.log.debug(f"Joining in-flight request {request.method} {request.url}")
+            # shield the shared fetch, so a cancelled waiter does not cancel it for the others
+            return await asyncio.shield(in_flight)
+
+        future = asyncio.ensure_future(self._fetch_cached(request, request_key))
+        self._in_flight[request_key] = future
+        self._in_flight_index.add(resource_path(request.url), request_key)
+
+        def _done(f: asyncio.Future):
+            if self._in_flight.get(request_key) is f:
+                del self._in_flight[request_key]
+                self._in_flight_index.remove(resource_path(request.url), request_key)
+            if not f.cancelled():
+                # mark the exception as retrieved in case every waiter was cancelled
+                f.exception()
+
+        future.add_done_callback(_done)
+        return await asyncio.shield(future)
+
+    def invalidate_cache(self, method: str, endpoint: str) -> int:
+        """
+        Evicts the cached responses affected by a mutating `method` request to `endpoint`.
+        Needed for GET endpoints of the grader service that change data (e.g. autograding).
+        """
+        return self._invalidate(method, self.url + endpoint)
+
+    def _invalidate(self, method: str, url: str) -> int:
+        # affected requests that are still in flight may return outdated data and are no
+        # longer joined
+        for key in self._in_flight_index.affected(method, resource_path(url)):
+            self._in_flight.pop(key, None)
+            self._in_flight_index.remove(resource_path(key[1]), key)
+        if not self.cache_enabled:
+            return 0
+        evicted = self.response_cache.invalidate(method, url)
+        if evicted:
+            self.log.debug(f"Invalidated {evicted} cached response(s) for {method} {url}")
+        return evicted
+
+    async def _fetch_cached(self, request: HTTPRequest, cache_key: Hashable) -> HTTPResponse:
+        """
+        Fetches a GET request, serving and revalidating responses from the response cache.
+        """
+        if not self.cache_enabled:
+            return await self._send(request)
+
+        entry = self.response_cache.get(cache_key)
+        if entry is not None and entry.is_fresh():
+            self.response_cache.hits += 1
+            self.log.debug(f"Serving {request.method} {request.url} from cache")
+            return entry.to_response(request)
+
+        if entry is not None and entry.etag:
+            request.headers["If-None-Match"] = entry.etag
+        generation = self.response_cache.generation
+        try:
+            response = await self._send(request)
+        except HTTPError as e:
+            if e.code == 304 and entry is not None:
+                self.response_cache.hits += 1
+                self.log.debug(f"Revalidated cached response for {request.method} {request.url}")
+                self.response_cache.refresh(cache_key, e.response)
+                return entry.to_response(request)
+            raise
+        self.response_cache.misses += 1
+        self.response_cache.store(cache_key, response, generation=generation)
+        return response
+
     def prepare_headers(self, header: Dict[str, str] = None) -> Dict[str, str]:
         """
         Prepares headers by adding service cookie or authorization if available.
@@ -207,3 +622,10 @@ class RequestService(SingletonConfigurable):
         d = {k: v for k, v in params.items() if v is not None}
         query_params: str = urlencode(d, quote_via=quote_plus)
         return "?" + query_params if query_params else ""
+
+
+metrics.REGISTRY.register(
+    metrics.ResponseCacheCollector(
+        lambda: RequestService.instance().cache_stats if RequestService.initialized() else None
+    )
+)
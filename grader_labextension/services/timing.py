@@ -0,0 +1,75 @@
+# Copyright (c) 2022, TU Wien
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+"""Records where the time of a request to the extension was spent, e.g. in upstream
+requests, git commands and notebook conversions. The spans are sent to the client in the
+`Server-Timing` header of the response.
+
+The spans of a request are collected in a context variable, so they are recorded by the
+services without passing the handler around. Tasks started while handling the request
+inherit it.
+"""
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Optional, Tuple
+
+# limits the size of the header for requests that run many commands
+MAX_SPANS = 64
+
+
+class RequestTimings:
+    def __init__(self):
+        self.spans: List[Tuple[str, float, str]] = []
+        self.dropped = 0
+
+    def add(self, name: str, duration: float, description: str = ""):
+        if len(self.spans) >= MAX_SPANS:
+            self.dropped += 1
+            return
+        self.spans.append((name, duration, description))
+
+    def header(self) -> str:
+        """The spans in the `Server-Timing` header format, durations are in milliseconds."""
+        entries = []
+        for name, duration, description in self.spans:
+            entry = f"{name};dur={duration * 1000:.1f}"
+            if description:
+                escaped = description.replace("\\", "\\\\").replace('"', '\\"')
+                entry += f';desc="{escaped}"'
+            entries.append(entry)
+        if self.dropped:
+            entries.append(f'dropped;desc="{self.dropped} more spans"')
+        return ", ".join(entries)
+
+
+_current_timings: ContextVar[Optional[RequestTimings]] = ContextVar(
+    "grader_labextension_request_timings", default=None
+)
+
+
+def start_request() -> RequestTimings:
+    """Starts recording the spans of the request handled in the current context."""
+    timings = RequestTimings()
+    _current_timings.set(timings)
+    return timings
+
+
+def record_span(name: str, duration: float, description: str = ""):
+    """Adds a span to the request handled in the current context, if there is one."""
+    timings = _current_timings.get()
+    if timings is not None:
+        timings.add(name, duration, description)
+
+
+@contextmanager
+def span(name: str, description: str = ""):
+    """Records the time spent in the `with` block as a span of the current request."""
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        record_span(name, time.monotonic() - start, description)
@@ -0,0 +1,156 @@
+# Copyright (c) 2022, TU Wien
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+import asyncio
+import glob
+import os
+import shutil
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from traitlets.config.configurable import SingletonConfigurable
+from traitlets.traitlets import Integer
+
+from grader_labextension.services.locks import RepoLock
+
+
+def _disk_usage(path: str) -> int:
+    """Bytes allocated by the files below `path`, files with several links are counted once."""
+    total = 0
+    seen = set()
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                stat = os.lstat(os.path.join(root, name))
+            except OSError:
+                continue
+            if stat.st_nlink > 1:
+                if (stat.st_dev, stat.st_ino) in seen:
+                    continue
+                seen.add((stat.st_dev, stat.st_ino))
+            total += stat.st_blocks * 512
+    return total
+
+
+class ManualGradingWorkspaces(SingletonConfigurable):
+    """Keeps the manual grading workspaces of submissions between openings.
+
+    A workspace is a git repository in `<lecture>/manualgrade/<assignment>/<submission>`,
+    which is reset in place when the submission is opened again. The time of the last use
+    is stored as the modification time of the workspace directory, so it survives restarts.
+    When the workspaces take up more than `disk_budget` bytes, the least recently used ones
+    are deleted.
+
+    Only the files in the workspace directories count towards the budget. Git objects that a
+    workspace keeps in the shared object store of its lecture (see
+    `GitService.shared_object_store`) are not counted, the caller releases them with
+    `GitService.unshare_objects` for the deleted workspaces returned by `release`, so they are
+    removed by the next garbage collection of the store.
+
+    Workspaces can be prefetched in the background with `prefetch`, so they are already on
+    disk when the submission is opened.
+    """
+
+    disk_budget = Integer(
+        2 * 1024**3,
+        help="Maximum disk space in bytes used by the manual grading workspaces of all "
+        "lectures. The least recently used workspaces are deleted when it is exceeded. "
+        "Objects in the shared git object store of a lecture are not counted. "
+        "Set to 0 to keep all workspaces.",
+    ).tag(config=True)
+    prefetch_concurrency = Integer(
+        2, help="Maximum number of workspaces that are prefetched at the same time."
+    ).tag(config=True)
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        # disk usage of the workspaces by path and the modification time it was computed at
+        self._sizes: Dict[str, Tuple[float, int]] = {}
+        self._prefetches: Dict[str, asyncio.Task] = {}
+        self._prefetch_slots: Optional[asyncio.Semaphore] = None
+
+    @staticmethod
+    def workspace_path(root_dir: str, lecture_code: str, assignment_id: int, sub_id: int) -> str:
+        return os.path.join(root_dir, lecture_code, "manualgrade", str(assignment_id), str(sub_id))
+
+    def workspaces(self, root_dir: str) -> List[str]:
+        return [
+            path
+            for path in glob.glob(os.path.join(glob.escape(root_dir), "*", "manualgrade", "*", "*"))
+            if os.path.isdir(path)
+        ]
+
+    def touch(self, path: str):
+        """Marks the workspace at `path` as used now."""
+        os.utime(path)
+
+    def prefetch(self, path: str, prepare: Callable[[], Awaitable[Any]]) -> asyncio.Task:
+        """Runs `prepare` for the workspace at `path` in a background task, at most
+        `prefetch_concurrency` at a time. The task keeps running if the caller stops waiting
+        for it and a prefetch of the same workspace that is still running is shared."""
+        task = self._prefetches.get(path)
+        if task is None:
+            task = asyncio.ensure_future(self._run_prefetch(prepare))
+            self._prefetches[path] = task
+            task.add_done_callback(lambda _: self._prefetches.pop(path, None))
+        return task
+
+    async def _run_prefetch(self, prepare: Callable[[], Awaitable[Any]]) -> Any:
+        if self._prefetch_slots is None:
+            self._prefetch_slots = asyncio.Semaphore(max(self.prefetch_concurrency, 1))
+        async with self._prefetch_slots:
+            return await prepare()
+
+    async def release(self, root_dir: str, path: str) -> List[str]:
+        """Marks the workspace at `path` as used and deletes the least recently used other
+        workspaces if the disk budget is exceeded. Returns the deleted workspaces."""
+        self.touch(path)
+        if self.disk_budget <= 0:
+            return []
+        loop = asyncio.get_running_loop()
+        usage = await loop.run_in_executor(None, self._usage, root_dir)
+        total = sum(size for _, size in usage)
+        evicted = []
+        for workspace, size in usage:
+            if total <= self.disk_budget:
+                break
+            if workspace == path:
+                continue
+            lock = RepoLock.for_path(workspace)
+            if lock.locked:
+                # still in use by a git operation
+                continue
+            async with lock.exclusive():
+                self.log.info(f"Deleting least recently used grading workspace {workspace}")
+                await loop.run_in_executor(None, shutil.rmtree, workspace, True)
+            self._sizes.pop(workspace, None)
+            total -= size
+            evicted.append(workspace)
+        if total > self.disk_budget:
+            self.log.warning(
+                f"Manual grading workspaces use {total} bytes, more than the budget of "
+                f"{self.disk_budget} bytes"
+            )
+        return evicted
+
+    def _usage(self, root_dir: str) -> List[Tuple[str, int]]:
+        """The workspaces below `root_dir` and their disk usage, least recently used first."""
+        usage = []
+        for path in self.workspaces(root_dir):
+            entry = self._size(path)
+            if entry is not None:
+                usage.append((entry[0], path, entry[1]))
+        usage.sort()
+        return [(path, size) for _, path, size in usage]
+
+    def _size(self, path: str) -> Optional[Tuple[float, int]]:
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return None
+        cached = self._sizes.get(path)
+        # a workspace is touched whenever it is used, so unused ones are only walked once
+        if cached is None or cached[0] != mtime:
+            cached = self._sizes[path] = (mtime, _disk_usage(path))
+        return cached
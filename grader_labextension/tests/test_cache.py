@@ -0,0 +1,208 @@
+from io import BytesIO
+
+from tornado.httpclient import HTTPRequest, HTTPResponse
+from tornado.httputil import HTTPHeaders
+
+from grader_labextension.services.cache import ResourceIndex, ResponseCache, resource_path
+
+BASE = "http://grader/api/lectures"
+
+
+def _index(*urls: str) -> ResourceIndex:
+    index = ResourceIndex()
+    for url in urls:
+        index.add(resource_path(url), url)
+    return index
+
+
+def _response(url: str, body: bytes = b"{}", etag: str = '"1"') -> HTTPResponse:
+    headers = HTTPHeaders({"ETag": etag} if etag else {})
+    return HTTPResponse(HTTPRequest(url), 200, headers=headers, buffer=BytesIO(body))
+
+
+def _store(cache: ResponseCache, url: str, body: bytes = b"{}", **kwargs):
+    return cache.store(ResponseCache.key("GET", url, {}), _response(url, body), **kwargs)
+
+
+def _cached(cache: ResponseCache, url: str) -> bool:
+    return ResponseCache.key("GET", url, {}) in cache
+
+
+def test_submission_change_affects_submission_collections():
+    # Given
+    submission = f"{BASE}/1/assignments/2/submissions/3"
+    affected = [
+        submission,
+        f"{submission}/properties",
+        f"{BASE}/1/assignments/2/submissions",
+        f"{BASE}/1/assignments/2/submissions?filter=latest",
+        f"{BASE}/1/assignments/2/submissions/count",
+        f"{BASE}/1/submissions",
+    ]
+    unaffected = [
+        f"{BASE}/1",
+        f"{BASE}/1/assignments/2",
+        f"{BASE}/1/assignments/2/submissions/4",
+        f"{BASE}/1/assignments/5/submissions/6",
+        f"{BASE}/7/assignments/2/submissions",
+    ]
+    index = _index(*affected, *unaffected)
+
+    # When
+    keys = index.affected("PUT", resource_path(submission))
+
+    # Then
+    assert keys == set(affected)
+
+
+def test_assignment_change_affects_nested_resources():
+    # Given
+    affected = [
+        f"{BASE}/1/assignments/2",
+        f"{BASE}/1/assignments/2/submissions/3",
+        f"{BASE}/1/assignments/2/submissions",
+        f"{BASE}/1/assignments",
+        f"{BASE}/1/assignments?include-submissions=true",
+        f"{BASE}/1/submissions",
+    ]
+    unaffected = [f"{BASE}/1", f"{BASE}/1/assignments/4", f"{BASE}/1/assignments/4/properties"]
+    index = _index(*affected, *unaffected)
+
+    # When
+    keys = index.affected("DELETE", resource_path(f"{BASE}/1/assignments/2"))
+
+    # Then
+    assert keys == set(affected)
+
+
+def test_post_to_collection_only_affects_collection():
+    # Given
+    affected = [f"{BASE}/1/assignments", f"{BASE}/1/assignments?include-submissions=true"]
+    unaffected = [f"{BASE}/1", f"{BASE}/1/assignments/2", f"{BASE}/1/assignments/2/submissions"]
+    index = _index(*affected, *unaffected)
+
+    # When
+    keys = index.affected("POST", resource_path(f"{BASE}/1/assignments"))
+
+    # Then
+    assert keys == set(affected)
+
+
+def test_lecture_change_affects_whole_lecture():
+    # Given
+    affected = [
+        f"{BASE}/1",
+        f"{BASE}/1/assignments",
+        f"{BASE}/1/assignments/2/submissions/3",
+        f"{BASE}",
+        f"{BASE}?complete=true",
+    ]
+    index = _index(*affected, f"{BASE}/4", f"{BASE}/4/assignments")
+
+    # When
+    keys = index.affected("PUT", resource_path(f"{BASE}/1"))
+
+    # Then
+    assert keys == set(affected)
+
+
+def test_removed_keys_are_not_affected():
+    # Given
+    url = f"{BASE}/1/assignments/2"
+    index = _index(url, f"{url}/properties")
+
+    # When
+    index.remove(resource_path(url), url)
+    index.remove(resource_path(f"{url}/properties"), f"{url}/properties")
+
+    # Then
+    assert index.affected("PUT", resource_path(url)) == set()
+
+
+def test_evicts_least_recently_used_by_entries():
+    # Given
+    cache = ResponseCache(max_entries=2, max_bytes=1024)
+    _store(cache, f"{BASE}/1")
+    _store(cache, f"{BASE}/2")
+    cache.get(ResponseCache.key("GET", f"{BASE}/1", {}))
+
+    # When
+    _store(cache, f"{BASE}/3")
+
+    # Then
+    assert _cached(cache, f"{BASE}/1")
+    assert not _cached(cache, f"{BASE}/2")
+    assert _cached(cache, f"{BASE}/3")
+    assert cache.evictions == 1
+    # evicted entries are removed from the index as well
+    assert cache.invalidate("PUT", f"{BASE}/2") == 0
+
+
+def test_evicts_least_recently_used_by_bytes():
+    # Given
+    cache = ResponseCache(max_entries=10, max_bytes=25)
+    _store(cache, f"{BASE}/1", b"a" * 10)
+    _store(cache, f"{BASE}/2", b"b" * 10)
+
+    # When
+    _store(cache, f"{BASE}/3", b"c" * 10)
+
+    # Then
+    assert not _cached(cache, f"{BASE}/1")
+    assert len(cache) == 2
+    assert cache.size == 20
+
+
+def test_does_not_store_body_larger_than_cache():
+    # Given
+    cache = ResponseCache(max_entries=10, max_bytes=5)
+
+    # When
+    entry = _store(cache, f"{BASE}/1", b"a" * 10)
+
+    # Then
+    assert entry is None
+    assert len(cache) == 0
+
+
+def test_does_not_store_response_fetched_before_invalidation():
+    # Given
+    cache = ResponseCache(max_entries=10, max_bytes=1024)
+    generation = cache.generation
+
+    # When
+    cache.invalidate("PUT", f"{BASE}/1/assignments/2")
+    entry = _store(cache, f"{BASE}/1/assignments", generation=generation)
+
+    # Then
+    assert entry is None
+    assert not _cached(cache, f"{BASE}/1/assignments")
+
+
+def test_invalidate_evicts_affected_entries():
+    # Given
+    cache = ResponseCache(max_entries=10, max_bytes=1024)
+    _store(cache, f"{BASE}/1/assignments/2", b"a" * 3)
+    _store(cache, f"{BASE}/1/assignments", b"b" * 4)
+    _store(cache, f"{BASE}/1", b"c" * 5)
+
+    # When
+    evicted = cache.invalidate("PATCH", f"{BASE}/1/assignments/2")
+
+    # Then
+    assert evicted == 2
+    assert len(cache) == 1
+    assert cache.size == 5
+    assert _cached(cache, f"{BASE}/1")
+
+
+def test_response_without_validator_or_max_age_is_not_stored():
+    # Given
+    cache = ResponseCache(max_entries=10, max_bytes=1024)
+    url = f"{BASE}/1"
+
+    # When
+    entry = cache.store(ResponseCache.key("GET", url, {}), _response(url, etag=None))
+
+    # Then
+    assert entry is None
@@ -0,0 +1,197 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from tornado.httpclient import HTTPError, HTTPRequest
+
+from grader_labextension.services import circuit_breaker
+from grader_labextension.services.circuit_breaker import (
+    CircuitBreaker,
+    CircuitOpenError,
+    CircuitState,
+    RetryBudget,
+)
+from grader_labextension.services.request import RequestService, RequestServiceError
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> _Clock:
+    clock = _Clock()
+    monkeypatch.setattr(circuit_breaker, "time", SimpleNamespace(monotonic=clock))
+    return clock
+
+
+def _open_breaker(clock: _Clock) -> CircuitBreaker:
+    breaker = CircuitBreaker("grader", failure_threshold=2, reset_timeout=30.0)
+    breaker.record_failure()
+    breaker.record_failure()
+    return breaker
+
+
+def test_opens_after_consecutive_failures(clock):
+    # Given
+    breaker = CircuitBreaker("grader", failure_threshold=3, reset_timeout=30.0)
+
+    # When
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+
+    # Then
+    assert breaker.state == CircuitState.CLOSED
+    breaker.before_request()
+    breaker.record_failure()
+    assert breaker.state == CircuitState.OPEN
+
+
+def test_open_circuit_rejects_requests(clock):
+    # Given
+    breaker = _open_breaker(clock)
+    clock.now += 10
+
+    # When
+    with pytest.raises(CircuitOpenError) as e:
+        breaker.before_request()
+
+    # Then
+    assert e.value.host == "grader"
+    assert e.value.retry_after == pytest.approx(20.0)
+
+
+def test_half_open_lets_one_probe_through(clock):
+    # Given
+    breaker = _open_breaker(clock)
+    clock.now += 30
+
+    # When
+    breaker.before_request()
+
+    # Then
+    assert breaker.state == CircuitState.HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request()
+
+
+def test_successful_probe_closes_circuit(clock):
+    # Given
+    breaker = _open_breaker(clock)
+    clock.now += 30
+    breaker.before_request()
+
+    # When
+    breaker.record_success()
+
+    # Then
+    assert breaker.state == CircuitState.CLOSED
+    breaker.before_request()
+    breaker.before_request()
+
+
+def test_failed_probe_opens_circuit_again(clock):
+    # Given
+    breaker = _open_breaker(clock)
+    clock.now += 30
+    breaker.before_request()
+
+    # When
+    clock.now += 5
+    breaker.record_failure()
+
+    # Then
+    assert breaker.state == CircuitState.OPEN
+    clock.now += 29
+    assert breaker.state == CircuitState.OPEN
+    clock.now += 1
+    assert breaker.state == CircuitState.HALF_OPEN
+
+
+def test_unfinished_probe_expires(clock):
+    # Given
+    breaker = _open_breaker(clock)
+    clock.now += 30
+    breaker.before_request()
+
+    # When
+    clock.now += 30
+
+    # Then
+    breaker.before_request()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request()
+
+
+def test_retry_budget_is_limited_within_window(clock):
+    # Given
+    budget = RetryBudget(max_retries=2, window=60.0)
+
+    # When
+    acquired = [budget.try_acquire() for _ in range(3)]
+
+    # Then
+    assert acquired == [True, True, False]
+    clock.now += 60
+    assert not budget.try_acquire()
+    clock.now += 1
+    assert [budget.try_acquire() for _ in range(3)] == [True, True, False]
+
+
+class _FailingClient:
+    def __init__(self):
+        self.requests = 0
+
+    async def fetch(self, request: HTTPRequest):
+        self.requests += 1
+        raise HTTPError(503)
+
+    def close(self):
+        pass
+
+
+async def test_retries_stop_when_circuit_opens(monkeypatch):
+    # Given
+    monkeypatch.setenv("GRADER_API_TOKEN", "token")
+    service = RequestService(
+        circuit_failure_threshold=2, retry_max_delay=0.0, max_retries=5, retry_budget=10
+    )
+    client = _FailingClient()
+    service._http_client = client
+    service._http_client_loop = asyncio.get_running_loop()
+
+    # When
+    with pytest.raises(RequestServiceError) as first:
+        await service.request_with_retries("GET", "/api/lectures")
+    with pytest.raises(RequestServiceError) as second:
+        await service.request_with_retries("GET", "/api/lectures")
+
+    # Then
+    assert first.value.code == second.value.code == 503
+    assert client.requests == 2
+    assert service.circuit_breaker(service.url).state == CircuitState.OPEN
+
+
+async def test_retries_stop_when_budget_is_used_up(monkeypatch):
+    # Given
+    monkeypatch.setenv("GRADER_API_TOKEN", "token")
+    service = RequestService(
+        circuit_breaker_enabled=False, retry_max_delay=0.0, max_retries=5, retry_budget=1
+    )
+    client = _FailingClient()
+    service._http_client = client
+    service._http_client_loop = asyncio.get_running_loop()
+
+    # When
+    with pytest.raises(RequestServiceError):
+        await service.request_with_retries("GET", "/api/lectures")
+
+    # Then
+    assert client.requests == 2
@@ -0,0 +1,88 @@
+import asyncio
+import multiprocessing
+import os
+import signal
+
+import pytest
+
+from grader_labextension.services.convert import ConvertService
+
+
+@pytest.fixture
+def service() -> ConvertService:
+    service = ConvertService(max_workers=1)
+    yield service
+    for worker in service._idle:
+        worker.process.kill()
+
+
+async def _new_child(known: set) -> multiprocessing.Process:
+    for _ in range(500):
+        children = [p for p in multiprocessing.active_children() if p.pid not in known]
+        if children:
+            return children[0]
+        await asyncio.sleep(0.01)
+    raise AssertionError("no worker process started")
+
+
+async def test_cancelled_generation_terminates_worker(tmp_path, service):
+    # Given
+    source = tmp_path / "source"
+    source.mkdir()
+    # reading the notebook blocks until the conversion is cancelled
+    os.mkfifo(source / "a.ipynb")
+    known = {p.pid for p in multiprocessing.active_children()}
+    generation = asyncio.ensure_future(
+        service.generate_assignment(
+            str(source), str(tmp_path / "output"), cache_dir=str(tmp_path / "cache")
+        )
+    )
+    worker = await _new_child(known)
+
+    # When
+    generation.cancel()
+
+    # Then
+    with pytest.raises(asyncio.CancelledError):
+        await generation
+    assert not worker.is_alive()
+    assert worker.exitcode == -signal.SIGTERM
+    assert service._idle == []
+    # the slot of the cancelled conversion is free again
+    assert await asyncio.wait_for(service.run(abs, -1), timeout=30) == 1
+
+
+async def test_worker_is_reused(service):
+    # Given
+    assert await service.run(abs, -1) == 1
+    worker = service._idle[0]
+
+    # When
+    result = await service.run(abs, -2)
+
+    # Then
+    assert result == 2
+    assert service._idle == [worker]
+
+
+async def test_conversions_wait_for_free_worker(tmp_path, service):
+    # Given
+    source = tmp_path / "source"
+    source.mkdir()
+    os.mkfifo(source / "a.ipynb")
+    known = {p.pid for p in multiprocessing.active_children()}
+    blocked = asyncio.ensure_future(
+        service.generate_assignment(
+            str(source), str(tmp_path / "output"), cache_dir=str(tmp_path / "cache")
+        )
+    )
+    await _new_child(known)
+
+    # When
+    waiting = asyncio.ensure_future(service.run(abs, -1))
+    await asyncio.sleep(0.1)
+
+    # Then
+    assert not waiting.done()
+    blocked.cancel()
+    assert await asyncio.wait_for(waiting, timeout=30) == 1
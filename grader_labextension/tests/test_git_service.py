@@ -0,0 +1,671 @@
+import asyncio
+import logging
+import os
+import shutil
+import signal
+import subprocess
+
+import pytest
+from grader_service.handlers import GitRepoType
+from traitlets import TraitError
+
+from grader_labextension.services import metrics
+from grader_labextension.services.git import CloneStrategy, GitError, GitService, RemoteFileStatus
+
+
+def _git(cwd, *args: str) -> str:
+    return subprocess.run(
+        ["git", *args], cwd=cwd, check=True, capture_output=True, text=True
+    ).stdout
+
+
+def _commit(cwd, name: str, content: str = "content"):
+    with open(os.path.join(cwd, name), "w") as f:
+        f.write(content)
+    _git(cwd, "add", name)
+    _git(cwd, "commit", "-q", "-m", f"change {name}")
+
+
+@pytest.fixture(autouse=True)
+def git_env(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    monkeypatch.setenv("GIT_CONFIG_NOSYSTEM", "1")
+    for role in ("AUTHOR", "COMMITTER"):
+        monkeypatch.setenv(f"GIT_{role}_NAME", "Tester")
+        monkeypatch.setenv(f"GIT_{role}_EMAIL", "tester@example.com")
+
+
+@pytest.fixture
+def origin(tmp_path) -> str:
+    """A bare repository with one commit on main."""
+    origin = str(tmp_path / "origin.git")
+    _git(tmp_path, "init", "-q", "--bare", "-b", "main", origin)
+    work = str(tmp_path / "upstream")
+    _git(tmp_path, "clone", "-q", origin, work)
+    _git(work, "checkout", "-q", "-b", "main")
+    _commit(work, "a.txt")
+    _git(work, "push", "-q", "origin", "main")
+    return origin
+
+
+@pytest.fixture
+def service(tmp_path, origin) -> GitService:
+    """A clone of `origin` managed by a GitService."""
+    service = GitService(str(tmp_path / "root"), "lecture", 1, GitRepoType.USER)
+    _git(tmp_path, "clone", "-q", origin, service.path)
+    return service
+
+
+def _push_upstream(tmp_path, name: str):
+    _commit(str(tmp_path / "upstream"), name)
+    _git(tmp_path / "upstream", "push", "-q", "origin", "main")
+
+
+async def test_remote_status_up_to_date(service):
+    # When
+    status = await service.check_remote_status("origin", "main")
+
+    # Then
+    assert status.status == RemoteFileStatus.UP_TO_DATE
+    assert (status.ahead, status.behind) == (0, 0)
+
+
+async def test_remote_status_ignores_hidden_files(service):
+    # Given
+    open(os.path.join(service.path, ".hidden"), "w").close()
+
+    # When
+    status = await service.check_remote_status("origin", "main")
+
+    # Then
+    assert status.status == RemoteFileStatus.UP_TO_DATE
+
+
+async def test_remote_status_push_needed_for_untracked_directory(service):
+    # Given
+    os.makedirs(os.path.join(service.path, "new", "nested"))
+    open(os.path.join(service.path, "new", "nested", "b.txt"), "w").close()
+
+    # When
+    status = await service.check_remote_status("origin", "main")
+
+    # Then
+    assert status.status == RemoteFileStatus.PUSH_NEEDED
+
+
+async def test_remote_status_ahead(service):
+    # Given
+    _commit(service.path, "b.txt")
+
+    # When
+    status = await service.check_remote_status("origin", "main")
+
+    # Then
+    assert status.status == RemoteFileStatus.PUSH_NEEDED
+    assert (status.ahead, status.behind) == (1, 0)
+
+
+async def test_remote_status_behind(tmp_path, service):
+    # Given
+    _push_upstream(tmp_path, "b.txt")
+    _git(service.path, "fetch", "-q", "origin")
+
+    # When
+    status = await service.check_remote_status("origin", "main")
+
+    # Then
+    assert status.status == RemoteFileStatus.PULL_NEEDED
+    assert (status.ahead, status.behind) == (0, 1)
+
+
+async def test_remote_status_divergent(tmp_path, service):
+    # Given
+    _push_upstream(tmp_path, "b.txt")
+    _git(service.path, "fetch", "-q", "origin")
+    _commit(service.path, "c.txt")
+
+    # When
+    status = await service.check_remote_status("origin", "main")
+
+    # Then
+    assert status.status == RemoteFileStatus.DIVERGENT
+    assert (status.ahead, status.behind) == (1, 1)
+
+
+async def test_remote_status_of_branch_that_is_not_checked_out(tmp_path, service, caplog):
+    # Given
+    _push_upstream(tmp_path, "b.txt")
+    _git(service.path, "fetch", "-q", "origin")
+    _git(service.path, "checkout", "-q", "--detach")
+
+    # When
+    with caplog.at_level(logging.DEBUG, logger="gitservice"):
+        status = await service.check_remote_status("origin", "main")
+
+    # Then
+    assert status.status == RemoteFileStatus.PULL_NEEDED
+    assert status.behind == 1
+    assert not [r for r in caplog.records if r.levelno >= logging.ERROR]
+
+
+async def test_remote_status_without_local_branch_logs_no_error(tmp_path, caplog):
+    # Given
+    service = GitService(str(tmp_path / "root"), "lecture", 2, GitRepoType.USER)
+    _git(service.path, "init", "-q", "-b", "main")
+
+    # When
+    with caplog.at_level(logging.DEBUG, logger="gitservice"):
+        status = await service.check_remote_status("origin", "main")
+
+    # Then
+    assert status.status == RemoteFileStatus.NO_REMOTE_REPO
+    assert not [r for r in caplog.records if r.levelno >= logging.ERROR]
+
+
+async def test_remote_status_without_remote_branch(service):
+    # When
+    status = await service.check_remote_status("origin", "other")
+
+    # Then
+    assert status.status == RemoteFileStatus.NO_REMOTE_REPO
+
+
+async def test_status_v2_parses_entries(service):
+    # Given
+    _git(service.path, "mv", "a.txt", "renamed file.txt")
+    _commit(service.path, "b.txt")
+    with open(os.path.join(service.path, "b.txt"), "w") as f:
+        f.write("changed")
+    os.makedirs(os.path.join(service.path, "new"))
+    open(os.path.join(service.path, "new", "c.txt"), "w").close()
+
+    # When
+    headers, entries = await service.git_status_v2(branch=True)
+
+    # Then
+    assert headers["branch.head"] == "main"
+    assert headers["branch.ab"] == "+1 -0"
+    assert sorted(entries) == [("1", ".M", "b.txt"), ("?", "", "new/")]
+
+
+async def test_status_v2_lists_untracked_files(service):
+    # Given
+    _git(service.path, "mv", "a.txt", "renamed file.txt")
+    os.makedirs(os.path.join(service.path, "new"))
+    open(os.path.join(service.path, "new", "c.txt"), "w").close()
+
+    # When
+    _, entries = await service.git_status_v2(untracked_files="all")
+
+    # Then
+    assert sorted(entries) == [("2", "R.", "renamed file.txt"), ("?", "", "new/c.txt")]
+
+
+async def test_remote_files_status(service):
+    # Given
+    _commit(service.path, "b.txt")
+    with open(os.path.join(service.path, "b.txt"), "w") as f:
+        f.write("changed")
+    os.makedirs(os.path.join(service.path, "new"))
+    open(os.path.join(service.path, "new", "c.txt"), "w").close()
+
+    # When
+    statuses = await service.check_remote_files_status()
+
+    # Then
+    assert statuses == {
+        "b.txt": RemoteFileStatus.PUSH_NEEDED,
+        "new/c.txt": RemoteFileStatus.PUSH_NEEDED,
+    }
+
+
+def test_object_store_is_disabled_by_default(service):
+    # Then
+    assert not service.shared_object_store
+
+
+async def _shared_clone(tmp_path, origin, assignment_id: int) -> GitService:
+    service = GitService(
+        str(tmp_path / "root"),
+        "lecture",
+        assignment_id,
+        GitRepoType.USER,
+        shared_object_store=True,
+        object_store_prune_expire="now",
+    )
+    _git(tmp_path, "clone", "-q", origin, service.path)
+    await service.pull("origin", "main")
+    return service
+
+
+def _store_refs(service: GitService) -> str:
+    return _git(service.object_store_path, "for-each-ref", "--format=%(refname)")
+
+
+async def test_unshare_objects_deletes_refs(tmp_path, origin):
+    # Given
+    first = await _shared_clone(tmp_path, origin, 1)
+    second = await _shared_clone(tmp_path, origin, 2)
+
+    # When
+    await first.unshare_objects(second.path)
+
+    # Then
+    refs = _store_refs(first)
+    assert first._object_store_key(first.path) in refs
+    assert first._object_store_key(second.path) not in refs
+
+
+async def test_gc_object_store_prunes_objects_of_deleted_repositories(tmp_path, origin):
+    # Given
+    first = await _shared_clone(tmp_path, origin, 1)
+    second = await _shared_clone(tmp_path, origin, 2)
+    _commit(second.path, "b.txt", "only in the second repository")
+    await second.pull("origin", "main")
+    commit = _git(second.path, "rev-parse", "HEAD").strip()
+    _git(first.object_store_path, "cat-file", "-e", commit)
+    shutil.rmtree(second.path)
+
+    # When
+    await first.gc_object_store()
+
+    # Then
+    assert first._object_store_key(second.path) not in _store_refs(first)
+    with pytest.raises(subprocess.CalledProcessError):
+        _git(first.object_store_path, "cat-file", "-e", commit)
+    _git(first.path, "fsck", "--no-progress")
+
+
+async def test_remote_branch_head_is_reused_while_fresh(tmp_path, service):
+    # Given
+    head = await service.remote_branch_commit("origin", "main")
+    _push_upstream(tmp_path, "b.txt")
+
+    # When
+    cached = await service.remote_branch_commit("origin", "main")
+    service.fetch_freshness = 0
+    current = await service.remote_branch_commit("origin", "main")
+
+    # Then
+    assert cached == head
+    assert current != head
+    assert current == _git(tmp_path / "upstream", "rev-parse", "HEAD").strip()
+
+
+async def test_sync_workspace_reuses_present_commit(tmp_path, service, caplog):
+    # Given
+    _push_upstream(tmp_path, "b.txt")
+    with open(os.path.join(service.path, "a.txt"), "w") as f:
+        f.write("changed by the grader")
+
+    # When
+    with caplog.at_level(logging.DEBUG, logger="gitservice"):
+        fetched = await service.sync_workspace("origin", "main")
+        refetched = await service.sync_workspace("origin", "main")
+
+    # Then
+    assert (fetched, refetched) == (True, False)
+    assert os.path.exists(os.path.join(service.path, "b.txt"))
+    with open(os.path.join(service.path, "a.txt")) as f:
+        assert f.read() == "content"
+    assert not [r for r in caplog.records if r.levelno >= logging.ERROR]
+
+
+def _write(path, content: str = "content"):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+
+
+def _read(path) -> str:
+    with open(path) as f:
+        return f.read()
+
+
+def _files(path) -> list:
+    return sorted(
+        os.path.relpath(os.path.join(root, name), path)
+        for root, dirs, files in os.walk(path)
+        if ".git" not in os.path.relpath(root, path).split(os.sep)
+        for name in files
+    )
+
+
+@pytest.fixture
+def release(tmp_path) -> GitService:
+    """An empty repository to copy files into."""
+    service = GitService(str(tmp_path / "root"), "lecture", 1, GitRepoType.RELEASE)
+    _git(service.path, "init", "-q", "-b", "main")
+    return service
+
+
+@pytest.fixture
+def src(tmp_path) -> str:
+    src = tmp_path / "src"
+    _write(src / "a.ipynb", "a")
+    _write(src / "data" / "b.csv", "b")
+    _write(src / "data" / "nested" / "c.csv", "c")
+    return str(src)
+
+
+def test_copy_repo_contents_skips_unchanged_files(src, release):
+    # Given
+    assert release.copy_repo_contents(src) == ["a.ipynb", "data/b.csv", "data/nested/c.csv"]
+    _write(os.path.join(src, "a.ipynb"), "A")
+    # same content, but a different modification time
+    _write(os.path.join(src, "data", "b.csv"), "b")
+
+    # When
+    changed = release.copy_repo_contents(src)
+
+    # Then
+    assert changed == ["a.ipynb"]
+    assert _read(os.path.join(release.path, "a.ipynb")) == "A"
+    assert release.copy_repo_contents(src) == []
+
+
+def test_copy_repo_contents_deletes_removed_files(src, release):
+    # Given
+    release.copy_repo_contents(src)
+    _write(os.path.join(release.path, "extra.txt"))
+    shutil.rmtree(os.path.join(src, "data", "nested"))
+
+    # When
+    changed = release.copy_repo_contents(src, delete=True)
+
+    # Then
+    assert sorted(changed) == ["data/nested/c.csv", "extra.txt"]
+    assert _files(release.path) == ["a.ipynb", "data/b.csv"]
+    assert not os.path.exists(os.path.join(release.path, "data", "nested"))
+    assert os.path.isdir(os.path.join(release.path, ".git"))
+
+
+def test_copy_repo_contents_keeps_files_without_delete(src, release):
+    # Given
+    release.copy_repo_contents(src)
+    os.remove(os.path.join(src, "a.ipynb"))
+
+    # When
+    changed = release.copy_repo_contents(src)
+
+    # Then
+    assert changed == []
+    assert os.path.exists(os.path.join(release.path, "a.ipynb"))
+
+
+def test_copy_repo_contents_renamed_file(src, release):
+    # Given
+    release.copy_repo_contents(src)
+    os.rename(os.path.join(src, "data", "b.csv"), os.path.join(src, "data", "renamed.csv"))
+
+    # When
+    changed = release.copy_repo_contents(src, delete=True)
+
+    # Then
+    assert sorted(changed) == ["data/b.csv", "data/renamed.csv"]
+    assert _files(release.path) == ["a.ipynb", "data/nested/c.csv", "data/renamed.csv"]
+    assert _read(os.path.join(release.path, "data", "renamed.csv")) == "b"
+
+
+def test_copy_repo_contents_file_replaced_by_directory(src, release):
+    # Given
+    release.copy_repo_contents(src)
+    os.remove(os.path.join(src, "a.ipynb"))
+    _write(os.path.join(src, "a.ipynb", "inner.txt"), "inner")
+
+    # When
+    release.copy_repo_contents(src, delete=True)
+
+    # Then
+    assert _read(os.path.join(release.path, "a.ipynb", "inner.txt")) == "inner"
+
+
+def test_copy_repo_contents_selected_files(src, release):
+    # Given
+    _write(os.path.join(release.path, "other.txt"))
+
+    # When
+    changed = release.copy_repo_contents(src, selected_files=["data"], delete=True)
+
+    # Then
+    assert changed == ["data/b.csv", "data/nested/c.csv", "other.txt"]
+    assert _files(release.path) == ["data/b.csv", "data/nested/c.csv"]
+
+
+def test_copy_repo_contents_does_not_modify_linked_files(tmp_path, src, release):
+    # Given
+    release.copy_repo_contents(src, link=True)
+    released = os.path.join(release.path, "a.ipynb")
+    assert os.path.samefile(released, os.path.join(src, "a.ipynb"))
+    newer = tmp_path / "newer"
+    shutil.copytree(src, newer)
+    _write(newer / "a.ipynb", "newer")
+
+    # When
+    release.copy_repo_contents(str(newer), link=True)
+
+    # Then
+    assert _read(released) == "newer"
+    # the file the release was linked to before is replaced, not written to
+    assert _read(os.path.join(src, "a.ipynb")) == "a"
+
+
+def test_copy_repo_contents_without_link_is_independent_of_source(src, release):
+    # Given
+    release.copy_repo_contents(src)
+
+    # When
+    with open(os.path.join(src, "a.ipynb"), "a") as f:
+        f.write(" changed in place")
+
+    # Then
+    assert _read(os.path.join(release.path, "a.ipynb")) == "a"
+
+
+def _is_promisor(path: str) -> bool:
+    result = subprocess.run(
+        ["git", "config", "--get", "remote.origin.promisor"],
+        cwd=path,
+        capture_output=True,
+        text=True,
+    )
+    return result.stdout.strip() == "true"
+
+
+async def _strategy_clone(tmp_path, origin, strategy: CloneStrategy, **kwargs) -> GitService:
+    """A repository pulled from `origin` over file:// with the clone strategy `strategy`."""
+    # partial clones need the remote to allow filters
+    _git(origin, "config", "uploadpack.allowFilter", "true")
+    service = GitService(
+        str(tmp_path / "root"),
+        "lecture",
+        1,
+        GitRepoType.USER,
+        clone_strategies={GitRepoType.USER.value: strategy.value},
+        **kwargs,
+    )
+    await service.init()
+    _git(service.path, "remote", "add", "origin", f"file://{origin}")
+    await service.pull("origin", "main")
+    return service
+
+
+@pytest.mark.parametrize(
+    "strategy, shallow, promisor",
+    [
+        (CloneStrategy.FULL, False, False),
+        (CloneStrategy.SINGLE_BRANCH, False, False),
+        (CloneStrategy.BLOBLESS, False, True),
+        (CloneStrategy.SHALLOW, True, False),
+    ],
+)
+async def test_clone_strategy_pull(tmp_path, origin, strategy, shallow, promisor):
+    # Given
+    _push_upstream(tmp_path, "b.txt")
+    service = await _strategy_clone(tmp_path, origin, strategy)
+
+    # When
+    _push_upstream(tmp_path, "c.txt")
+    await service.pull("origin", "main")
+
+    # Then
+    assert _files(service.path) == ["a.txt", "b.txt", "c.txt"]
+    assert await service.head_commit() == _git(tmp_path / "upstream", "rev-parse", "HEAD").strip()
+    assert service.is_shallow() == shallow
+    assert _is_promisor(service.path) == promisor
+    assert service.clone_strategy == strategy
+
+
+@pytest.mark.parametrize("strategy", list(CloneStrategy))
+async def test_clone_strategy_sync_to_older_commit(tmp_path, origin, strategy):
+    # Given
+    first = _git(tmp_path / "upstream", "rev-parse", "HEAD").strip()
+    _push_upstream(tmp_path, "b.txt")
+    service = await _strategy_clone(tmp_path, origin, strategy)
+
+    # When
+    await service.sync_workspace("origin", "main", commit_hash=first)
+
+    # Then
+    assert await service.head_commit() == first
+    assert _files(service.path) == ["a.txt"]
+    # a shallow clone is deepened to reach the older commit
+    assert not service.is_shallow()
+    _git(service.path, "fsck", "--no-progress", "--connectivity-only")
+
+
+@pytest.mark.parametrize(
+    "strategy, shared",
+    [
+        (CloneStrategy.FULL, True),
+        (CloneStrategy.SINGLE_BRANCH, True),
+        (CloneStrategy.BLOBLESS, False),
+        (CloneStrategy.SHALLOW, False),
+    ],
+)
+async def test_clone_strategy_object_store(tmp_path, origin, strategy, shared):
+    # When
+    service = await _strategy_clone(tmp_path, origin, strategy, shared_object_store=True)
+
+    # Then
+    alternates = os.path.join(service.path, ".git", "objects", "info", "alternates")
+    assert os.path.exists(alternates) == shared
+    key = service._object_store_key(service.path)
+    store_refs = _store_refs(service) if os.path.isdir(service.object_store_path) else ""
+    assert (key in store_refs) == shared
+    _git(service.path, "fsck", "--no-progress", "--connectivity-only")
+
+
+def test_unknown_clone_strategy_is_rejected(tmp_path):
+    # Then
+    with pytest.raises(TraitError):
+        GitService(
+            str(tmp_path / "root"),
+            "lecture",
+            1,
+            GitRepoType.USER,
+            clone_strategies={GitRepoType.USER.value: "sparse"},
+        )
+
+
+@pytest.fixture
+def processes(monkeypatch) -> list:
+    """The processes started by the git service."""
+    processes = []
+    create = asyncio.create_subprocess_exec
+
+    async def record(*args, **kwargs):
+        process = await create(*args, **kwargs)
+        processes.append(process)
+        return process
+
+    monkeypatch.setattr(asyncio, "create_subprocess_exec", record)
+    return processes
+
+
+async def test_command_is_killed_after_timeout(service, processes):
+    # When
+    with pytest.raises(GitError) as e:
+        await service._run_command(["sleep", "10"], cwd=service.path, timeout=0.1)
+
+    # Then
+    assert e.value.code == 504
+    assert processes[0].returncode == -signal.SIGKILL
+
+
+async def test_command_is_killed_when_cancelled(service, processes):
+    # Given
+    task = asyncio.ensure_future(service._run_command(["sleep", "10"], cwd=service.path))
+    for _ in range(100):
+        if processes:
+            break
+        await asyncio.sleep(0.01)
+
+    # When
+    task.cancel()
+
+    # Then
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert await asyncio.wait_for(processes[0].wait(), timeout=5) == -signal.SIGKILL
+
+
+async def test_undo_commit_runs_gc_with_network_timeout(service, monkeypatch):
+    # Given
+    _commit(service.path, "b.txt")
+    service.git_network_timeout = 123
+    calls = _record_timeouts(service, monkeypatch)
+
+    # When
+    await service.undo_commit()
+
+    # Then
+    assert calls == [("reset", service.git_command_timeout), ("gc", 123)]
+    assert _files(service.path) == ["a.txt", "b.txt"]
+
+
+def _record_timeouts(service: GitService, monkeypatch) -> list:
+    calls = []
+    execute = service._execute
+
+    async def record(command, cwd, timeout, *args):
+        calls.append((metrics.git_command(command), timeout))
+        return await execute(command, cwd, timeout, *args)
+
+    monkeypatch.setattr(service, "_execute", record)
+    return calls
+
+
+async def test_sharing_objects_uses_network_timeout(tmp_path, origin, monkeypatch):
+    # Given
+    service = await _shared_clone(tmp_path, origin, 1)
+    service.git_network_timeout = 123
+    calls = _record_timeouts(service, monkeypatch)
+    _commit(service.path, "b.txt")
+
+    # When
+    await service._share_objects()
+
+    # Then
+    assert ("fetch", 123) in calls
+    assert ("repack", 123) in calls
+
+
+async def test_gc_object_store_copies_objects_back_into_partial_clones(
+    tmp_path, origin, monkeypatch
+):
+    # Given
+    service = await _shared_clone(tmp_path, origin, 1)
+    _git(service.path, "config", "remote.origin.promisor", "true")
+    service.git_network_timeout = 123
+    calls = _record_timeouts(service, monkeypatch)
+
+    # When
+    await service.gc_object_store()
+
+    # Then
+    assert ("repack", 123) in calls
+    assert ("gc", 123) in calls
+    assert not os.path.exists(os.path.join(service.path, ".git", "objects", "info", "alternates"))
+    assert service._object_store_key(service.path) not in _store_refs(service)
+    _git(service.path, "fsck", "--no-progress")
@@ -0,0 +1,156 @@
+import asyncio
+import json
+
+import pytest
+from tornado.httpclient import HTTPClientError
+
+from grader_labextension.services.grader_config import GraderConfigLoader
+
+CONFIG = {"default_cell_timeout": 300, "min_cell_timeout": 10, "max_cell_timeout": 3600}
+
+
+@pytest.fixture
+def cache_file(tmp_path) -> str:
+    return str(tmp_path / "grader_config.json")
+
+
+@pytest.fixture
+def loader(cache_file) -> GraderConfigLoader:
+    loader = GraderConfigLoader(cache_file=cache_file, startup_timeout=5.0)
+    yield loader
+    loader.stop()
+
+
+def _write_cache(cache_file: str, values: dict):
+    with open(cache_file, "w") as f:
+        json.dump(values, f)
+
+
+class _Fetch:
+    def __init__(self, values: dict = None, error: Exception = None):
+        self.values = values
+        self.error = error
+        self.calls = 0
+        self.release = asyncio.Event()
+
+    async def __call__(self) -> dict:
+        self.calls += 1
+        await self.release.wait()
+        if self.error is not None:
+            raise self.error
+        return self.values
+
+
+async def test_cached_config_is_used_before_fetch(cache_file, loader):
+    # Given
+    _write_cache(cache_file, CONFIG)
+    updates = []
+    loader.add_listener(updates.append)
+    fetch = _Fetch(values={**CONFIG, "max_cell_timeout": 60})
+
+    # When
+    assert loader.load_cache()
+    loader.start(fetch)
+
+    # Then
+    assert await asyncio.wait_for(loader.get(), timeout=0.5) == CONFIG
+    assert updates == [CONFIG]
+
+
+async def test_config_is_fetched_and_cached_without_cache(cache_file, loader):
+    # Given
+    fetch = _Fetch(values=CONFIG)
+    assert not loader.load_cache()
+
+    # When
+    loader.start(fetch)
+    config = asyncio.ensure_future(loader.get())
+    await asyncio.sleep(0.01)
+    assert not config.done()
+    fetch.release.set()
+
+    # Then
+    assert await config == CONFIG
+    with open(cache_file) as f:
+        assert json.load(f) == CONFIG
+
+
+async def test_failed_fetch_keeps_cached_config(cache_file, loader):
+    # Given
+    _write_cache(cache_file, CONFIG)
+    loader.load_cache()
+    fetch = _Fetch(error=ConnectionRefusedError())
+    fetch.release.set()
+
+    # When
+    loaded = await loader.refresh(fetch)
+
+    # Then
+    assert not loaded
+    assert await loader.get() == CONFIG
+    with open(cache_file) as f:
+        assert json.load(f) == CONFIG
+
+
+async def test_failed_first_fetch_does_not_wait_for_timeout(loader):
+    # Given
+    fetch = _Fetch(error=ConnectionRefusedError())
+    fetch.release.set()
+
+    # When
+    loader.start(fetch)
+
+    # Then
+    assert await asyncio.wait_for(loader.get(), timeout=1.0) == {}
+    assert fetch.calls == 1
+
+
+async def test_invalid_config_is_not_cached(cache_file, loader):
+    # Given
+    fetch = _Fetch(values=["not", "a", "config"])
+    fetch.release.set()
+
+    # When
+    loaded = await loader.refresh(fetch)
+
+    # Then
+    assert not loaded
+    assert loader.values == {}
+    assert not loader.load_cache()
+
+
+@pytest.fixture
+def jp_server_config(jp_server_config, cache_file):
+    # the loader of the server is created when the extension is loaded
+    GraderConfigLoader.clear_instance()
+    yield {
+        **jp_server_config,
+        "GraderConfigLoader": {"cache_file": cache_file, "startup_timeout": 1.0},
+    }
+    if GraderConfigLoader.initialized():
+        GraderConfigLoader.instance().stop()
+    GraderConfigLoader.clear_instance()
+
+
+async def test_config_handler_without_config(jp_fetch):
+    # When
+    with pytest.raises(HTTPClientError) as e:
+        await jp_fetch("grader_labextension", "api", "config")
+
+    # Then
+    assert e.value.code == 503
+
+
+@pytest.fixture
+def cached_config(cache_file):
+    _write_cache(cache_file, CONFIG)
+
+
+async def test_config_handler_with_cached_config(cached_config, jp_fetch):
+    # When
+    response = await jp_fetch("grader_labextension", "api", "config")
+
+    # Then
+    assert response.code == 200
+    data = json.loads(response.body)
+    assert {key: data[key] for key in CONFIG} == CONFIG
@@ -1,4 +1,12 @@
 import json
+from io import BytesIO
+
+import pytest
+from tornado.httpclient import HTTPRequest, HTTPResponse
+from tornado.httputil import HTTPHeaders
+
+from grader_labextension.handlers.base_handler import HandlerConfig
+from grader_labextension.services.request import RequestService
 
 
 async def test_get_example(jp_fetch):
@@ -9,3 +17,59 @@ async def test_get_example(jp_fetch):
     assert response.code == 200
     payload = json.loads(response.body)
     assert payload == {"data": "This is /grader-labextension/get-example endpoint!"}
+
+
+class _Upstream:
+    """Replaces `RequestService._send` and answers every request with `body`."""
+
+    def __init__(self, body: bytes):
+        self.body = body
+        self.requests = []
+
+    async def send(self, request: HTTPRequest) -> HTTPResponse:
+        self.requests.append((request.method, request.url, request.body))
+        headers = HTTPHeaders(
+            {"Content-Type": "application/json", "Cache-Control": "max-age=60, private"}
+        )
+        return HTTPResponse(request, 200, headers=headers, buffer=BytesIO(self.body))
+
+
+@pytest.fixture
+def upstream(monkeypatch) -> _Upstream:
+    upstream = _Upstream(b'{"id": 1, "name": "lecture"}')
+    service = RequestService.instance()
+    monkeypatch.setattr(service, "_send", upstream.send)
+    monkeypatch.setattr(service, "cache_enabled", False)
+    # the token has no valid default when GRADER_API_TOKEN is unset
+    HandlerConfig.instance().grader_api_token = "token"
+    return upstream
+
+
+async def test_proxied_get_forwards_body_and_cache_headers(jp_fetch, upstream):
+    # When
+    response = await jp_fetch("grader_labextension", "api", "lectures", "1")
+
+    # Then
+    assert response.code == 200
+    assert response.body == upstream.body
+    assert response.headers["Content-Type"] == "application/json"
+    assert response.headers["Cache-Control"] == "max-age=60, private"
+    assert [(method, url.endswith("/api/lectures/1")) for method, url, _ in upstream.requests] == [
+        ("GET", True)
+    ]
+
+
+async def test_proxied_put_does_not_forward_cache_headers(jp_fetch, upstream):
+    # When
+    response = await jp_fetch(
+        "grader_labextension", "api", "lectures", "1", method="PUT", body='{"name": "renamed"}'
+    )
+
+    # Then
+    assert response.code == 200
+    assert response.body == upstream.body
+    assert response.headers["Content-Type"] == "application/json"
+    assert "max-age=60" not in response.headers.get("Cache-Control", "")
+    method, url, body = upstream.requests[0]
+    assert method == "PUT"
+    assert json.loads(body) == {"name": "renamed"}
@@ -0,0 +1,36 @@
+import json
+import os
+
+import pytest
+
+from grader_labextension.handlers.lectures import _csv_to_ndjson
+
+
+def test_csv_to_ndjson(tmp_path):
+    # Given
+    csv_path = tmp_path / "grades.csv"
+    csv_path.write_text("username,task 1,task 2\n007,1.5,-\nalice,nan,2\n", encoding="utf-8")
+
+    # When
+    _csv_to_ndjson(str(csv_path), str(tmp_path / "grades.ndjson"))
+
+    # Then
+    lines = (tmp_path / "grades.ndjson").read_text(encoding="utf-8").splitlines()
+    assert [json.loads(line) for line in lines] == [
+        {"username": "007", "task 1": 1.5, "task 2": "-"},
+        {"username": "alice", "task 1": "nan", "task 2": 2.0},
+    ]
+    assert sorted(os.listdir(tmp_path)) == ["grades.csv", "grades.ndjson"]
+
+
+def test_failed_conversion_leaves_no_partial_file(tmp_path):
+    # Given
+    csv_path = tmp_path / "grades.csv"
+    csv_path.write_bytes(b"username,task\n" + b"alice,1\n" * 1000 + b"\xff\xfe,2\n")
+
+    # When
+    with pytest.raises(UnicodeDecodeError):
+        _csv_to_ndjson(str(csv_path), str(tmp_path / "grades.ndjson"))
+
+    # Then
+    assert os.listdir(tmp_path) == ["grades.csv"]
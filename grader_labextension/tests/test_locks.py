@@ -0,0 +1,223 @@
+import asyncio
+from typing import Callable, List
+
+import pytest
+
+from grader_labextension.services.locks import RepoLock
+
+
+async def _until(condition: Callable[[], bool]):
+    for _ in range(100):
+        if condition():
+            return
+        await asyncio.sleep(0)
+    raise AssertionError("condition not reached")
+
+
+async def _hold(lock_context, events: List[str], name: str, release: asyncio.Event):
+    async with lock_context:
+        events.append(f"{name} acquired")
+        await release.wait()
+    events.append(f"{name} released")
+
+
+def test_for_path_returns_same_lock(tmp_path):
+    # Given
+    (tmp_path / "repo").mkdir()
+
+    # When
+    lock = RepoLock.for_path(str(tmp_path / "repo"))
+
+    # Then
+    assert RepoLock.for_path(str(tmp_path / "other" / ".." / "repo")) is lock
+    assert RepoLock.for_path(str(tmp_path)) is not lock
+
+
+async def test_readers_share_lock():
+    # Given
+    lock = RepoLock()
+    events, release = [], asyncio.Event()
+
+    # When
+    readers = [asyncio.ensure_future(_hold(lock.shared(), events, name, release)) for name in "ab"]
+    await _until(lambda: len(events) == 2)
+
+    # Then
+    assert lock.locked
+    release.set()
+    await asyncio.gather(*readers)
+    assert not lock.locked
+
+
+async def test_writer_is_not_starved_by_readers():
+    # Given
+    lock = RepoLock()
+    events = []
+    release_reader, release_writer, release_late = asyncio.Event(), asyncio.Event(), asyncio.Event()
+    reader = asyncio.ensure_future(_hold(lock.shared(), events, "reader", release_reader))
+    await _until(lambda: events == ["reader acquired"])
+    writer = asyncio.ensure_future(_hold(lock.exclusive(), events, "writer", release_writer))
+    await _until(lambda: lock._waiting_writers == 1)
+
+    # When
+    late_reader = asyncio.ensure_future(_hold(lock.shared(), events, "late", release_late))
+    await asyncio.sleep(0.01)
+    release_reader.set()
+    await _until(lambda: "writer acquired" in events)
+    await asyncio.sleep(0.01)
+
+    # Then
+    assert "late acquired" not in events
+    release_writer.set()
+    release_late.set()
+    await asyncio.gather(reader, writer, late_reader)
+    assert events.index("writer released") < events.index("late acquired")
+
+
+async def test_cancelled_writer_releases_blocked_readers():
+    # Given
+    lock = RepoLock()
+    events = []
+    release = asyncio.Event()
+    reader = asyncio.ensure_future(_hold(lock.shared(), events, "reader", release))
+    await _until(lambda: events == ["reader acquired"])
+    writer = asyncio.ensure_future(_hold(lock.exclusive(), events, "writer", release))
+    await _until(lambda: lock._waiting_writers == 1)
+    late_reader = asyncio.ensure_future(_hold(lock.shared(), events, "late", release))
+    await asyncio.sleep(0.01)
+    assert "late acquired" not in events
+
+    # When
+    writer.cancel()
+
+    # Then
+    await _until(lambda: "late acquired" in events)
+    assert "reader released" not in events
+    assert lock._waiting_writers == 0
+    release.set()
+    await asyncio.gather(reader, late_reader)
+    with pytest.raises(asyncio.CancelledError):
+        await writer
+    assert not lock.locked
+
+
+async def test_shared_lock_cannot_be_upgraded():
+    # Given
+    lock = RepoLock()
+
+    # When
+    async with lock.shared():
+        with pytest.raises(RuntimeError):
+            async with lock.exclusive():
+                pass
+
+    # Then
+    assert not lock.locked
+
+
+async def test_exclusive_lock_is_reentrant():
+    # Given
+    lock = RepoLock()
+    calls = []
+
+    async def read():
+        calls.append("read")
+        return "result"
+
+    # When
+    async with lock.exclusive():
+        async with lock.exclusive():
+            async with lock.shared():
+                result = await lock.coalesce("key", read)
+
+    # Then
+    assert result == "result"
+    assert calls == ["read"]
+    assert not lock.locked
+
+
+async def test_identical_reads_are_coalesced():
+    # Given
+    lock = RepoLock()
+    release = asyncio.Event()
+    calls = []
+
+    async def read():
+        calls.append("read")
+        await release.wait()
+        return len(calls)
+
+    # When
+    waiters = [asyncio.ensure_future(lock.coalesce("key", read)) for _ in range(3)]
+    other = asyncio.ensure_future(lock.coalesce("other", read))
+    await _until(lambda: len(calls) == 2)
+    release.set()
+
+    # Then
+    assert await asyncio.gather(*waiters) == [2, 2, 2]
+    assert await other == 2
+    assert calls == ["read", "read"]
+
+
+async def test_cancelled_waiter_does_not_cancel_coalesced_read():
+    # Given
+    lock = RepoLock()
+    release = asyncio.Event()
+    calls = []
+
+    async def read():
+        calls.append("read")
+        await release.wait()
+        return "result"
+
+    first = asyncio.ensure_future(lock.coalesce("key", read))
+    second = asyncio.ensure_future(lock.coalesce("key", read))
+    await _until(lambda: calls)
+
+    # When
+    first.cancel()
+    await asyncio.sleep(0)
+    release.set()
+
+    # Then
+    assert await second == "result"
+    assert first.cancelled()
+    assert calls == ["read"]
+
+
+async def test_read_after_completed_read_runs_again():
+    # Given
+    lock = RepoLock()
+    calls = []
+
+    async def read():
+        calls.append("read")
+        return len(calls)
+
+    # When
+    first = await lock.coalesce("key", read)
+    second = await lock.coalesce("key", read)
+
+    # Then
+    assert (first, second) == (1, 2)
+
+
+async def test_coalesced_read_waits_for_writer():
+    # Given
+    lock = RepoLock()
+    events = []
+    release = asyncio.Event()
+    writer = asyncio.ensure_future(_hold(lock.exclusive(), events, "writer", release))
+    await _until(lambda: events == ["writer acquired"])
+
+    async def read():
+        events.append("read")
+
+    # When
+    reader = asyncio.ensure_future(lock.coalesce("key", read))
+    await asyncio.sleep(0.01)
+    release.set()
+    await asyncio.gather(writer, reader)
+
+    # Then
+    assert events == ["writer acquired", "writer released", "read"]
@@ -0,0 +1,142 @@
+import json
+import os
+
+import nbformat
+import pytest
+from nbformat.v4 import new_code_cell, new_markdown_cell, new_notebook
+
+from grader_labextension.services.release_cache import ReleaseCache
+
+
+def _notebook(path, solution: str, points: int = 1):
+    cell = new_code_cell(f"### BEGIN SOLUTION\n{solution}\n### END SOLUTION")
+    cell.metadata["nbgrader"] = {
+        "grade": True,
+        "grade_id": "task",
+        "locked": False,
+        "points": points,
+        "schema_version": 3,
+        "solution": True,
+        "task": False,
+    }
+    notebook = new_notebook()
+    notebook.cells = [new_markdown_cell("# Exercise"), cell]
+    nbformat.write(notebook, str(path))
+
+
+def _read(path) -> str:
+    with open(path) as f:
+        return f.read()
+
+
+def _gradebook(output_dir) -> dict:
+    with open(os.path.join(output_dir, "gradebook.json")) as f:
+        return json.load(f)["notebooks"]
+
+
+@pytest.fixture
+def source(tmp_path):
+    source = tmp_path / "source"
+    source.mkdir()
+    _notebook(source / "a.ipynb", "x = 1")
+    _notebook(source / "b.ipynb", "y = 2", points=2)
+    (source / "data.txt").write_text("data")
+    return source
+
+
+@pytest.fixture
+def cache(tmp_path) -> ReleaseCache:
+    return ReleaseCache(str(tmp_path / "cache"))
+
+
+def _generate(cache: ReleaseCache, source, output, allowed_files=("*",)):
+    output.mkdir()
+    return cache.generate(str(source), str(output), "*.ipynb", list(allowed_files))
+
+
+def test_unchanged_notebooks_are_reused(tmp_path, source, cache):
+    # Given
+    assert _generate(cache, source, tmp_path / "first") == {"a", "b"}
+
+    # When
+    converted = _generate(cache, source, tmp_path / "second")
+
+    # Then
+    assert converted == set()
+    assert sorted(os.listdir(tmp_path / "second")) == sorted(os.listdir(tmp_path / "first"))
+    for name in ("a.ipynb", "b.ipynb", "data.txt"):
+        assert _read(tmp_path / "second" / name) == _read(tmp_path / "first" / name)
+    assert _gradebook(tmp_path / "second") == _gradebook(tmp_path / "first")
+    assert "x = 1" not in _read(tmp_path / "second" / "a.ipynb")
+
+
+def test_only_changed_notebook_is_converted(tmp_path, source, cache):
+    # Given
+    _generate(cache, source, tmp_path / "first")
+    _notebook(source / "b.ipynb", "y = 3", points=5)
+
+    # When
+    converted = _generate(cache, source, tmp_path / "second")
+
+    # Then
+    assert converted == {"b"}
+    assert _read(tmp_path / "second" / "a.ipynb") == _read(tmp_path / "first" / "a.ipynb")
+    gradebook = _gradebook(tmp_path / "second")
+    assert gradebook["a"] == _gradebook(tmp_path / "first")["a"]
+    assert gradebook["b"]["grade_cells_dict"]["task"]["max_score"] == 5
+
+
+def test_removed_notebook_is_dropped(tmp_path, source, cache):
+    # Given
+    _generate(cache, source, tmp_path / "first")
+    os.remove(source / "b.ipynb")
+
+    # When
+    converted = _generate(cache, source, tmp_path / "second")
+
+    # Then
+    assert converted == set()
+    assert not (tmp_path / "second" / "b.ipynb").exists()
+    assert set(_gradebook(tmp_path / "second")) == {"a"}
+    assert os.listdir(cache.notebook_dir) == ["a.ipynb"]
+
+
+def test_missing_cached_notebook_is_converted(tmp_path, source, cache):
+    # Given
+    _generate(cache, source, tmp_path / "first")
+    os.remove(os.path.join(cache.notebook_dir, "a.ipynb"))
+
+    # When
+    converted = _generate(cache, source, tmp_path / "second")
+
+    # Then
+    assert converted == {"a"}
+    assert set(_gradebook(tmp_path / "second")) == {"a", "b"}
+
+
+def test_settings_change_converts_all_notebooks(tmp_path, source, cache):
+    # Given
+    _generate(cache, source, tmp_path / "first")
+
+    # When
+    with_other_files = _generate(cache, source, tmp_path / "second", ["*.ipynb"])
+    (source / "grader_config.py").write_text("# converter settings\n")
+    with_config = _generate(cache, source, tmp_path / "third", ["*.ipynb"])
+
+    # Then
+    assert with_other_files == {"a", "b"}
+    assert not (tmp_path / "second" / "data.txt").exists()
+    assert with_config == {"a", "b"}
+
+
+def test_corrupt_manifest_converts_all_notebooks(tmp_path, source, cache):
+    # Given
+    _generate(cache, source, tmp_path / "first")
+    with open(cache.manifest_path, "w") as f:
+        f.write("{")
+
+    # When
+    converted = _generate(cache, source, tmp_path / "second")
+
+    # Then
+    assert converted == {"a", "b"}
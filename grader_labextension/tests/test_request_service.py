@@ -0,0 +1,248 @@
+import asyncio
+import os
+import socket
+import stat
+from io import BytesIO
+from typing import Callable
+
+import pytest
+from grader_service.errors import APIError
+from prometheus_client import generate_latest
+from tornado.httpclient import HTTPError, HTTPRequest, HTTPResponse
+from tornado.httputil import HTTPHeaders
+from traitlets.config import Config
+
+from grader_labextension.services import request as request_service
+from grader_labextension.services.cache import ResponseCache
+from grader_labextension.services.metrics import REGISTRY
+from grader_labextension.services.request import RequestService, RequestServiceError
+
+URL = "http://grader/api/lectures/1"
+
+
+def _response(url: str, body: bytes = b"{}") -> HTTPResponse:
+    return HTTPResponse(
+        HTTPRequest(url),
+        200,
+        headers=HTTPHeaders({"Content-Type": "application/json", "ETag": '"1"'}),
+        buffer=BytesIO(body),
+    )
+
+
+def test_cache_config_applied_after_instantiation():
+    # Given
+    service = RequestService()
+    for i in range(3):
+        url = f"{URL}/assignments/{i}"
+        service.response_cache.store(ResponseCache.key("GET", url, {}), _response(url, b"x" * 10))
+
+    # When
+    service.update_config(
+        Config(
+            RequestService=dict(cache_max_entries=2, cache_max_bytes=15, cache_default_max_age=30.0)
+        )
+    )
+
+    # Then
+    assert service.response_cache.max_entries == 2
+    assert service.response_cache.max_bytes == 15
+    assert service.response_cache.default_max_age == 30.0
+    assert len(service.response_cache) == 1
+    assert ResponseCache.key("GET", f"{URL}/assignments/2", {}) in service.response_cache
+
+
+def test_cache_config_from_constructor():
+    # When
+    service = RequestService(config=Config(RequestService=dict(cache_max_entries=7)))
+
+    # Then
+    assert service.response_cache.max_entries == 7
+
+
+def test_cache_stats_exported_as_metrics():
+    # Given
+    service = RequestService.instance()
+    service.response_cache.store(ResponseCache.key("GET", URL, {}), _response(URL))
+
+    # When
+    exported = generate_latest(REGISTRY).decode()
+
+    # Then
+    entries = len(service.response_cache)
+    assert f"grader_labextension_response_cache_entries {float(entries)}" in exported
+    assert "grader_labextension_response_cache_hits_total" in exported
+    assert "grader_labextension_response_cache_coalesced_total" in exported
+
+
+class _FakeUpstream:
+    """Replaces `RequestService._send`, GET requests wait until `release` is set."""
+
+    def __init__(self):
+        self.release = asyncio.Event()
+        self.version = 0
+        self.requests = []
+
+    async def send(self, request: HTTPRequest) -> HTTPResponse:
+        self.requests.append(request.method)
+        if request.method != "GET":
+            self.version += 1
+            return _response(request.url)
+        version = self.version
+        await self.release.wait()
+        return _response(request.url, f"v{version}".encode())
+
+
+def _service(upstream: _FakeUpstream) -> RequestService:
+    service = RequestService()
+    service._send = upstream.send
+    return service
+
+
+async def _until(condition: Callable[[], bool]):
+    for _ in range(100):
+        if condition():
+            return
+        await asyncio.sleep(0)
+    raise AssertionError("condition not reached")
+
+
+async def _get(service: RequestService, endpoint: str) -> bytes:
+    response = await service.request("GET", endpoint, header={}, decode_response=False)
+    return response.body
+
+
+async def test_concurrent_gets_share_one_request():
+    # Given
+    upstream = _FakeUpstream()
+    service = _service(upstream)
+    first = asyncio.ensure_future(_get(service, "/api/lectures/1"))
+    second = asyncio.ensure_future(_get(service, "/api/lectures/1"))
+    cancelled = asyncio.ensure_future(_get(service, "/api/lectures/1"))
+    await _until(lambda: service.coalesced_requests == 2)
+
+    # When
+    cancelled.cancel()
+    await asyncio.sleep(0)
+    upstream.release.set()
+
+    # Then
+    assert await first == await second == b"v0"
+    assert upstream.requests == ["GET"]
+    assert service.coalesced_requests == 2
+
+
+async def test_write_during_get_does_not_cache_stale_response():
+    # Given
+    upstream = _FakeUpstream()
+    service = _service(upstream)
+    stale = asyncio.ensure_future(_get(service, "/api/lectures/1/assignments"))
+    await _until(lambda: upstream.requests)
+
+    # When
+    await service.request("PUT", "/api/lectures/1/assignments/2", body={}, header={})
+    fresh = asyncio.ensure_future(_get(service, "/api/lectures/1/assignments"))
+    await _until(lambda: len(upstream.requests) == 3)
+    upstream.release.set()
+
+    # Then
+    assert await stale == b"v0"
+    # the GET after the write is not joined with the one started before it
+    assert await fresh == b"v1"
+    assert upstream.requests == ["GET", "PUT", "GET"]
+    key = ResponseCache.key("GET", service.url + "/api/lectures/1/assignments", {})
+    assert service.response_cache.get(key).body == b"v1"
+
+
+async def test_write_does_not_detach_unrelated_gets():
+    # Given
+    upstream = _FakeUpstream()
+    service = _service(upstream)
+    unrelated = asyncio.ensure_future(_get(service, "/api/lectures/2/assignments"))
+    await _until(lambda: upstream.requests)
+
+    # When
+    await service.request("PUT", "/api/lectures/1/assignments/2", body={}, header={})
+    joined = asyncio.ensure_future(_get(service, "/api/lectures/2/assignments"))
+    await _until(lambda: service.coalesced_requests == 1)
+    upstream.release.set()
+
+    # Then
+    assert await unrelated == await joined == b"v0"
+    assert upstream.requests == ["GET", "PUT"]
+    assert not service._in_flight
+
+
+async def test_download_follows_umask(tmp_path):
+    # Given
+    service = RequestService()
+
+    async def send(request: HTTPRequest) -> HTTPResponse:
+        request.streaming_callback(b"name,score\n")
+        request.streaming_callback(b"user,1\n")
+        return HTTPResponse(request, 200)
+
+    service._send = send
+    file_path = tmp_path / "grades.csv"
+
+    # When
+    written = await service.download("/api/lectures/1/submissions", str(file_path), header={})
+
+    # Then
+    assert written == 18
+    assert file_path.read_bytes() == b"name,score\nuser,1\n"
+    assert stat.S_IMODE(file_path.stat().st_mode) == 0o666 & ~request_service._UMASK
+    assert os.listdir(tmp_path) == ["grades.csv"]
+
+
+@pytest.mark.parametrize(
+    "error, code",
+    [
+        (HTTPError(503), 503),
+        (APIError(404, "not found"), 404),
+        (ConnectionRefusedError(), 502),
+        (TimeoutError(), 500),
+        (socket.gaierror("Name or service not known"), 500),
+    ],
+)
+async def test_failed_download_leaves_no_file(tmp_path, error, code):
+    # Given
+    service = RequestService()
+
+    async def send(request: HTTPRequest) -> HTTPResponse:
+        request.streaming_callback(b"partial")
+        raise error
+
+    service._send = send
+
+    # When
+    with pytest.raises(RequestServiceError) as e:
+        await service.download("/api/lectures/1/submissions", str(tmp_path / "a.csv"), header={})
+
+    # Then
+    assert e.value.code == code
+    assert os.listdir(tmp_path) == []
+
+
+async def test_cancelled_download_leaves_no_file(tmp_path):
+    # Given
+    service = RequestService()
+    started = asyncio.Event()
+
+    async def send(request: HTTPRequest) -> HTTPResponse:
+        request.streaming_callback(b"partial")
+        started.set()
+        await asyncio.Event().wait()
+
+    service._send = send
+    download = asyncio.ensure_future(
+        service.download("/api/lectures/1/submissions", str(tmp_path / "a.csv"), header={})
+    )
+    await started.wait()
+
+    # When
+    download.cancel()
+
+    # Then
+    with pytest.raises(asyncio.CancelledError):
+        await download
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,122 @@
+import asyncio
+import os
+from typing import Callable
+
+import pytest
+
+from grader_labextension.services.locks import RepoLock
+from grader_labextension.services.workspaces import ManualGradingWorkspaces
+
+
+async def _until(condition: Callable[[], bool]):
+    for _ in range(100):
+        if condition():
+            return
+        await asyncio.sleep(0)
+    raise AssertionError("condition not reached")
+
+
+@pytest.fixture
+def workspaces() -> ManualGradingWorkspaces:
+    return ManualGradingWorkspaces(disk_budget=1)
+
+
+def _workspace(root, sub_id: int, last_used: float) -> str:
+    path = ManualGradingWorkspaces.workspace_path(str(root), "lecture", 1, sub_id)
+    os.makedirs(path)
+    with open(os.path.join(path, "a.ipynb"), "wb") as f:
+        f.write(b"x" * 65536)
+    os.utime(path, (last_used, last_used))
+    return path
+
+
+async def test_release_evicts_least_recently_used_first(tmp_path, workspaces):
+    # Given
+    locked = _workspace(tmp_path, 1, 1000)
+    oldest = _workspace(tmp_path, 5, 1500)
+    older = _workspace(tmp_path, 2, 2000)
+    current = _workspace(tmp_path, 3, 2500)
+    newest = _workspace(tmp_path, 4, 4000)
+
+    # When
+    async with RepoLock.for_path(locked).shared():
+        evicted = await workspaces.release(str(tmp_path), current)
+
+    # Then
+    assert evicted == [oldest, older, newest]
+    assert sorted(workspaces.workspaces(str(tmp_path))) == sorted([locked, current])
+    assert os.path.getmtime(current) > 4000
+
+
+async def test_release_stops_within_budget(tmp_path, workspaces):
+    # Given
+    paths = [_workspace(tmp_path, sub_id, 1000 * sub_id) for sub_id in range(1, 5)]
+    size = workspaces._usage(str(tmp_path))[0][1]
+    workspaces.disk_budget = 2 * size
+
+    # When
+    evicted = await workspaces.release(str(tmp_path), paths[0])
+
+    # Then
+    assert evicted == paths[1:3]
+    assert sorted(workspaces.workspaces(str(tmp_path))) == [paths[0], paths[3]]
+
+
+async def test_release_without_budget_keeps_workspaces(tmp_path, workspaces):
+    # Given
+    workspaces.disk_budget = 0
+    paths = [_workspace(tmp_path, sub_id, 1000 * sub_id) for sub_id in range(1, 3)]
+
+    # When
+    evicted = await workspaces.release(str(tmp_path), paths[0])
+
+    # Then
+    assert evicted == []
+    assert sorted(workspaces.workspaces(str(tmp_path))) == paths
+
+
+async def test_prefetch_shares_running_task(workspaces):
+    # Given
+    release = asyncio.Event()
+    calls = []
+
+    async def prepare():
+        calls.append("prepare")
+        await release.wait()
+        return len(calls)
+
+    first = workspaces.prefetch("/workspace", prepare)
+
+    # When
+    second = workspaces.prefetch("/workspace", prepare)
+    release.set()
+
+    # Then
+    assert second is first
+    assert await first == 1
+    await asyncio.sleep(0)
+    # a finished prefetch is not reused
+    assert await workspaces.prefetch("/workspace", prepare) == 2
+
+
+async def test_prefetch_concurrency_is_limited(workspaces):
+    # Given
+    workspaces.prefetch_concurrency = 1
+    release = asyncio.Event()
+    started = []
+
+    async def prepare(name: str):
+        started.append(name)
+        await release.wait()
+
+    # When
+    first = workspaces.prefetch("/first", lambda: prepare("first"))
+    second = workspaces.prefetch("/second", lambda: prepare("second"))
+    await _until(lambda: started)
+    await asyncio.sleep(0.01)
+
+    # Then
+    assert started == ["first"]
+    release.set()
+    await asyncio.gather(first, second)
+    assert started == ["first", "second"]
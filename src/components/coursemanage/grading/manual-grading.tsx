@@ -23,7 +23,8 @@ import { GradeBook } from '../../../services/gradebook';
 import {
   autogradeSubmission,
   createManualFeedback,
-  generateFeedback
+  generateFeedback,
+  prefetchManualGrading
 } from '../../../services/grading.service';
 import { FilesList } from '../../util/file-list';
 import { enqueueSnackbar } from 'notistack';
@@ -48,6 +49,9 @@ import { ManualStatus } from '../../../model/manualStatus';
 import { FeedbackStatus } from '../../../model/feedbackStatus';
 import { AutoStatus } from '../../../model/autoStatus';
 
+// number of submissions after the current one whose files are pulled in advance
+const PREFETCH_COUNT = 3;
+
 const style = {
   position: 'absolute' as const,
   top: '50%',
@@ -150,6 +154,33 @@ export const ManualGrading = () => {
   // state to store files for manual grading
   const [manualFiles, setManualFiles] = React.useState<any[]>([]);
 
+  // submissions whose files have already been requested in advance
+  const prefetched = React.useRef(new Set<number>());
+  // the submissions following the current one, derived from the current rows
+  const nextSubmissionIds = rows
+    .slice(rowIdx + 1, rowIdx + 1 + PREFETCH_COUNT)
+    .map(s => s.id);
+  const nextSubmissionsKey = nextSubmissionIds.join(',');
+
+  React.useEffect(() => {
+    const submissionIds = nextSubmissionIds.filter(
+      id => !prefetched.current.has(id)
+    );
+    if (submissionIds.length === 0) {
+      return;
+    }
+    submissionIds.forEach(id => prefetched.current.add(id));
+    prefetchManualGrading(lecture, assignment, submissionIds, progress => {
+      if (progress.status === 'failed') {
+        // try again with the next prefetch
+        prefetched.current.delete(progress.submission_id);
+      }
+    }).catch(err => {
+      console.warn('Could not prefetch submissions', err);
+      submissionIds.forEach(id => prefetched.current.delete(id));
+    });
+  }, [nextSubmissionsKey, lecture.id, assignment.id]);
+
   React.useEffect(() => {
     refetchSubmission().then(async response => {
       setSubmissionScaling(response.data.score_scaling);
@@ -878,7 +878,7 @@ export const ExportGradesForLectureDialog = ({
 }: IExportDialogProps) => {
   const [openDialog, setOpenDialog] = React.useState(false);
   const [filter, setFilter] = React.useState<'latest' | 'best'>('best');
-  const [format, setFormat] = React.useState<'json' | 'csv'>('json');
+  const [format, setFormat] = React.useState<'json' | 'ndjson' | 'csv'>('json');
   const [loading, setLoading] = React.useState(false);
 
   const handleExport = async () => {
@@ -893,6 +893,10 @@ export const ExportGradesForLectureDialog = ({
         enqueueSnackbar('CSV export completed successfully!', {
           variant: 'success'
         });
+      } else if (format === 'ndjson') {
+        enqueueSnackbar('NDJSON export completed successfully!', {
+          variant: 'success'
+        });
       } else {
         enqueueSnackbar('JSON export completed successfully!', {
           variant: 'success'
@@ -950,17 +954,20 @@ export const ExportGradesForLectureDialog = ({
             color="textSecondary"
             sx={{ fontSize: '0.875rem', mt: 2 }}
           >
-            Choose the format of the export file. You can either export grades
-            in CSV or JSON file.
+            Choose the format of the export file. You can export grades in a
+            CSV, JSON or NDJSON file.
           </Typography>
           <FormControl fullWidth margin="normal">
             <InputLabel>Format</InputLabel>
             <Select
               value={format}
-              onChange={e => setFormat(e.target.value as 'json' | 'csv')}
+              onChange={e =>
+                setFormat(e.target.value as 'json' | 'ndjson' | 'csv')
+              }
               label="Format"
             >
               <MenuItem value="json">JSON</MenuItem>
+              <MenuItem value="ndjson">NDJSON (one student per line)</MenuItem>
               <MenuItem value="csv">CSV</MenuItem>
             </Select>
           </FormControl>
@@ -16,7 +16,8 @@ import DangerousIcon from '@mui/icons-material/Dangerous';
 import {
   File,
   getRelativePath,
-  getRemoteFileStatus
+  getRemoteFilesStatus,
+  IRemoteFilesStatus
 } from '../../services/file.service';
 import { Lecture } from '../../model/lecture';
 import { Assignment } from '../../model/assignment';
@@ -55,16 +56,21 @@ const FileItem = ({
 
   const [isSelected, setIsSelected] = React.useState(true);
 
-  const fileStatusQueryOptions: UseQueryOptions<RemoteFileStatus, Error> = {
-    queryKey: ['fileStatus', lecture?.id, assignment?.id, file.path],
+  // all file items of an assignment share this query, so the status of every file
+  // is fetched with a single request
+  const fileStatusQueryOptions: UseQueryOptions<
+    IRemoteFilesStatus,
+    Error,
+    RemoteFileStatus
+  > = {
+    queryKey: ['filesStatus', lecture?.id, assignment?.id],
     queryFn: () =>
-      getRemoteFileStatus(
-        lecture,
-        assignment,
-        RepoType.SOURCE,
-        getRelativePath(file.path, 'source'),
-        true
-      ) as Promise<RemoteFileStatus>,
+      getRemoteFilesStatus(lecture, assignment, RepoType.SOURCE, true),
+    select: data => ({
+      status:
+        data.files[getRelativePath(file.path, 'source')] ??
+        RemoteFileStatus.StatusEnum.UpToDate
+    }),
     enabled: checkStatus && !!lecture && !!assignment, // Enable only if checkStatus is true
     staleTime: 3000
   };
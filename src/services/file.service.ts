@@ -216,3 +216,18 @@ export function getRemoteFileStatus(
   const url = `/api/lectures/${lecture.id}/assignments/${assignment.id}/remote-file-status/${repo}/?file=${encodeURIComponent(filePath)}`;
   return request<RemoteFileStatus>(HTTPMethod.GET, url, null, reload);
 }
+
+export interface IRemoteFilesStatus {
+  // status of every file that is not up to date, by its path relative to the repository
+  files: { [path: string]: RemoteFileStatus.StatusEnum };
+}
+
+export function getRemoteFilesStatus(
+  lecture: Lecture,
+  assignment: Assignment,
+  repo: RepoType,
+  reload = false
+): Promise<IRemoteFilesStatus> {
+  const url = `/api/lectures/${lecture.id}/assignments/${assignment.id}/remote-files-status/${repo}/`;
+  return request<IRemoteFilesStatus>(HTTPMethod.GET, url, null, reload);
+}
@@ -7,7 +7,7 @@
 import { Lecture } from '../model/lecture';
 import { Assignment } from '../model/assignment';
 import { User } from '../model/user';
-import { request, HTTPMethod } from './request.service';
+import { request, requestStream, HTTPMethod } from './request.service';
 import { Submission } from '../model/submission';
 
 export function createManualFeedback(
@@ -22,6 +22,28 @@ export function createManualFeedback(
   );
 }
 
+export interface PrefetchProgress {
+  submission_id: number;
+  status: 'pulled' | 'reused' | 'existing' | 'failed';
+  error?: string;
+  completed: number;
+  total: number;
+}
+
+export function prefetchManualGrading(
+  lecture: Lecture,
+  assignment: Assignment,
+  submissionIds: number[],
+  onProgress: (progress: PrefetchProgress) => void = () => {}
+): Promise<void> {
+  return requestStream<PrefetchProgress>(
+    HTTPMethod.POST,
+    `/api/lectures/${lecture.id}/assignments/${assignment.id}/grading/prefetch`,
+    { submission_ids: submissionIds },
+    onProgress
+  );
+}
+
 export function saveSubmissions(
   lecture: Lecture,
   assignment: Assignment,
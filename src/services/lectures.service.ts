@@ -62,7 +62,7 @@ export function getUsers(
 export async function getAllLectureSubmissions(
   lectureId: number,
   filter: 'latest' | 'best' = 'best',
-  format: 'json' | 'csv' = 'csv'
+  format: 'json' | 'ndjson' | 'csv' = 'csv'
 ): Promise<any> {
   const url = `/api/lectures/${lectureId}/submissions?filter=${filter}&format=${format}`;
   return request<any>(HTTPMethod.GET, url, null);
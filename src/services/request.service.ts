@@ -6,6 +6,7 @@
 
 import { URLExt } from '@jupyterlab/coreutils';
 import { ServerConnection } from '@jupyterlab/services';
+import { loadBoolean } from './storage.service';
 
 export enum HTTPMethod {
   GET = 'GET',
@@ -56,6 +57,16 @@ export function request<T, B = any | null>(
     async response => {
       const method = options.method || 'GET';  // assuming `method` is part of options.
       
+      // enable with localStorage.setItem('grader:log-server-timing', 'true')
+      if (loadBoolean('log-server-timing')) {
+        const serverTiming = response.headers.get('Server-Timing');
+        if (serverTiming) {
+          console.debug(
+            `Server-Timing ${method} ${requestUrl}: ${serverTiming}`
+          );
+        }
+      }
+
       // handle non-OK responses
       if (!response.ok) {
         const errorText = await response.text();
@@ -89,3 +100,55 @@ export function request<T, B = any | null>(
     }
   );
 }
+
+/**
+ * Sends a request to an endpoint that streams one JSON object per line and
+ * calls `onItem` for every object as soon as it arrives.
+ */
+export async function requestStream<T, B = any | null>(
+  method: HTTPMethod,
+  endPoint: string,
+  body: B,
+  onItem: (item: T) => void
+): Promise<void> {
+  const options: RequestInit = { method, cache: 'no-store' };
+  if (body) {
+    options.body = JSON.stringify(body);
+  }
+  const settings = ServerConnection.makeSettings();
+  const requestUrl = URLExt.join(
+    settings.baseUrl,
+    '/grader_labextension', // API Namespace
+    endPoint
+  );
+
+  const response = await ServerConnection.makeRequest(
+    requestUrl,
+    options,
+    settings
+  );
+  if (!response.ok) {
+    throw new HTTPError(response.status, response.statusText);
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  for (;;) {
+    const { done, value } = await reader.read();
+    buffer += decoder.decode(value, { stream: !done });
+    const lines = buffer.split('\n');
+    buffer = lines.pop();
+    for (const line of lines) {
+      if (line.trim().length > 0) {
+        onItem(JSON.parse(line));
+      }
+    }
+    if (done) {
+      break;
+    }
+  }
+  if (buffer.trim().length > 0) {
+    onItem(JSON.parse(buffer));
+  }
+}